@@ -0,0 +1,24 @@
+"""
+Hilfsmodule zur raumzeitlichen Analyse der COVID-19-Daten des RKI.
+
+Die Module bilden die Datenvorbereitung des Notebooks als Arrays nach. Alle
+Berechnungen laufen auf einem Cube mit einem Eintrag pro Landkreis, Tag und
+Kennzahl; höhere Ebenen (Bundesland, Deutschland) werden daraus abgeleitet.
+
+Die Module *gis* (arcgis, arcpy) und *diagramme* (matplotlib) werden erst beim
+ersten Zugriff geladen, z.B. über covid_analyse.gis.
+"""
+
+import importlib
+
+from covid_analyse.cube import Cube, METRIKEN
+from covid_analyse.hierarchie import Hierarchie
+
+
+_VERZOEGERT = ('gis', 'diagramme')
+
+
+def __getattr__(name):
+    if name in _VERZOEGERT:
+        return importlib.import_module('covid_analyse.' + name)
+    raise AttributeError('module %r has no attribute %r' % (__name__, name))
@@ -0,0 +1,6 @@
+"""Aufruf als python -m covid_analyse, siehe *pipeline*."""
+
+from covid_analyse.pipeline import main
+
+
+raise SystemExit(main())
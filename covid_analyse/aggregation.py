@@ -0,0 +1,101 @@
+"""
+Aggregation der RKI-Falldaten nach Landkreis und Tag.
+
+Ersetzt das groupby aus In[17]. In einem Durchlauf über die Falldaten werden
+die Zahlen sowohl nach Meldedatum als auch nach Refdatum (Erkrankungsbeginn)
+aufsummiert und in einem gemeinsamen Cube abgelegt, sodass jede Auswertung die
+Zeitachse ohne erneuten Import wechseln kann.
+
+Mit *aggregieren_merkmale()* bleiben zusätzlich Altersgruppe und Geschlecht
+als dünn besetzte Achsen erhalten; *aggregieren_duenn()* speichert nur die
+gemeldeten Landkreis-Tage (siehe *duenn*).
+"""
+
+import numpy
+from scipy import sparse
+
+from covid_analyse.cube import Cube, METRIKEN, kreis_index, kreise_aus_ewz
+from covid_analyse.datum import tagesliste, tagesnummern
+from covid_analyse.duenn import DuennerCube
+from covid_analyse.merkmale import ALTERSGRUPPEN, GESCHLECHTER, MerkmalsCube, kategorien
+
+
+ZEITACHSEN = ('Meldedatum', 'Refdatum')
+
+
+def aggregieren(data_df, kreise_ewz, zeitachsen=ZEITACHSEN, metriken=METRIKEN):
+    """
+    Baut aus den Falldaten (In[11]) den Landkreis-Cube mit allen Zeitachsen.
+
+    Die Tagesliste reicht vom frühesten bis zum spätesten Datum über alle
+    Zeitachsen, damit Meldedatum und Refdatum denselben Index teilen.
+    """
+    ids, ewz = kreise_aus_ewz(kreise_ewz)
+    kreis = kreis_index(ids, data_df['IdLandkreis'])
+
+    tage = [tagesnummern(data_df[achse]) for achse in zeitachsen]
+    erster = min(t.min() for t in tage)
+    dates = tagesliste(erster, max(t.max() for t in tage))
+
+    # Ein flacher Index (Zeitachse, Landkreis, Tag) pro Fall und Zeitachse
+    n, t = len(ids), len(dates)
+    flach = numpy.concatenate([
+        (a * n + kreis) * t + (tag - erster)
+        for a, tag in enumerate(tage)])
+
+    werte = numpy.empty((len(zeitachsen) * n * t, len(metriken)), dtype=numpy.int64)
+    for m, metrik in enumerate(metriken):
+        gewichte = numpy.tile(data_df[metrik].to_numpy(), len(zeitachsen))
+        werte[:, m] = numpy.bincount(flach, weights=gewichte, minlength=len(werte))
+    return Cube(ids, dates, werte.reshape(len(zeitachsen), n, t, len(metriken)), ewz, metriken,
+                zeitachsen=zeitachsen)
+
+
+def _csr_matrizen(data_df, zeile, zeilen, zeitachsen, metriken):
+    """
+    Tagesliste und dünn besetzte Matrizen (*zeilen*, Tage) pro (Zeitachse,
+    Metrik), in denen jeder Fall in Zeile *zeile* aufsummiert wird.
+    """
+    tage = [tagesnummern(data_df[achse]) for achse in zeitachsen]
+    erster = min(t.min() for t in tage)
+    dates = tagesliste(erster, max(t.max() for t in tage))
+    form = (zeilen, len(dates))
+
+    matrizen = {}
+    for achse, tag in zip(zeitachsen, tage):
+        spalte = tag - erster
+        for metrik in metriken:
+            # Doppelte Einträge werden beim Umwandeln in CSR aufsummiert
+            matrix = sparse.coo_matrix((data_df[metrik].to_numpy(), (zeile, spalte)), shape=form).tocsr()
+            matrix.eliminate_zeros()
+            matrizen[(achse, metrik)] = matrix
+    return dates, matrizen
+
+
+def aggregieren_merkmale(data_df, kreise_ewz, zeitachsen=ZEITACHSEN, metriken=METRIKEN):
+    """
+    Wie *aggregieren()*, aber zusätzlich nach Altersgruppe und Geschlecht.
+
+    Liefert einen dünn besetzten MerkmalsCube. Die Summe über Altersgruppen und
+    Geschlechter (*als_cube()*) entspricht dem Ergebnis von *aggregieren()*.
+    """
+    ids, ewz = kreise_aus_ewz(kreise_ewz)
+    kreis = kreis_index(ids, data_df['IdLandkreis'])
+    alter, altersgruppen = kategorien(data_df['Altersgruppe'], ALTERSGRUPPEN)
+    geschlecht, geschlechter = kategorien(data_df['Geschlecht'], GESCHLECHTER)
+    zeile = (kreis * len(altersgruppen) + alter) * len(geschlechter) + geschlecht
+    dates, matrizen = _csr_matrizen(data_df, zeile, len(ids) * len(altersgruppen) * len(geschlechter),
+                                    zeitachsen, metriken)
+    return MerkmalsCube(ids, dates, ewz, matrizen, altersgruppen, geschlechter, metriken, zeitachsen)
+
+
+def aggregieren_duenn(data_df, kreise_ewz, zeitachsen=ZEITACHSEN, metriken=METRIKEN):
+    """
+    Wie *aggregieren()*, aber als DuennerCube ohne Einträge für Tage ohne Meldung.
+
+    *als_cube()* des Ergebnisses entspricht dem Ergebnis von *aggregieren()*.
+    """
+    ids, ewz = kreise_aus_ewz(kreise_ewz)
+    kreis = kreis_index(ids, data_df['IdLandkreis'])
+    dates, matrizen = _csr_matrizen(data_df, kreis, len(ids), zeitachsen, metriken)
+    return DuennerCube(ids, dates, ewz, matrizen, metriken, zeitachsen=zeitachsen)
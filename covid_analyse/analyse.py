@@ -0,0 +1,276 @@
+"""
+Lokale Implementierungen der Musteranalysen ohne ArcGIS.
+
+Die Funktionen rechnen direkt auf Arrays und einer dünn besetzten
+Nachbarschaftsmatrix (siehe *nachbarschaft*). Spalten eines Arrays
+(Landkreise, Tage) werden dabei gemeinsam ausgewertet, sodass z.B. die Hot
+Spots aller Tage eines Zeitraums in einem Matrixprodukt entstehen.
+
+- *gi_stern()* entspricht der Hot-Spot-Analyse (Getis-Ord Gi*) aus
+  arcgis.features.analyze_patterns.find_hot_spots()
+- *lokales_moran()* entspricht der Ausreißer-Analyse (Anselin Local Moran's I)
+  aus arcgis.features.analyze_patterns.find_outliers()
+- *emerging_hotspots()* entspricht der Emerging Hot Spot Analysis
+  (arcpy.stpm.EmergingHotSpotAnalysis) auf einem Space-Time Cube
+- *zeitreihen_clustering()* entspricht dem Time Series Clustering nach Wert
+  (arcpy.stpm.TimeSeriesClustering mit "VALUE")
+"""
+
+import numpy
+from scipy import sparse
+from scipy.special import ndtr
+
+
+def p_wert(z):
+    """Zweiseitiger p-Wert der Standardnormalverteilung."""
+    return 2 * ndtr(-numpy.abs(z))
+
+
+def konfidenz_bin(z, p=None):
+    """
+    Klassen -3 bis 3 wie 'Gi_Bin' in ArcGIS.
+
+    ±3: 99 %, ±2: 95 %, ±1: 90 % Konfidenz, 0: nicht signifikant.
+    """
+    p = p_wert(z) if p is None else p
+    stufe = numpy.select([p <= 0.01, p <= 0.05, p <= 0.10], [3, 2, 1], 0)
+    return (numpy.sign(z) * stufe).astype(numpy.int8)
+
+
+def gi_stern(werte, gewichte):
+    """
+    Getis-Ord Gi* für jede Spalte von *werte* (Landkreise, ...).
+
+    *gewichte* ist eine binäre Nachbarschaftsmatrix ohne Diagonale; der
+    Landkreis selbst wird für Gi* ergänzt. Liefert z-Scores in der Form von
+    *werte*.
+    """
+    x = numpy.asarray(werte, dtype=float)
+    eindim = x.ndim == 1
+    if eindim:
+        x = x[:, None]
+    n = x.shape[0]
+    w = (sparse.csr_matrix(gewichte) + sparse.identity(n, format='csr')).tocsr()
+
+    mittel = x.mean(axis=0)
+    s = numpy.sqrt((x ** 2).mean(axis=0) - mittel ** 2)
+    w_summe = numpy.asarray(w.sum(axis=1)).ravel()
+    w_quadrat = numpy.asarray(w.multiply(w).sum(axis=1)).ravel()
+
+    zaehler = w @ x - numpy.outer(w_summe, mittel)
+    nenner = numpy.sqrt((n * w_quadrat - w_summe ** 2) / (n - 1))
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        z = zaehler / (nenner[:, None] * s[None, :])
+    z[:, s == 0] = 0.0
+    return z[:, 0] if eindim else z
+
+
+def lokales_moran(werte, gewichte, signifikanz=0.05):
+    """
+    Anselin Local Moran's I für jede Spalte von *werte* (Landkreise, ...).
+
+    *gewichte* wird zeilennormiert. Erwartungswert und Varianz folgen der
+    Randomisierungsannahme (Anselin 1995). Liefert (I, z-Score, p-Wert, Typ);
+    der Typ ist wie 'COType' in ArcGIS 'HH', 'LL', 'HL', 'LH' oder '' für
+    nicht signifikante Landkreise.
+    """
+    x = numpy.asarray(werte, dtype=float)
+    eindim = x.ndim == 1
+    if eindim:
+        x = x[:, None]
+    n = x.shape[0]
+    w = sparse.csr_matrix(gewichte, dtype=float)
+    w_summe = numpy.asarray(w.sum(axis=1)).ravel()
+    with numpy.errstate(divide='ignore'):
+        w = (sparse.diags(numpy.where(w_summe > 0, 1 / w_summe, 0.0)) @ w).tocsr()
+
+    abw = x - x.mean(axis=0)
+    m2 = (abw ** 2).mean(axis=0)
+    b2 = (abw ** 4).mean(axis=0) / m2 ** 2
+    wi = numpy.asarray(w.sum(axis=1)).ravel()[:, None]
+    wi2 = numpy.asarray(w.multiply(w).sum(axis=1)).ravel()[:, None]
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        moran = abw / m2 * (w @ abw)
+        erwartung = -wi / (n - 1)
+        varianz = (wi2 * (n - b2) / (n - 1) + (wi ** 2 - wi2) * (2 * b2 - n) / ((n - 1) * (n - 2))
+                   - erwartung ** 2)
+        z = (moran - erwartung) / numpy.sqrt(varianz)
+    z[~numpy.isfinite(z)] = 0.0
+    moran[~numpy.isfinite(moran)] = 0.0
+    p = p_wert(z)
+
+    hoch = abw > 0
+    typ = numpy.select([moran > 0, moran < 0], [numpy.where(hoch, 'HH', 'LL'), numpy.where(hoch, 'HL', 'LH')], '')
+    typ[p > signifikanz] = ''
+    if eindim:
+        return moran[:, 0], z[:, 0], p[:, 0], typ[:, 0]
+    return moran, z, p, typ
+
+
+def mann_kendall(reihen):
+    """
+    Mann-Kendall-Trendtest für jede Zeile von *reihen* (Orte, Zeitschritte).
+
+    Liefert (z-Score, p-Wert); positive z-Scores bedeuten einen steigenden
+    Verlauf. Bindungen werden nicht korrigiert.
+    """
+    x = numpy.asarray(reihen, dtype=float)
+    t = x.shape[1]
+    if t < 3:
+        return numpy.zeros(len(x)), numpy.ones(len(x))
+    i, j = numpy.triu_indices(t, 1)
+    s = numpy.sign(x[:, j] - x[:, i]).sum(axis=1)
+    varianz = t * (t - 1) * (2 * t + 5) / 18
+    z = (s - numpy.sign(s)) / numpy.sqrt(varianz)
+    return z, p_wert(z)
+
+
+# Werte von 'CATEGORY' und 'PATTERN' der Emerging Hot Spot Analysis; Cold Spots negativ
+MUSTER = {0: 'No Pattern Detected', 1: 'New Hot Spot', 2: 'Consecutive Hot Spot', 3: 'Intensifying Hot Spot',
+          4: 'Persistent Hot Spot', 5: 'Diminishing Hot Spot', 6: 'Sporadic Hot Spot', 7: 'Oscillating Hot Spot',
+          8: 'Historical Hot Spot', -1: 'New Cold Spot', -2: 'Consecutive Cold Spot', -3: 'Intensifying Cold Spot',
+          -4: 'Persistent Cold Spot', -5: 'Diminishing Cold Spot', -6: 'Sporadic Cold Spot',
+          -7: 'Oscillating Cold Spot', -8: 'Historical Cold Spot'}
+
+
+def raumzeit_gi_stern(werte, gewichte, zeitschritte=1):
+    """
+    Getis-Ord Gi* jedes Bins eines Space-Time Cubes (Orte, Zeitschritte).
+
+    Nachbarn eines Bins sind der Ort selbst und seine räumlichen Nachbarn im
+    selben und in den *zeitschritte* vorherigen Zeitschritten; Mittelwert und
+    Streuung beziehen sich wie in ArcGIS auf alle Bins des Cubes.
+    """
+    x = numpy.asarray(werte, dtype=float)
+    orte, t = x.shape
+    n = x.size
+    w = (sparse.csr_matrix(gewichte) + sparse.identity(orte, format='csr')).tocsr()
+    raeumlich = w @ x
+    summe = numpy.zeros_like(raeumlich)
+    schritte = numpy.zeros(t)
+    for versatz in range(zeitschritte + 1):
+        summe[:, versatz:] += raeumlich[:, :t - versatz]
+        schritte[versatz:] += 1
+    # Binäre Gewichte: Summe und Quadratsumme sind gleich
+    w_summe = numpy.asarray(w.sum(axis=1)).ravel()[:, None] * schritte[None, :]
+
+    mittel = x.mean()
+    s = numpy.sqrt((x ** 2).mean() - mittel ** 2)
+    if s == 0:
+        return numpy.zeros_like(x)
+    nenner = s * numpy.sqrt((n * w_summe - w_summe ** 2) / (n - 1))
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        z = (summe - mittel * w_summe) / nenner
+    z[~numpy.isfinite(z)] = 0.0
+    return z
+
+
+def emerging_hotspots(werte, gewichte, zeitschritte=1, signifikanz=0.05):
+    """
+    Muster der Emerging Hot Spot Analysis für jeden Ort eines Space-Time Cubes.
+
+    Grundlage sind die Gi*-z-Scores aller Bins (*raumzeit_gi_stern()*) und ein
+    Mann-Kendall-Test auf deren Verlauf. Die Einordnung folgt den Definitionen
+    von ArcGIS (New, Consecutive, Intensifying, Persistent, Diminishing,
+    Sporadic, Oscillating, Historical; 90 % der Zeitschritte als Schwelle).
+    Liefert (Kategorie wie 'CATEGORY', Trend-z-Score, Trend-p-Wert).
+    """
+    z = raumzeit_gi_stern(werte, gewichte, zeitschritte)
+    signifikant = p_wert(z) <= signifikanz
+    trend_z, trend_p = mann_kendall(z)
+    t = z.shape[1]
+
+    muster, letzter = {}, {}
+    for vorzeichen in (1, -1):
+        spot = signifikant & (vorzeichen * z > 0)
+        gegen = signifikant & (vorzeichen * z < 0)
+        anzahl = spot.sum(axis=1)
+        letzter[vorzeichen] = spot[:, -1]
+        haeufig = anzahl >= 0.9 * t
+        # Länge der ununterbrochenen Folge am Ende
+        luecke = ~spot[:, ::-1]
+        lauf = numpy.where(luecke.any(axis=1), luecke.argmax(axis=1), t)
+        steigend = (trend_p <= signifikanz) & (vorzeichen * trend_z > 0)
+        fallend = (trend_p <= signifikanz) & (vorzeichen * trend_z < 0)
+        ende = letzter[vorzeichen]
+        muster[vorzeichen] = vorzeichen * numpy.select(
+            [ende & (anzahl == 1),
+             ende & (lauf >= 2) & (anzahl == lauf) & ~haeufig,
+             ende & haeufig & steigend,
+             ende & haeufig & fallend,
+             ende & haeufig,
+             ende & gegen.any(axis=1),
+             ende,
+             haeufig],
+            [1, 2, 3, 5, 4, 7, 6, 8], 0)
+    # Der letzte Zeitschritt entscheidet, ob ein Ort als Hot oder Cold Spot gilt
+    kategorie = numpy.where(letzter[-1], muster[-1], numpy.where(muster[1] != 0, muster[1], muster[-1]))
+    kategorie = kategorie.astype(numpy.int8)
+    return kategorie, trend_z, trend_p
+
+
+def _kmeans(daten, k, rng, iterationen):
+    # k-means++ Startpunkte
+    zentren = [daten[rng.integers(len(daten))]]
+    abstand = ((daten - zentren[0]) ** 2).sum(axis=1)
+    for _ in range(1, k):
+        summe = abstand.sum()
+        neu = daten[rng.choice(len(daten), p=abstand / summe)] if summe > 0 else daten[rng.integers(len(daten))]
+        zentren.append(neu)
+        abstand = numpy.minimum(abstand, ((daten - neu) ** 2).sum(axis=1))
+    zentren = numpy.array(zentren)
+
+    labels = numpy.zeros(len(daten), dtype=numpy.intp)
+    for _ in range(iterationen):
+        abstaende = ((daten ** 2).sum(axis=1)[:, None] - 2 * daten @ zentren.T + (zentren ** 2).sum(axis=1)[None])
+        neue_labels = abstaende.argmin(axis=1)
+        if _ and numpy.array_equal(neue_labels, labels):
+            break
+        labels = neue_labels
+        anzahl = numpy.bincount(labels, minlength=k)
+        summe = numpy.zeros_like(zentren)
+        numpy.add.at(summe, labels, daten)
+        leer = anzahl == 0
+        zentren[~leer] = summe[~leer] / anzahl[~leer, None]
+    innen = ((daten - zentren[labels]) ** 2).sum()
+    return labels, zentren, innen
+
+
+def pseudo_f(daten, labels, k):
+    """Calinski-Harabasz-Pseudo-F, mit dem ArcGIS die Clusterzahl wählt."""
+    n = len(daten)
+    if k < 2 or k >= n:
+        return 0.0
+    gesamt = ((daten - daten.mean(axis=0)) ** 2).sum()
+    innen = sum(((daten[labels == c] - daten[labels == c].mean(axis=0)) ** 2).sum()
+                for c in range(k) if (labels == c).any())
+    if innen == 0:
+        return numpy.inf
+    return ((gesamt - innen) / (k - 1)) / (innen / (n - k))
+
+
+def zeitreihen_clustering(reihen, k=None, seed=0, versuche=10, iterationen=100, k_max=10):
+    """
+    k-Means-Clustering von Zeitreihen (Landkreise, Zeitschritte) nach Wert.
+
+    Ohne *k* wird wie in ArcGIS die Clusterzahl zwischen 2 und *k_max* mit dem
+    höchsten Pseudo-F gewählt. Die Cluster werden nach mittlerem Wert sortiert
+    nummeriert (1 = niedrigster Verlauf), damit Ergebnisse reproduzierbar
+    vergleichbar sind. Liefert (Cluster-ID pro Landkreis, Zentren).
+    """
+    daten = numpy.asarray(reihen, dtype=float)
+    rng = numpy.random.default_rng(seed)
+    kandidaten = [k] if k else range(2, min(k_max, len(daten) - 1) + 1)
+
+    bestes = None
+    for anzahl in kandidaten:
+        lauf = min((_kmeans(daten, anzahl, rng, iterationen) for _ in range(versuche)), key=lambda e: e[2])
+        guete = pseudo_f(daten, lauf[0], anzahl) if not k else 0.0
+        if bestes is None or guete > bestes[0]:
+            bestes = (guete, lauf)
+    labels, zentren, _ = bestes[1]
+
+    reihenfolge = numpy.argsort(zentren.mean(axis=1))
+    umbenennung = numpy.empty_like(reihenfolge)
+    umbenennung[reihenfolge] = numpy.arange(len(reihenfolge))
+    return umbenennung[labels] + 1, zentren[reihenfolge]
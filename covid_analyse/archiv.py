@@ -0,0 +1,201 @@
+"""
+Archiv der täglichen RKI-Datenstände.
+
+Jeder Download von RKI_COVID19 ersetzt den vorherigen, obwohl das RKI ältere
+Fälle laufend nachmeldet oder korrigiert. Das Archiv legt pro Datenstand den
+aggregierten Landkreis-Cube ab, allerdings nur in regelmäßigen Abständen
+vollständig (Keyframe). Dazwischen werden nur die Differenzen zum vorherigen
+Datenstand als dünn besetzte Liste (Position, Änderung) gespeichert.
+
+Ein Datenstand wird rekonstruiert, indem der letzte Keyframe davor geladen und
+die folgenden Differenzen addiert werden. Der zuletzt rekonstruierte Stand
+wird vorgehalten, sodass Abfragen in zeitlicher Reihenfolge nur eine Differenz
+pro Schritt anwenden.
+"""
+
+import json
+import os
+
+import numpy
+import pandas as pd
+
+from covid_analyse import tracing
+from covid_analyse.cube import Cube
+from covid_analyse.datum import als_datum, tag
+
+
+INDEX_DATEI = 'archiv.json'
+
+
+def datenstand(wert):
+    """
+    Datenstand als Tagesdatum.
+
+    Akzeptiert das RKI-Format '20.01.2022, 00:00 Uhr', ISO-Strings, Timestamps,
+    Tagesnummern (wie aus *csv_lesen()*) sowie die Spalte 'Datenstand' eines
+    Dataframes (muss eindeutig sein).
+    """
+    if isinstance(wert, pd.Series):
+        werte = wert.unique()
+        if len(werte) != 1:
+            raise ValueError('Die Daten enthalten %d verschiedene Datenstände' % len(werte))
+        wert = werte[0]
+    if isinstance(wert, str):
+        return als_datum([tag(wert)])[0]
+    if isinstance(wert, (int, numpy.integer)):
+        return als_datum([wert])[0]
+    return pd.Timestamp(wert).normalize()
+
+
+def _einbetten(werte, start_alt, start_neu, tage_neu):
+    """Legt die Werte eines Datenstands auf die Tagesliste eines anderen."""
+    verschiebung = (start_alt - start_neu).days
+    ergebnis = numpy.zeros(werte.shape[:2] + (tage_neu,) + werte.shape[3:], dtype=werte.dtype)
+    von, bis = max(0, verschiebung), min(tage_neu, verschiebung + werte.shape[2])
+    if von < bis:
+        ergebnis[:, :, von:bis] = werte[:, :, von - verschiebung:bis - verschiebung]
+    return ergebnis
+
+
+def _kleinster_int(werte):
+    """Kleinster Ganzzahltyp, der alle Differenzen aufnehmen kann."""
+    if not len(werte):
+        return werte.astype(numpy.int8)
+    for dtype in (numpy.int8, numpy.int16, numpy.int32):
+        info = numpy.iinfo(dtype)
+        if werte.min() >= info.min and werte.max() <= info.max:
+            return werte.astype(dtype)
+    return werte
+
+
+class Archiv:
+    """
+    Verzeichnis mit Datenständen als Keyframes und Differenzen.
+
+    pfad                -- Verzeichnis des Archivs, wird bei Bedarf angelegt
+    keyframe_intervall  -- spätestens nach so vielen Datenständen wird wieder
+                           ein vollständiger Stand abgelegt
+    """
+
+    def __init__(self, pfad, keyframe_intervall=14):
+        self.pfad = pfad
+        self.keyframe_intervall = keyframe_intervall
+        os.makedirs(pfad, exist_ok=True)
+        index = os.path.join(pfad, INDEX_DATEI)
+        if os.path.exists(index):
+            with open(index, encoding='utf-8') as f:
+                self._eintraege = json.load(f)
+        else:
+            self._eintraege = []
+        self._zuletzt = None
+
+    def __len__(self):
+        return len(self._eintraege)
+
+    def __repr__(self):
+        keys = sum(e['typ'] == 'key' for e in self._eintraege)
+        return '<Archiv %s: %d Datenstände, %d Keyframes>' % (self.pfad, len(self), keys)
+
+    @property
+    def datenstaende(self):
+        return pd.DatetimeIndex([e['datenstand'] for e in self._eintraege])
+
+    def _index_schreiben(self):
+        tmp = os.path.join(self.pfad, INDEX_DATEI + '.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self._eintraege, f, indent=1)
+        os.replace(tmp, os.path.join(self.pfad, INDEX_DATEI))
+
+    def hinzufuegen(self, cube, stand):
+        """
+        Legt den Landkreis-Cube eines Datenstands ab.
+
+        Die Datenstände müssen in zeitlicher Reihenfolge hinzugefügt werden.
+        Ändern sich Landkreise, Kennzahlen oder Zeitachsen, wird automatisch
+        ein Keyframe geschrieben.
+        """
+        stand = datenstand(stand)
+        if self._eintraege and stand <= pd.Timestamp(self._eintraege[-1]['datenstand']):
+            raise ValueError('Datenstand %s ist nicht neuer als %s' % (stand.date(), self._eintraege[-1]['datenstand']))
+        name = stand.strftime('%Y-%m-%d')
+
+        keyframe = True
+        if self._eintraege:
+            seit_key = len(self._eintraege) - max(i for i, e in enumerate(self._eintraege) if e['typ'] == 'key')
+            vorher = self.stand(self._eintraege[-1]['datenstand'])
+            keyframe = (seit_key >= self.keyframe_intervall
+                        or not numpy.array_equal(vorher.ids, cube.ids)
+                        or vorher.metriken != cube.metriken
+                        or vorher.zeitachsen != cube.zeitachsen)
+
+        with tracing.spanne('archiv.hinzufuegen', 'io', datenstand=name, keyframe=keyframe) as spanne:
+            if keyframe:
+                datei = name + '.key.npz'
+                cube.speichern(os.path.join(self.pfad, datei))
+            else:
+                datei = name + '.delta.npz'
+                alt = _einbetten(vorher.alle_werte, vorher.dates[0], cube.dates[0], len(cube.dates))
+                differenz = (cube.alle_werte - alt).ravel()
+                position = numpy.flatnonzero(differenz)
+                numpy.savez_compressed(
+                    os.path.join(self.pfad, datei), start=cube.dates[0].value, tage=len(cube.dates), ewz=cube.ewz,
+                    position=position.astype(numpy.uint32 if differenz.size < 2 ** 32 else numpy.int64),
+                    differenz=_kleinster_int(differenz[position]))
+            spanne.zeilen(cube.alle_werte.size, cube.alle_werte.size if keyframe else len(position))
+            spanne.bytes(os.path.getsize(os.path.join(self.pfad, datei)))
+
+        self._eintraege.append({'datenstand': name, 'typ': 'key' if keyframe else 'delta', 'datei': datei})
+        self._index_schreiben()
+        self._zuletzt = (len(self._eintraege) - 1, Cube(cube.ids, cube.dates, cube.alle_werte.copy(), cube.ewz,
+                                                        cube.metriken, cube.ebene, cube.zeitachsen))
+
+    def _position(self, stand):
+        stand = datenstand(stand)
+        position = self.datenstaende.searchsorted(stand, side='right') - 1
+        if position < 0:
+            raise KeyError('Kein Datenstand vor %s im Archiv' % stand.date())
+        return position
+
+    def stand(self, stand):
+        """
+        Landkreis-Cube, wie er zum angegebenen Datum vorlag.
+
+        Liefert den letzten archivierten Datenstand am oder vor *stand*.
+        """
+        ziel = self._position(stand)
+        key = max(i for i in range(ziel + 1) if self._eintraege[i]['typ'] == 'key')
+
+        # Vom vorgehaltenen Stand weiterrechnen, falls er zwischen Keyframe und Ziel liegt
+        if self._zuletzt is not None and key <= self._zuletzt[0] <= ziel:
+            position, cube = self._zuletzt
+        else:
+            position, cube = key, Cube.laden(os.path.join(self.pfad, self._eintraege[key]['datei']))
+
+        for eintrag in self._eintraege[position + 1:ziel + 1]:
+            with numpy.load(os.path.join(self.pfad, eintrag['datei'])) as npz:
+                start = pd.Timestamp(int(npz['start']))
+                dates = pd.date_range(start=start, periods=int(npz['tage']), freq='D')
+                werte = _einbetten(cube.alle_werte, cube.dates[0], start, len(dates))
+                flach = werte.reshape(-1)
+                flach[npz['position']] += npz['differenz']
+                cube = Cube(cube.ids, dates, werte, npz['ewz'], cube.metriken, cube.ebene, cube.zeitachsen)
+
+        self._zuletzt = (ziel, cube)
+        return cube
+
+    def verlauf(self, ags, tag, metrik='AnzahlFall', zeitachse=None):
+        """
+        Wert eines Landkreises an einem Tag über alle Datenstände.
+
+        Zeigt, wie sich z.B. die Fallzahl eines Meldedatums durch Nachmeldungen
+        verändert hat.
+        """
+        tag = pd.Timestamp(tag)
+        werte = []
+        for stand in self.datenstaende:
+            cube = self.stand(stand)
+            if zeitachse:
+                cube = cube.mit_zeitachse(zeitachse)
+            i = (tag - cube.dates[0]).days
+            werte.append(cube.metrik(metrik)[cube.index(ags), i] if 0 <= i < len(cube.dates) else 0)
+        return pd.Series(werte, index=self.datenstaende, name=metrik)
@@ -0,0 +1,91 @@
+"""
+Globales Moran's I als Zeitreihe über alle Tage.
+
+Das Notebook misst die räumliche Häufung nur an den Hochpunkten der Wellen
+(In[61]-In[80]). Hier entsteht Moran's I mit Erwartungswert, Varianz
+(Randomisierungsannahme, wie Spatial Autocorrelation in ArcGIS) und z-Score
+für jede Spalte eines Arrays (Landkreise, Tage) zugleich: Der Zähler aller
+Tage ist ein einziges Produkt der dünn besetzten Gewichtsmatrix mit den
+Abweichungen vom Tagesmittel.
+
+Die Terme, die nur von den Gewichten abhängen (S0, S1, S2 und die daraus
+gebildeten Teile der Varianz), berechnet *Autokorrelation* einmal beim
+Anlegen; jeder weitere Aufruf kostet nur noch das Produkt und einige
+Spaltensummen.
+
+    moran = Autokorrelation(gewichte).moran(feld['werte'])
+    moran.z[-1]
+"""
+
+from collections import namedtuple
+
+import numpy
+from scipy import sparse
+
+from covid_analyse.analyse import p_wert
+from covid_analyse.nachbarschaft import zeilennormiert
+
+
+Moran = namedtuple('Moran', ['i', 'erwartung', 'varianz', 'z', 'p'])
+
+
+class Autokorrelation:
+    """
+    Globales Moran's I für eine feste Gewichtsmatrix.
+
+    *gewichte* ist eine Nachbarschaftsmatrix wie aus *nachbarschaft.queen()*;
+    mit *normieren* (Standard, wie 'ROW' in ArcGIS) wird jede Zeile auf
+    Summe 1 gebracht.
+    """
+
+    def __init__(self, gewichte, normieren=True):
+        w = sparse.csr_matrix(gewichte, dtype=float)
+        if normieren:
+            w = zeilennormiert(w)
+        self.gewichte = w
+        n = self.n = w.shape[0]
+        if n < 4:
+            raise ValueError('Moran\'s I benötigt mindestens 4 Einheiten')
+        symmetrisch = w + w.T
+        self.s0 = w.sum()
+        self.s1 = symmetrisch.multiply(symmetrisch).sum() / 2
+        self.s2 = ((numpy.asarray(w.sum(axis=1)).ravel() + numpy.asarray(w.sum(axis=0)).ravel()) ** 2).sum()
+        # Var(I) = (a - b2 * b) / c - E(I)^2 mit der Kurtosis b2 der Werte
+        self.erwartung = -1 / (n - 1)
+        self._a = n * ((n * n - 3 * n + 3) * self.s1 - n * self.s2 + 3 * self.s0 ** 2)
+        self._b = (n * n - n) * self.s1 - 2 * n * self.s2 + 6 * self.s0 ** 2
+        self._c = (n - 1) * (n - 2) * (n - 3) * self.s0 ** 2
+
+    def __repr__(self):
+        return '<Autokorrelation: %d Einheiten, S0=%g, S1=%g, S2=%g>' % (self.n, self.s0, self.s1, self.s2)
+
+    def moran(self, werte):
+        """
+        Moran's I jeder Spalte von *werte* (Einheiten, ...).
+
+        Liefert Moran(i, erwartung, varianz, z, p) mit Arrays in der Form der
+        Spalten. Für konstante Spalten sind I und z 0.
+        """
+        x = numpy.asarray(werte, dtype=float)
+        if x.shape[0] != self.n:
+            raise ValueError('%d Zeilen, aber %d Einheiten in der Gewichtsmatrix' % (x.shape[0], self.n))
+        form = x.shape[1:]
+        abw = x.reshape(self.n, -1)
+        abw = abw - abw.mean(axis=0)
+        m2 = (abw ** 2).sum(axis=0)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            i = self.n / self.s0 * (abw * (self.gewichte @ abw)).sum(axis=0) / m2
+            b2 = self.n * (abw ** 4).sum(axis=0) / m2 ** 2
+            varianz = (self._a - b2 * self._b) / self._c - self.erwartung ** 2
+            z = (i - self.erwartung) / numpy.sqrt(varianz)
+        konstant = m2 == 0
+        i[konstant] = 0.0
+        z[konstant | ~numpy.isfinite(z)] = 0.0
+        varianz[konstant] = numpy.nan
+        return Moran(i.reshape(form), numpy.full(form, self.erwartung), varianz.reshape(form), z.reshape(form),
+                     p_wert(z).reshape(form))
+
+
+def globales_moran(werte, gewichte, normieren=True):
+    """Moran's I jeder Spalte von *werte* für eine einmalige Auswertung."""
+    return Autokorrelation(gewichte, normieren).moran(werte)
@@ -0,0 +1,496 @@
+"""
+Austauschbare Implementierungen der Musteranalysen und Paritätsprüfung.
+
+Das Notebook ruft Hot-Spot- und Ausreißer-Analyse über
+arcgis.features.analyze_patterns (In[61]-In[75]) und Space-Time Cube,
+Emerging Hot Spots und Clustering über arcpy.stpm (In[80]-In[167]) auf. Hier
+hat jede Analyseart eine feste Schnittstelle, die von mehreren Backends
+bedient werden kann:
+
+    hotspot(ids, werte, gewichte, kreise_df, name)       -> AGS, GiZScore, GiPValue, Gi_Bin
+    ausreisser(ids, werte, gewichte, kreise_df, name)    -> AGS, LMiIndex, LMiZScore, LMiPValue, COType
+    cube(ids, dates, werte, intervall, kreise_df, name)  -> {'ids', 'enden', 'werte'}
+    emerging(stc, gewichte, kreise_df, name)             -> AGS, CATEGORY, PATTERN
+    clustering(stc, kreise_df, name, seed)               -> AGS, CLUSTER_ID
+
+*ids* und die Zeilen von *werte* und *gewichte* sind nach AGS sortiert wie im
+Cube; *kreise_df* (AGS, SHAPE) wird nur von ArcGIS benötigt. Das Backend wird
+pro Art über cfg['backends'] gewählt (Standard 'lokal'):
+
+    backends.ausfuehren('hotspot', {'backends': {'hotspot': 'arcgis'}}, ids, werte, w)
+
+Die Paritätsprüfung zeichnet Eingaben und Ergebnisse eines Backends als
+Fixture (npz) auf und prüft ein anderes Backend dagegen: z-Scores innerhalb
+einer Toleranz, Anteil übereinstimmender Klassen und für Cluster den
+Adjusted Rand Index, da die Nummerierung der Cluster beliebig ist.
+
+    python -m covid_analyse.backends aufzeichnen fixtures --backend arcgis --synthetisch 0.05
+    python -m covid_analyse.backends pruefen fixtures --backend lokal
+"""
+
+import argparse
+import json
+import os
+from collections import OrderedDict
+
+import numpy
+import pandas as pd
+from scipy import sparse
+
+from covid_analyse import analyse, tracing
+from covid_analyse.datum import tagesnummern
+from covid_analyse.wellen import WELLEN_NOTEBOOK, peak_tag, zeitbins_mittel
+
+
+ARTEN = ('hotspot', 'ausreisser', 'cube', 'emerging', 'clustering')
+
+STANDARD = 'lokal'
+
+_REGISTER = OrderedDict()
+
+
+def backend(art, name):
+    """Dekorator, der eine Funktion als Backend *name* für *art* registriert."""
+    if art not in ARTEN:
+        raise ValueError('Unbekannte Analyseart %s' % art)
+
+    def dekorator(funktion):
+        _REGISTER[art, name] = funktion
+        return funktion
+    return dekorator
+
+
+def verfuegbar(art=None):
+    """Namen der registrierten Backends, für *art* oder für alle Arten."""
+    return [name for (a, name) in _REGISTER if art is None or a == art]
+
+
+def waehlen(art, cfg=None):
+    """Backend-Funktion für *art* laut cfg['backends'] ({art: name} oder ein Name für alle)."""
+    auswahl = (cfg or {}).get('backends') or {}
+    name = auswahl if isinstance(auswahl, str) else auswahl.get(art, STANDARD)
+    if (art, name) not in _REGISTER:
+        raise KeyError('Kein Backend %s für %s (verfügbar: %s)' % (name, art, ', '.join(verfuegbar(art))))
+    return _REGISTER[art, name]
+
+
+def ausfuehren(art, cfg, *args, **kwargs):
+    """Führt *art* mit dem in *cfg* gewählten Backend aus."""
+    funktion = waehlen(art, cfg)
+    with tracing.spanne(art, 'analyse', backend=_name(funktion)):
+        return funktion(*args, **kwargs)
+
+
+def _name(funktion):
+    return next(name for (_, name), f in _REGISTER.items() if f is funktion)
+
+
+# Lokale Implementierungen (analyse)
+
+@backend('hotspot', 'lokal')
+def hotspot_lokal(ids, werte, gewichte, kreise_df=None, name='hotspot'):
+    z = analyse.gi_stern(werte, gewichte)
+    return pd.DataFrame({'AGS': ids, 'GiZScore': z, 'GiPValue': analyse.p_wert(z), 'Gi_Bin': analyse.konfidenz_bin(z)})
+
+
+@backend('ausreisser', 'lokal')
+def ausreisser_lokal(ids, werte, gewichte, kreise_df=None, name='ausreisser'):
+    moran, z, p, typ = analyse.lokales_moran(werte, gewichte)
+    return pd.DataFrame({'AGS': ids, 'LMiIndex': moran, 'LMiZScore': z, 'LMiPValue': p, 'COType': typ})
+
+
+@backend('cube', 'lokal')
+def cube_lokal(ids, dates, werte, intervall, kreise_df=None, name='stc'):
+    werte = zeitbins_mittel(numpy.asarray(werte, dtype=float), intervall)
+    enden = pd.DatetimeIndex(dates)[::-1][::intervall][:werte.shape[1]][::-1]
+    return {'ids': numpy.asarray(ids), 'enden': enden, 'werte': werte}
+
+
+@backend('emerging', 'lokal')
+def emerging_lokal(stc, gewichte, kreise_df=None, name='emerg'):
+    kategorie, _, _ = analyse.emerging_hotspots(stc['werte'], gewichte)
+    return pd.DataFrame({'AGS': stc['ids'], 'CATEGORY': kategorie,
+                         'PATTERN': [analyse.MUSTER[k] for k in kategorie]})
+
+
+@backend('clustering', 'lokal')
+def clustering_lokal(stc, kreise_df=None, name='clust', seed=0):
+    cluster, _ = analyse.zeitreihen_clustering(stc['werte'], seed=seed)
+    return pd.DataFrame({'AGS': stc['ids'], 'CLUSTER_ID': cluster})
+
+
+# ArcGIS (arcgis.features.analyze_patterns und arcpy.stpm, nur mit ArcGIS-Umgebung)
+
+def _geometrien(kreise_df, ids, **spalten):
+    """Spatially-enabled Dataframe der Landkreise in der Reihenfolge von *ids*."""
+    if kreise_df is None or 'SHAPE' not in kreise_df:
+        raise ValueError('Das ArcGIS-Backend benötigt kreise_df mit SHAPE')
+    from covid_analyse import gis
+    geometrie = gis._modul('arcgis.geometry')
+    sdf = kreise_df.set_index('AGS').loc[list(ids), ['SHAPE']].reset_index()
+    sdf['SHAPE'] = [geometrie.Geometry(json.loads(s) if isinstance(s, str) else s) for s in sdf['SHAPE']]
+    sdf['AGS_int'] = sdf['AGS'].astype(int)
+    for name, werte in spalten.items():
+        sdf[name] = werte
+    sdf.spatial.set_geometry('SHAPE')
+    return sdf
+
+
+def _nach_ags(df, ids, spalten):
+    """Ergebnis eines ArcGIS-Werkzeugs in der Reihenfolge von *ids*."""
+    schluessel = next((s for s in ('AGS', 'AGS_int', 'AGS_INT', 'LOCATION_ID') if s in df), None)
+    if schluessel is None:
+        raise KeyError('Ergebnis enthält keine Landkreis-Kennung: %s' % ', '.join(df.columns))
+    ags = pd.Series([('%05d' % int(a)) for a in df[schluessel]], index=df.index)
+    ergebnis = df.assign(AGS=ags).drop_duplicates('AGS').set_index('AGS').reindex(list(ids))
+    return ergebnis[spalten].reset_index()
+
+
+def _analyse_layer(werte, ids, kreise_df, name):
+    from covid_analyse import gis
+    return gis.hochladen(_geometrien(kreise_df, ids, faelle_ewz_7=werte), 'Eingabe_' + name)
+
+
+@backend('hotspot', 'arcgis')
+def hotspot_arcgis(ids, werte, gewichte, kreise_df=None, name='HotSpot'):
+    from covid_analyse import gis
+    muster = gis._modul('arcgis.features.analyze_patterns')
+    for item in gis.verbindung().content.search(query=name):
+        item.delete()
+    with tracing.spanne('find_hot_spots', 'fern'):
+        layer = muster.find_hot_spots(_analyse_layer(werte, ids, kreise_df, name), analysis_field='faelle_ewz_7',
+                                      output_name=name, distance_band=None, distance_band_unit=None)
+        df = layer.layers[0].query(out_fields='*', return_geometry=False).sdf
+    return _nach_ags(df, ids, ['GiZScore', 'GiPValue', 'Gi_Bin'])
+
+
+@backend('ausreisser', 'arcgis')
+def ausreisser_arcgis(ids, werte, gewichte, kreise_df=None, name='Outliers'):
+    from covid_analyse import gis
+    muster = gis._modul('arcgis.features.analyze_patterns')
+    for item in gis.verbindung().content.search(query=name):
+        item.delete()
+    with tracing.spanne('find_outliers', 'fern'):
+        ergebnis = muster.find_outliers(_analyse_layer(werte, ids, kreise_df, name), analysis_field='faelle_ewz_7',
+                                        output_name=name)
+        df = ergebnis['outliers_result_layer'].layers[0].query(out_fields='*', return_geometry=False).sdf
+    df = _nach_ags(df, ids, ['LMiIndex', 'LMiZScore', 'LMiPValue', 'COType'])
+    df['COType'] = df['COType'].fillna('').astype(str).str.strip()
+    return df
+
+
+def _stc_erzeugen(ids, enden, werte, intervall, kreise_df, name, aggregation):
+    """Space-Time Cube (.nc) wie In[81]-In[91] aus Werten (Landkreise, Zeitpunkte)."""
+    from covid_analyse import gis
+    arcpy = gis._modul('arcpy')
+    gdb = gis.workspace()
+    home = os.path.dirname(gdb)
+    geom = os.path.join(gdb, 'kreise_geom')
+    if not arcpy.Exists(geom):
+        _geometrien(kreise_df, ids).spatial.to_featureclass(geom)
+    tabelle = pd.DataFrame({'IdLandkreis': numpy.repeat(numpy.asarray(ids).astype(int), len(enden)),
+                            'meldedatum': numpy.tile(pd.DatetimeIndex(enden), len(ids)),
+                            'FaelleEWZ_7': numpy.asarray(werte, dtype=float).ravel()})
+    pfad_tabelle = os.path.join(gdb, 'data_' + name)
+    arcpy.management.Delete(pfad_tabelle)
+    tabelle.spatial.to_table(pfad_tabelle)
+    nc = os.path.join(home, name + '.nc')
+    arcpy.management.Delete(nc)
+    schritt = '%d Days' % intervall
+    with tracing.spanne('CreateSpaceTimeCubeDefinedLocations', 'fern'):
+        if aggregation:
+            arcpy.stpm.CreateSpaceTimeCubeDefinedLocations(
+                geom, nc, 'AGS_int', 'APPLY_TEMPORAL_AGGREGATION', 'meldedatum', schritt, 'END_TIME', '', '',
+                'FaelleEWZ_7 MEAN ZEROS', pfad_tabelle, 'IdLandkreis')
+        else:
+            arcpy.stpm.CreateSpaceTimeCubeDefinedLocations(
+                geom, nc, 'AGS_int', 'NO_TEMPORAL_AGGREGATION', 'meldedatum', schritt, '', '',
+                'FaelleEWZ_7 ZEROS', '', pfad_tabelle, 'IdLandkreis')
+    return nc, 'FAELLEEWZ_7_MEAN_ZEROS' if aggregation else 'FAELLEEWZ_7_NONE_ZEROS'
+
+
+def _featureclass(pfad):
+    from covid_analyse import gis
+    gis._modul('arcgis.features')
+    return pd.DataFrame.spatial.from_featureclass(pfad)
+
+
+def _nc(stc, kreise_df, name):
+    """Cube-Datei zu *stc*; lokal berechnete Cubes werden ohne weitere Aggregation übernommen."""
+    if 'nc' in stc:
+        return stc['nc'], stc['variable']
+    intervall = int((stc['enden'][1] - stc['enden'][0]).days) if len(stc['enden']) > 1 else 1
+    return _stc_erzeugen(stc['ids'], stc['enden'], stc['werte'], intervall, kreise_df, 'stc_' + name, False)
+
+
+@backend('cube', 'arcgis')
+def cube_arcgis(ids, dates, werte, intervall, kreise_df=None, name='stc'):
+    """Wie In[81]-In[91]; die Werte der Bins werden über VisualizeSpaceTimeCube3D ('VALUE') gelesen."""
+    from covid_analyse import gis
+    arcpy = gis._modul('arcpy')
+    nc, variable = _stc_erzeugen(ids, dates, werte, intervall, kreise_df, name, True)
+    ausgabe = os.path.join(gis.workspace(), 'vis_' + name)
+    arcpy.management.Delete(ausgabe)
+    arcpy.stpm.VisualizeSpaceTimeCube3D(nc, variable, 'VALUE', ausgabe)
+    bins = _featureclass(ausgabe)
+    bins['AGS'] = ['%05d' % int(a) for a in bins['AGS_INT' if 'AGS_INT' in bins else 'AGS_int']]
+    tabelle = bins.pivot_table(index='AGS', columns='END_DATE', values='VALUE').reindex(list(ids))
+    return {'ids': numpy.asarray(ids), 'enden': pd.DatetimeIndex(tabelle.columns).normalize(),
+            'werte': tabelle.to_numpy(dtype=float), 'nc': nc, 'variable': variable}
+
+
+@backend('emerging', 'arcgis')
+def emerging_arcgis(stc, gewichte, kreise_df=None, name='emerg'):
+    from covid_analyse import gis
+    arcpy = gis._modul('arcpy')
+    nc, variable = _nc(stc, kreise_df, name)
+    ausgabe = os.path.join(gis.workspace(), name)
+    arcpy.management.Delete(ausgabe)
+    with tracing.spanne('EmergingHotSpotAnalysis', 'fern'):
+        arcpy.stpm.EmergingHotSpotAnalysis(nc, variable, ausgabe)
+    df = _nach_ags(_featureclass(ausgabe), stc['ids'], ['CATEGORY', 'PATTERN'])
+    df['CATEGORY'] = df['CATEGORY'].fillna(0).astype(numpy.int8)
+    return df
+
+
+@backend('clustering', 'arcgis')
+def clustering_arcgis(stc, kreise_df=None, name='clust', seed=0):
+    from covid_analyse import gis
+    arcpy = gis._modul('arcpy')
+    nc, variable = _nc(stc, kreise_df, name)
+    ausgabe = os.path.join(gis.workspace(), name)
+    arcpy.management.Delete(ausgabe)
+    with tracing.spanne('TimeSeriesClustering', 'fern'):
+        arcpy.stpm.TimeSeriesClustering(nc, variable, ausgabe, 'VALUE', '', '', '', 'CREATE_POPUP')
+    return _nach_ags(_featureclass(ausgabe), stc['ids'], ['CLUSTER_ID'])
+
+
+# Paritätsprüfung
+
+# Grenzwerte pro Art: größte absolute Abweichung der Zahlen, Mindestanteil gleicher Klassen,
+# Mindestwert des Adjusted Rand Index
+TOLERANZ = {
+    'hotspot': {'GiZScore': 1e-3, 'Gi_Bin': 0.98},
+    'ausreisser': {'LMiIndex': 1e-3, 'LMiZScore': 1e-3, 'COType': 0.95},
+    'cube': {'werte': 1e-6},
+    'emerging': {'CATEGORY': 0.9},
+    'clustering': {'CLUSTER_ID': 0.8},
+}
+
+# Spalten, die als Klassen (Anteil gleicher Werte) bzw. als Partition (Adjusted Rand Index) verglichen werden
+_KLASSEN = ('Gi_Bin', 'COType', 'CATEGORY')
+_PARTITIONEN = ('CLUSTER_ID',)
+
+
+def adjusted_rand(a, b):
+    """Adjusted Rand Index zweier Partitionen; 1 bei gleicher Aufteilung unabhängig von der Nummerierung."""
+    _, a = numpy.unique(a, return_inverse=True)
+    _, b = numpy.unique(b, return_inverse=True)
+    tabelle = sparse.coo_matrix((numpy.ones(len(a)), (a, b))).toarray()
+
+    def paare(x):
+        return (x * (x - 1) / 2).sum()
+    gesamt = paare(tabelle)
+    zeilen, spalten = paare(tabelle.sum(axis=1)), paare(tabelle.sum(axis=0))
+    erwartet = zeilen * spalten / paare(numpy.array([len(a)]))
+    maximum = (zeilen + spalten) / 2
+    if maximum == erwartet:
+        return 1.0
+    return (gesamt - erwartet) / (maximum - erwartet)
+
+
+def _gewichte_speichern(w):
+    w = sparse.csr_matrix(w)
+    return {'w_data': w.data, 'w_indices': w.indices, 'w_indptr': w.indptr, 'w_shape': numpy.array(w.shape)}
+
+
+def _ohne_objekte(werte):
+    werte = numpy.asarray(werte)
+    return werte.astype(str) if werte.dtype == object else werte
+
+
+def fixture_speichern(pfad, art, backend_name, eingaben, ergebnis):
+    """
+    Legt Eingaben und Ergebnis eines Backends als Fixture ab.
+
+    *eingaben* ist ein Dict mit ids, werte, gewichte, dates, intervall,
+    stc (für emerging/clustering) und optional kreise_df.
+    """
+    daten = {'art': numpy.array(art), 'backend': numpy.array(backend_name)}
+    for schluessel, wert in eingaben.items():
+        if wert is None:
+            continue
+        if schluessel == 'gewichte':
+            daten.update(_gewichte_speichern(wert))
+        elif schluessel == 'kreise_df':
+            daten['kreise_ags'] = wert['AGS'].to_numpy(dtype=str)
+            if 'SHAPE' in wert:
+                daten['kreise_shape'] = numpy.array([s if isinstance(s, str) else json.dumps(dict(s))
+                                                     for s in wert['SHAPE']])
+        elif schluessel == 'stc':
+            daten.update({'stc_ids': _ohne_objekte(wert['ids']), 'stc_enden': tagesnummern(wert['enden']),
+                          'stc_werte': wert['werte']})
+        elif schluessel == 'dates':
+            daten['dates'] = tagesnummern(wert)
+        else:
+            daten[schluessel] = _ohne_objekte(wert)
+    if isinstance(ergebnis, dict):
+        daten.update({'aus_werte': ergebnis['werte'], 'aus_enden': tagesnummern(ergebnis['enden'])})
+    else:
+        for spalte in ergebnis.columns:
+            daten['aus_' + spalte] = _ohne_objekte(ergebnis[spalte])
+    numpy.savez_compressed(pfad, **daten)
+
+
+def _fixture_laden(pfad):
+    with numpy.load(pfad) as npz:
+        daten = {k: npz[k] for k in npz.files}
+    eingaben = {}
+    if 'w_data' in daten:
+        eingaben['gewichte'] = sparse.csr_matrix((daten['w_data'], daten['w_indices'], daten['w_indptr']),
+                                                 shape=tuple(daten['w_shape']))
+    if 'kreise_ags' in daten:
+        eingaben['kreise_df'] = pd.DataFrame({'AGS': daten['kreise_ags']})
+        if 'kreise_shape' in daten:
+            eingaben['kreise_df']['SHAPE'] = daten['kreise_shape']
+    if 'stc_ids' in daten:
+        enden = pd.DatetimeIndex(daten['stc_enden'].astype('datetime64[D]'))
+        eingaben['stc'] = {'ids': daten['stc_ids'], 'enden': enden, 'werte': daten['stc_werte']}
+    for schluessel in ('ids', 'werte', 'intervall', 'name', 'seed'):
+        if schluessel in daten:
+            eingaben[schluessel] = daten[schluessel].item() if daten[schluessel].ndim == 0 else daten[schluessel]
+    if 'dates' in daten:
+        eingaben['dates'] = pd.DatetimeIndex(daten['dates'].astype('datetime64[D]'))
+    erwartet = {k[4:]: v for k, v in daten.items() if k.startswith('aus_')}
+    return str(daten['art']), str(daten['backend']), eingaben, erwartet
+
+
+def _aufruf(art, funktion, eingaben):
+    e = eingaben
+    if art in ('hotspot', 'ausreisser'):
+        return funktion(e['ids'], e['werte'], e['gewichte'], e.get('kreise_df'), e.get('name', art))
+    if art == 'cube':
+        return funktion(e['ids'], e['dates'], e['werte'], int(e['intervall']), e.get('kreise_df'), e.get('name', art))
+    if art == 'emerging':
+        return funktion(e['stc'], e['gewichte'], e.get('kreise_df'), e.get('name', art))
+    return funktion(e['stc'], e.get('kreise_df'), e.get('name', art), int(e.get('seed', 0)))
+
+
+def pruefen(pfad, backend_name=STANDARD, toleranz=None):
+    """
+    Prüft *backend_name* gegen eine Fixture.
+
+    Liefert eine Tabelle mit einer Zeile pro verglichener Größe: Abweichung
+    (größte absolute Differenz, Anteil gleicher Klassen bzw. Adjusted Rand
+    Index), Grenze und ob sie eingehalten wird.
+    """
+    art, quelle, eingaben, erwartet = _fixture_laden(pfad)
+    grenzen = dict(TOLERANZ[art], **((toleranz or {}).get(art, {})))
+    ergebnis = _aufruf(art, _REGISTER[art, backend_name], eingaben)
+    if isinstance(ergebnis, dict):
+        ergebnis = {'werte': ergebnis['werte']}
+    zeilen = []
+    for groesse, grenze in grenzen.items():
+        ist, soll = numpy.asarray(ergebnis[groesse]), erwartet[groesse]
+        if ist.shape != soll.shape:
+            zeilen.append((art, groesse, 'Form', numpy.nan, grenze, False))
+        elif groesse in _PARTITIONEN:
+            wert = adjusted_rand(ist, soll)
+            zeilen.append((art, groesse, 'ARI', wert, grenze, wert >= grenze))
+        elif groesse in _KLASSEN:
+            wert = float((ist.astype(str) == soll.astype(str)).mean())
+            zeilen.append((art, groesse, 'Anteil gleich', wert, grenze, wert >= grenze))
+        else:
+            wert = float(numpy.nanmax(numpy.abs(ist.astype(float) - soll.astype(float)))) if ist.size else 0.0
+            zeilen.append((art, groesse, 'max. Abweichung', wert, grenze, wert <= grenze))
+    return pd.DataFrame(zeilen, columns=['art', 'groesse', 'mass', 'wert', 'grenze', 'ok']).assign(
+        fixture=os.path.basename(pfad), referenz=quelle, backend=backend_name)
+
+
+def fixtures_aufzeichnen(verzeichnis, kreis_cube, gewichte, kreise_df=None, cfg=None, wellen=WELLEN_NOTEBOOK,
+                         seed=0):
+    """
+    Zeichnet für jede Welle alle Analysearten mit den in *cfg* gewählten
+    Backends auf. Eingaben sind die 7-Tage-Inzidenzen der Fälle wie in der Pipeline.
+    """
+    os.makedirs(verzeichnis, exist_ok=True)
+    inzidenz = kreis_cube.inzidenz()[:, :, kreis_cube.metriken.index('AnzahlFall')]
+    ids = kreis_cube.ids
+    pfade = []
+
+    def aufzeichnen(art, name, eingaben):
+        eingaben = dict(eingaben, kreise_df=kreise_df, name=name)
+        ergebnis = _aufruf(art, waehlen(art, cfg), eingaben)
+        pfad = os.path.join(verzeichnis, '%s.npz' % name)
+        fixture_speichern(pfad, art, _name(waehlen(art, cfg)), eingaben, ergebnis)
+        pfade.append(pfad)
+        return ergebnis
+
+    for welle in wellen:
+        peak = inzidenz[:, peak_tag(welle, kreis_cube.dates)]
+        aufzeichnen('hotspot', 'hotspot_%s' % welle.name, {'ids': ids, 'werte': peak, 'gewichte': gewichte})
+        aufzeichnen('ausreisser', 'ausreisser_%s' % welle.name, {'ids': ids, 'werte': peak, 'gewichte': gewichte})
+        auswahl = (kreis_cube.dates >= welle.start) & (kreis_cube.dates <= welle.ende)
+        stc = aufzeichnen('cube', 'stc_%s' % welle.name, {'ids': ids, 'dates': kreis_cube.dates[auswahl],
+                                                          'werte': inzidenz[:, auswahl], 'intervall': welle.intervall})
+        aufzeichnen('emerging', 'emerg_%s' % welle.name, {'stc': stc, 'gewichte': gewichte})
+        aufzeichnen('clustering', 'clust_%s' % welle.name, {'stc': stc, 'seed': seed})
+    return pfade
+
+
+def aus_argumenten(werte):
+    """'--backend arcgis' oder '--backend hotspot=arcgis cube=lokal' als cfg['backends']."""
+    if not werte:
+        return None
+    if len(werte) == 1 and '=' not in werte[0]:
+        return werte[0]
+    return dict(w.split('=', 1) for w in werte)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Fixtures aufzeichnen und Backends auf Parität prüfen')
+    parser.add_argument('aktion', choices=('aufzeichnen', 'pruefen', 'liste'))
+    parser.add_argument('verzeichnis', nargs='?', default='fixtures')
+    parser.add_argument('--backend', nargs='+', help='Name für alle Arten oder art=name')
+    parser.add_argument('--cube', help='Landkreis-Cube (cube.npz aus der Pipeline) statt synthetischer Daten')
+    parser.add_argument('--kreise', help='Landkreise als CSV mit AGS und SHAPE (nötig für ArcGIS)')
+    parser.add_argument('--synthetisch', type=float, default=0.05)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.aktion == 'liste':
+        for art in ARTEN:
+            print('%-12s %s' % (art, ', '.join(verfuegbar(art))))
+        return 0
+
+    if args.aktion == 'aufzeichnen':
+        from covid_analyse import pipeline
+        cfg = {'seed': args.seed, 'synthetisch': args.synthetisch, 'backends': aus_argumenten(args.backend)}
+        if args.kreise:
+            cfg['kreise'] = os.path.abspath(args.kreise)
+        kreise_df = pipeline.kreise_sortiert(pipeline.kreise(cfg))
+        if args.cube:
+            from covid_analyse.cube import Cube
+            kreis_cube = Cube.laden(args.cube)
+        else:
+            from covid_analyse.aggregation import aggregieren
+            from covid_analyse import synthetisch
+            kreis_cube = aggregieren(synthetisch.falldaten(kreise_df, args.synthetisch, args.seed),
+                                     kreise_df[['AGS', 'EWZ', 'EWZ_BL']])
+        gewichte = pipeline.gewichte(cfg, kreise_df)
+        for pfad in fixtures_aufzeichnen(args.verzeichnis, kreis_cube, gewichte, kreise_df, cfg, seed=args.seed):
+            print(pfad)
+        return 0
+
+    backend_name = aus_argumenten(args.backend) or STANDARD
+    if not isinstance(backend_name, str):
+        parser.error('pruefen erwartet genau einen Backend-Namen')
+    pfade = sorted(os.path.join(args.verzeichnis, d) for d in os.listdir(args.verzeichnis) if d.endswith('.npz'))
+    bericht = pd.concat([pruefen(p, backend_name) for p in pfade], ignore_index=True)
+    with pd.option_context('display.width', 160, 'display.max_rows', None):
+        print(bericht[['fixture', 'groesse', 'mass', 'wert', 'grenze', 'ok']].to_string(index=False))
+    return 0 if bericht['ok'].all() else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,190 @@
+"""
+Laufzeit- und Speichermessung aller Stufen auf synthetischen Daten.
+
+Die Stufen entsprechen den Abschnitten des Notebooks: Import (In[11]),
+Aggregation (In[17]), Inzidenzberechnung (In[24]-In[32]), Joins (In[22],
+In[38]), Space Time Cubes (In[81]-In[91]), Hot Spots (In[61]-In[67]),
+Time Series Clustering (In[161]-In[167]) und Export (In[35]). Gemessen werden
+Wand- und CPU-Zeit sowie in einem eigenen Durchlauf die Spitze des mit
+tracemalloc erfassten Speichers, da tracemalloc selbst die Laufzeit verfälscht.
+
+Aufruf:
+    python -m covid_analyse.benchmark --faktor 1 5 20 --verzeichnis /tmp/bench
+"""
+
+import argparse
+import os
+import time
+import tracemalloc
+from collections import OrderedDict
+
+import pandas as pd
+
+from covid_analyse import analyse, nachbarschaft, synthetisch, tracing
+from covid_analyse.aggregation import aggregieren
+from covid_analyse.datum import csv_lesen
+from covid_analyse.hierarchie import Hierarchie
+from covid_analyse.wellen import WELLEN_NOTEBOOK, zeitbins_mittel
+
+
+def ingest(k):
+    k['data_df'] = csv_lesen(k['csv'])
+    return os.path.getsize(k['csv']), len(k['data_df'])
+
+
+def aggregation(k):
+    k['cube'] = aggregieren(k['data_df'], k['kreise_df'][['AGS', 'EWZ', 'EWZ_BL']])
+    return len(k['data_df']), k['cube'].werte.shape[0] * k['cube'].werte.shape[1]
+
+
+def inzidenz(k):
+    k['ebenen'] = k['hierarchie'].aggregieren(k['cube'])
+    k['inzidenz'] = {e: c.inzidenz() for e, c in k['ebenen'].items()}
+    return k['cube'].werte.shape[0] * k['cube'].werte.shape[1], sum(i[:, :, 0].size for i in k['inzidenz'].values())
+
+
+def joins(k):
+    data_ewz = pd.merge(k['kreise_df'][['AGS', 'EWZ', 'EWZ_BL']], k['cube'].als_dataframe().drop(columns='EWZ'),
+                        left_on='AGS', right_on='Id', how='right')
+    tag = data_ewz.loc[data_ewz['Meldedatum'] == WELLEN_NOTEBOOK[-1].peak]
+    k['data_kreise_day'] = pd.merge(tag, k['kreise_df'][['AGS', 'SHAPE', 'Shape__Area', 'Shape__Length']],
+                                    on='AGS', how='right')
+    k['data_ewz'] = data_ewz
+    return len(data_ewz), len(data_ewz) + len(k['data_kreise_day'])
+
+
+def cube(k):
+    inz = k['inzidenz']['kreis'][:, :, 0]
+    dates = k['cube'].dates
+    k['wellen'] = {}
+    for welle in WELLEN_NOTEBOOK:
+        auswahl = (dates >= welle.start) & (dates <= welle.ende)
+        k['wellen'][welle.name] = zeitbins_mittel(inz[:, auswahl], welle.intervall)
+    return inz.size, sum(w.size for w in k['wellen'].values())
+
+
+def hotspot(k):
+    z = analyse.gi_stern(k['inzidenz']['kreis'][:, :, 0], k['gewichte'])
+    k['gi_bin'] = analyse.konfidenz_bin(z)
+    return z.size, z.size
+
+
+def clustering(k):
+    k['cluster'] = {name: analyse.zeitreihen_clustering(werte)[0] for name, werte in k['wellen'].items()}
+    return sum(w.size for w in k['wellen'].values()), sum(len(c) for c in k['cluster'].values())
+
+
+def export(k):
+    pfad = os.path.join(k['verzeichnis'], 'export')
+    os.makedirs(pfad, exist_ok=True)
+    k['cube'].speichern(os.path.join(pfad, 'cube.npz'))
+    k['data_ewz'].to_csv(os.path.join(pfad, 'data.csv'), index=False)
+    return len(k['data_ewz']), os.path.getsize(os.path.join(pfad, 'data.csv'))
+
+
+STUFEN = OrderedDict([
+    ('ingest', ingest),
+    ('aggregation', aggregation),
+    ('inzidenz', inzidenz),
+    ('joins', joins),
+    ('cube', cube),
+    ('hotspot', hotspot),
+    ('clustering', clustering),
+    ('export', export),
+])
+
+
+def vorbereiten(faktor, verzeichnis, seed=0):
+    """Erzeugt (oder verwendet) die synthetische CSV-Datei für *faktor*."""
+    os.makedirs(verzeichnis, exist_ok=True)
+    kreise_df = synthetisch.kreise(seed=seed)
+    csv = os.path.join(verzeichnis, 'RKI_COVID19_x%g_s%d.csv' % (faktor, seed))
+    if not os.path.exists(csv):
+        synthetisch.als_csv(kreise_df, csv + '.tmp', faktor, seed)
+        os.replace(csv + '.tmp', csv)
+    return {
+        'csv': csv,
+        'verzeichnis': verzeichnis,
+        'kreise_df': kreise_df,
+        'gewichte': nachbarschaft.queen(kreise_df['SHAPE']),
+        'hierarchie': Hierarchie.aus_kreisen(kreise_df[['AGS', 'EWZ', 'EWZ_BL']]),
+    }
+
+
+def durchlauf(kontext, stufen=None, speicher=False):
+    """Führt die Stufen nacheinander aus und misst jede einzeln."""
+    ergebnisse = []
+    for name in stufen or STUFEN:
+        if speicher:
+            tracemalloc.start()
+        wand, cpu = time.perf_counter(), time.process_time()
+        with tracing.spanne(name) as spanne:
+            zeilen_ein, zeilen_aus = STUFEN[name](kontext)
+            spanne.zeilen(zeilen_ein, zeilen_aus)
+        eintrag = {
+            'stufe': name,
+            'wand_s': time.perf_counter() - wand,
+            'cpu_s': time.process_time() - cpu,
+            'ein': zeilen_ein,
+            'aus': zeilen_aus,
+        }
+        if speicher:
+            eintrag['peak_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            tracemalloc.stop()
+        ergebnisse.append(eintrag)
+    return ergebnisse
+
+
+def messen(faktoren=(1,), verzeichnis='bench', wiederholungen=3, speicher=True, stufen=None, seed=0):
+    """
+    Misst alle Stufen für jeden Faktor.
+
+    Die Zeiten sind das Minimum über *wiederholungen* Durchläufe; der Speicher
+    stammt aus einem zusätzlichen Durchlauf mit tracemalloc.
+    """
+    tabellen = []
+    for faktor in faktoren:
+        kontext = vorbereiten(faktor, verzeichnis, seed)
+        laeufe = [pd.DataFrame(durchlauf(kontext, stufen)) for _ in range(wiederholungen)]
+        tabelle = pd.concat(laeufe).groupby('stufe', sort=False).agg(
+            {'wand_s': 'min', 'cpu_s': 'min', 'ein': 'first', 'aus': 'first'})
+        if speicher:
+            tabelle['peak_mb'] = pd.DataFrame(durchlauf(kontext, stufen, speicher=True)).set_index('stufe')['peak_mb']
+        tabelle.insert(0, 'faktor', faktor)
+        tabellen.append(tabelle.reset_index())
+    return pd.concat(tabellen, ignore_index=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark der Pipeline auf synthetischen RKI-Daten')
+    parser.add_argument('--faktor', type=float, nargs='+', default=[1.0],
+                        help='Datenmenge als Vielfaches von 3.627.499 Zeilen')
+    parser.add_argument('--verzeichnis', default='bench', help='Ablage der erzeugten Daten und Exporte')
+    parser.add_argument('--wiederholungen', type=int, default=3)
+    parser.add_argument('--stufen', nargs='+', choices=list(STUFEN), help='nur diese Stufen (in Reihenfolge)')
+    parser.add_argument('--ohne-speicher', action='store_true', help='keinen tracemalloc-Durchlauf ausführen')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--ausgabe', help='Ergebnis zusätzlich als CSV speichern')
+    parser.add_argument('--trace', help='Chrome-Trace aller Durchläufe in diese Datei schreiben')
+    args = parser.parse_args(argv)
+
+    stufen = None
+    if args.stufen:
+        # Abhängige Stufen davor immer mit ausführen
+        stufen = list(STUFEN)[:max(list(STUFEN).index(s) for s in args.stufen) + 1]
+    if args.trace:
+        with tracing.aufzeichnen(args.trace):
+            tabelle = messen(args.faktor, args.verzeichnis, args.wiederholungen, not args.ohne_speicher, stufen,
+                             args.seed)
+    else:
+        tabelle = messen(args.faktor, args.verzeichnis, args.wiederholungen, not args.ohne_speicher, stufen, args.seed)
+    if args.stufen:
+        tabelle = tabelle[tabelle['stufe'].isin(args.stufen)]
+    with pd.option_context('display.width', 120, 'display.float_format', '{:.3f}'.format):
+        print(tabelle.to_string(index=False))
+    if args.ausgabe:
+        tabelle.to_csv(args.ausgabe, index=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""
+Cube mit den Fallzahlen pro Raumeinheit und Tag.
+
+Der Cube ersetzt das lange Dataframe *data_ewz* aus dem Notebook. Statt einer
+Zeile pro Landkreis und Meldedatum liegen die Zahlen in einem dichten Array
+der Form (Einheiten, Tage, Kennzahlen). Tage ohne Meldung sind 0, sodass keine
+Ergänzungszeilen wie in der Inzidenzberechnung des Notebooks nötig sind.
+
+Ein Cube kann mehrere Zeitachsen mit gemeinsamer Tagesliste enthalten, z.B.
+Meldedatum und Refdatum (Erkrankungsbeginn). Alle Auswertungen beziehen sich
+auf die aktive Zeitachse, die mit *mit_zeitachse()* gewechselt wird.
+
+Für jede Zeitachse hält der Cube bei Bedarf eine kumulierte Summe über die
+Tage (*zeitbins.Zeitpyramide*); gleitende Inzidenzen und Zeitschritte
+beliebiger Länge werden daraus gelesen.
+"""
+
+import numpy
+import pandas as pd
+
+from covid_analyse.datum import tagesliste, tagesnummern
+from covid_analyse.zeitbins import Zeitpyramide
+
+
+# Kennzahlen, wie sie in den RKI-Daten heißen
+METRIKEN = ('AnzahlFall', 'AnzahlTodesfall', 'AnzahlGenesen')
+
+# Spaltennamen der Tagesinzidenzen aus dem Notebook
+INZIDENZ_SPALTEN = {'AnzahlFall': 'FaelleEWZ', 'AnzahlTodesfall': 'TodesfaelleEWZ', 'AnzahlGenesen': 'GeneseneEWZ'}
+
+
+def ags_str(werte):
+    """Landkreis-IDs als fünfstellige Strings (wie 'IdLandkreis_str')."""
+    return pd.Series(werte).astype(str).str.zfill(5).to_numpy()
+
+
+def kreis_index(ids, id_landkreis):
+    """Zeilenindex im Cube für jede Landkreis-ID der Falldaten."""
+    # Nur die wenigen hundert verschiedenen IDs umwandeln, nicht jede Zeile
+    codes, eindeutig = pd.factorize(pd.Series(id_landkreis).to_numpy())
+    ags = ags_str(eindeutig)
+    kreis = numpy.minimum(numpy.searchsorted(ids, ags), len(ids) - 1)
+    bekannt = ids[kreis] == ags
+    if not bekannt.all():
+        raise KeyError('Landkreise ohne Einwohnerzahl: %s' % ', '.join(numpy.unique(ags[~bekannt])))
+    return kreis[codes]
+
+
+def kreise_aus_ewz(kreise_ewz):
+    """Sortierte AGS und Einwohnerzahlen aus *kreise_ewz* (In[19])."""
+    kreise_ewz = kreise_ewz.drop_duplicates('AGS')
+    ids = ags_str(kreise_ewz['AGS'])
+    ewz = kreise_ewz['EWZ'].to_numpy(dtype=float)
+    order = numpy.argsort(ids)
+    return ids[order], ewz[order]
+
+
+def tage_einbetten(werte, dates, alle_dates):
+    """
+    Legt Werte (..., Tage, Kennzahlen) auf die längere Tagesliste *alle_dates*.
+
+    *dates* muss vollständig in *alle_dates* liegen; fehlende Tage sind 0.
+    """
+    ergebnis = numpy.zeros(werte.shape[:-2] + (len(alle_dates), werte.shape[-1]), dtype=werte.dtype)
+    von = (dates[0] - alle_dates[0]).days
+    ergebnis[..., von:von + len(dates), :] = werte
+    return ergebnis
+
+
+class Cube:
+    """
+    Fallzahlen einer Ebene (z.B. Landkreise) als Array (Einheiten, Tage, Kennzahlen).
+
+    ids        -- Kennung pro Einheit, z.B. AGS als fünfstelliger String
+    dates      -- lückenlose Tagesliste (wie *date_list* im Notebook)
+    werte      -- Array der Form (len(ids), len(dates), len(metriken)) oder bei
+                  mehreren Zeitachsen (len(zeitachsen), len(ids), len(dates), len(metriken))
+    ewz        -- Einwohnerzahl pro Einheit
+    ebene      -- Name der Ebene, z.B. 'kreis' oder 'bundesland'
+    zeitachsen -- Namen der Zeitachsen, z.B. ('Meldedatum', 'Refdatum')
+    """
+
+    def __init__(self, ids, dates, werte, ewz, metriken=METRIKEN, ebene='kreis', zeitachsen=('Meldedatum',),
+                 zeitachse=None):
+        self.ids = numpy.asarray(ids)
+        self.dates = pd.DatetimeIndex(dates)
+        self.ewz = numpy.asarray(ewz, dtype=float)
+        self.metriken = tuple(metriken)
+        self.ebene = ebene
+        self.zeitachsen = tuple(zeitachsen)
+        werte = numpy.asarray(werte)
+        if werte.ndim == 3:
+            werte = werte[None]
+        form = (len(self.zeitachsen), len(self.ids), len(self.dates), len(self.metriken))
+        if werte.shape != form:
+            raise ValueError('werte hat die Form %s, erwartet %s' % (werte.shape, form))
+        self.alle_werte = werte
+        self.zeitachse = zeitachse or self.zeitachsen[0]
+        self._index = None
+        self._pyramiden = {}
+
+    def __repr__(self):
+        return '<Cube %s: %d Einheiten, %d Tage (%s - %s) nach %s, %s>' % (
+            self.ebene, len(self.ids), len(self.dates),
+            self.dates[0].date() if len(self.dates) else '-',
+            self.dates[-1].date() if len(self.dates) else '-',
+            self.zeitachse, ', '.join(self.metriken))
+
+    def __getstate__(self):
+        # Zwischengespeicherte Summen nicht mit ablegen bzw. an andere Prozesse schicken
+        zustand = dict(self.__dict__)
+        zustand['_pyramiden'] = {}
+        return zustand
+
+    @property
+    def werte(self):
+        """Zahlen der aktiven Zeitachse als Array (Einheiten, Tage, Kennzahlen)."""
+        return self.alle_werte[self.zeitachsen.index(self.zeitachse)]
+
+    def mit_zeitachse(self, zeitachse):
+        """Derselbe Cube mit einer anderen aktiven Zeitachse (ohne Kopie der Daten)."""
+        if zeitachse not in self.zeitachsen:
+            raise KeyError('Zeitachse %r nicht vorhanden, verfügbar: %s' % (zeitachse, ', '.join(self.zeitachsen)))
+        cube = Cube(self.ids, self.dates, self.alle_werte, self.ewz, self.metriken, self.ebene,
+                    self.zeitachsen, zeitachse)
+        cube._index = self._index
+        cube._pyramiden = self._pyramiden
+        return cube
+
+    @classmethod
+    def aus_dataframe(cls, data_df_aggr, kreise_ewz, datum='Meldedatum'):
+        """
+        Baut den Landkreis-Cube aus der Aggregation nach Tag und Landkreis (In[17]).
+
+        *kreise_ewz* enthält 'AGS' und 'EWZ' pro Landkreis. Die Zuordnung
+        erfolgt wie beim Join im Notebook über den fünfstelligen AGS.
+        """
+        ids, ewz = kreise_aus_ewz(kreise_ewz)
+        kreis = kreis_index(ids, data_df_aggr['IdLandkreis'])
+        tage = tagesnummern(data_df_aggr[datum])
+        dates = tagesliste(tage.min(), tage.max())
+        tag = tage - tage.min()
+
+        werte = numpy.zeros((len(ids), len(dates), len(METRIKEN)), dtype=numpy.int64)
+        for m, metrik in enumerate(METRIKEN):
+            numpy.add.at(werte[:, :, m], (kreis, tag), data_df_aggr[metrik].to_numpy())
+        return cls(ids, dates, werte, ewz, zeitachsen=(datum,))
+
+    def speichern(self, pfad):
+        """Legt den Cube als komprimierte npz-Datei ab (Zwischenspeichern wie in In[35])."""
+        numpy.savez_compressed(
+            pfad, ids=self.ids.astype(str), start=self.dates[0].value if len(self.dates) else 0,
+            tage=len(self.dates), werte=self.alle_werte, ewz=self.ewz, metriken=numpy.array(self.metriken),
+            ebene=self.ebene, zeitachsen=numpy.array(self.zeitachsen))
+
+    @classmethod
+    def laden(cls, pfad):
+        """Lädt einen mit *speichern()* abgelegten Cube."""
+        with numpy.load(pfad) as npz:
+            dates = pd.date_range(start=pd.Timestamp(int(npz['start'])), periods=int(npz['tage']), freq='D')
+            return cls(npz['ids'], dates, npz['werte'], npz['ewz'], tuple(npz['metriken']), str(npz['ebene']),
+                       tuple(npz['zeitachsen']))
+
+    def zeitraum(self, von, bis):
+        """
+        Ausschnitt vom Tag *von* bis einschließlich *bis*, z.B. eine Welle (In[81]).
+
+        Gleitende Inzidenzen des Ausschnitts beginnen am ersten Tag neu; für
+        Werte wie im Notebook die Inzidenz auf dem ganzen Cube berechnen und
+        danach schneiden.
+        """
+        start = max(self.dates.searchsorted(pd.Timestamp(von)), 0)
+        ende = self.dates.searchsorted(pd.Timestamp(bis), side='right')
+        return Cube(self.ids, self.dates[start:ende], self.alle_werte[:, :, start:ende], self.ewz, self.metriken,
+                    self.ebene, self.zeitachsen, self.zeitachse)
+
+    def index(self, ids):
+        """Zeilenindex der angegebenen Einheiten."""
+        if self._index is None:
+            self._index = {k: i for i, k in enumerate(self.ids)}
+        if isinstance(ids, str):
+            return self._index[ids]
+        return numpy.array([self._index[k] for k in ids], dtype=numpy.intp)
+
+    def metrik(self, name):
+        """Zahlen einer Kennzahl als Array (Einheiten, Tage)."""
+        return self.werte[:, :, self.metriken.index(name)]
+
+    def zeitpyramide(self):
+        """Kumulierte Summe der aktiven Zeitachse über die Tage; wird beim ersten Aufruf gebildet."""
+        if self.zeitachse not in self._pyramiden:
+            self._pyramiden[self.zeitachse] = Zeitpyramide(self.werte, self.dates)
+        return self._pyramiden[self.zeitachse]
+
+    def zeitschritte(self, breite, art='summe', ausrichtung='END_TIME', von=None, bis=None):
+        """
+        Summe oder Mittel über Zeitschritte von *breite* Tagen wie im Space-Time
+        Cube (In[80]-In[91]) als Zeitschritte(start, ende, werte) mit werte
+        (Einheiten, Schritte, Kennzahlen). Jede Länge kostet nur zwei
+        Zugriffe pro Schritt; siehe *zeitbins*.
+        """
+        return self.zeitpyramide().schritte(breite, art, ausrichtung, von, bis)
+
+    def tagesinzidenz(self):
+        """Fälle/Todesfälle/Genesene pro 100.000 Einwohner und Tag (In[27]/In[31])."""
+        return self.werte / self.ewz[:, None, None] * 100000
+
+    def inzidenz(self, fenster=7):
+        """
+        Summe der Tagesinzidenzen der letzten *fenster* Tage einschließlich des Tages.
+
+        Entspricht den Spalten 'FaelleEWZ_7', ... aus In[28]/In[32]. Die ersten
+        Tage summieren nur über die bereits vorhandenen Tage. Weitere Fenster
+        und R-Werte siehe *fenster*.
+        """
+        return self.zeitpyramide().fenster(fenster) / self.ewz[:, None, None] * 100000
+
+    def als_dataframe(self, fenster=7):
+        """
+        Langes Dataframe mit einer Zeile pro Einheit und Tag.
+
+        Die Spalten folgen den Namen aus dem Notebook, sodass das Ergebnis wie
+        *data_ewz* bzw. *data_bl* weiterverwendet werden kann.
+        """
+        n, t = len(self.ids), len(self.dates)
+        df = pd.DataFrame({
+            'Id': numpy.repeat(self.ids, t),
+            self.zeitachse: numpy.tile(self.dates.to_numpy(), n),
+            'EWZ': numpy.repeat(self.ewz, t),
+        })
+        tag = self.tagesinzidenz()
+        inz = self.inzidenz(fenster)
+        for m, metrik in enumerate(self.metriken):
+            df[metrik] = self.werte[:, :, m].ravel()
+            spalte = INZIDENZ_SPALTEN.get(metrik, metrik + 'EWZ')
+            df[spalte] = tag[:, :, m].ravel()
+            df['%s_%d' % (spalte, fenster)] = inz[:, :, m].ravel()
+        return df
@@ -0,0 +1,97 @@
+"""
+Schnelle Umwandlung der RKI-Datumsangaben in Tagesnummern.
+
+Die RKI-Datei enthält Datumsangaben in festen Formaten:
+
+    Meldedatum, Refdatum   '2021/12/28 00:00:00' (ältere Stände '2021-12-28')
+    Datenstand             '20.01.2022, 00:00 Uhr'
+
+Statt Millionen Strings mit parse_dates (In[11]) einzeln zu interpretieren,
+werden die Spalten als Kategorien gelesen. Es gibt nur wenige hundert
+verschiedene Tage, sodass nur diese einmal zerlegt und in einem Zwischenspeicher
+abgelegt werden. Intern arbeiten alle Module mit Tagesnummern (int32, Tage seit
+1970-01-01); erst für die Anzeige wird mit *als_datum()* zurückgewandelt.
+"""
+
+import numpy
+import pandas as pd
+
+
+DATUMSSPALTEN = ('Meldedatum', 'Datenstand', 'Refdatum')
+
+_zwischenspeicher = {}
+
+
+def _zerlegen(text):
+    """Tagesnummer eines einzelnen Datumsstrings in einem der RKI-Formate."""
+    text = text.strip()
+    if len(text) >= 10 and text[4] in '/-' and text[7] in '/-':
+        jahr, monat, tag = text[0:4], text[5:7], text[8:10]
+    elif len(text) >= 10 and text[2] == '.' and text[5] == '.':
+        tag, monat, jahr = text[0:2], text[3:5], text[6:10]
+    else:
+        # Unbekanntes Format: allgemeine, langsame Erkennung
+        return int(pd.Timestamp(text).normalize().value // 86400000000000)
+    return int(numpy.datetime64('%s-%s-%s' % (jahr, monat, tag), 'D').astype(numpy.int64))
+
+
+def tag(wert):
+    """Tagesnummer eines einzelnen Werts, z.B. tag('2021-12-28') statt eines String-Vergleichs."""
+    if isinstance(wert, str):
+        if wert not in _zwischenspeicher:
+            _zwischenspeicher[wert] = _zerlegen(wert)
+        return _zwischenspeicher[wert]
+    return int(numpy.datetime64(pd.Timestamp(wert).normalize().date(), 'D').astype(numpy.int64))
+
+
+def tagesnummern(werte):
+    """
+    Tagesnummern (int32) einer Spalte.
+
+    Akzeptiert Strings in den RKI-Formaten (auch als Kategorie), datetime64-
+    Werte und bereits umgewandelte Ganzzahlen.
+    """
+    if isinstance(werte, pd.Series) and isinstance(werte.dtype, pd.CategoricalDtype):
+        codes, eindeutig = werte.cat.codes.to_numpy(), werte.cat.categories
+    else:
+        werte = numpy.asarray(werte)
+        if werte.dtype.kind in 'iu':
+            return werte.astype(numpy.int32, copy=False)
+        if werte.dtype.kind == 'M':
+            return werte.astype('datetime64[D]').astype(numpy.int32)
+        codes, eindeutig = pd.factorize(werte)
+    if (codes < 0).any():
+        raise ValueError('Fehlende Datumsangaben')
+    if len(eindeutig) and pd.api.types.is_datetime64_any_dtype(eindeutig):
+        tabelle = numpy.asarray(eindeutig, dtype='datetime64[D]').astype(numpy.int32)
+    else:
+        tabelle = numpy.array([tag(str(e)) for e in eindeutig], dtype=numpy.int32)
+    return tabelle[codes]
+
+
+def als_datum(tage):
+    """DatetimeIndex zu Tagesnummern, nur für Anzeige und Export."""
+    return pd.DatetimeIndex(numpy.asarray(tage, dtype=numpy.int64).astype('datetime64[D]'))
+
+
+def tagesliste(von, bis):
+    """Lückenlose Tagesliste (wie *date_list* im Notebook) zwischen zwei Tagesnummern."""
+    return pd.date_range(als_datum([von])[0], periods=int(bis) - int(von) + 1, freq='D')
+
+
+def csv_lesen(quelle, spalten=DATUMSSPALTEN, **kwargs):
+    """
+    pd.read_csv() mit Tagesnummern statt parse_dates.
+
+    Die Datumsspalten aus *spalten* werden als Kategorie gelesen und in int32
+    umgewandelt; alle weiteren Argumente gehen an pd.read_csv().
+    """
+    usecols = kwargs.get('usecols')
+    datum = [s for s in spalten if usecols is None or s in usecols]
+    dtype = dict(kwargs.pop('dtype', None) or {})
+    dtype.update({s: 'category' for s in datum})
+    data_df = pd.read_csv(quelle, dtype=dtype, **kwargs)
+    for spalte in datum:
+        if spalte in data_df:
+            data_df[spalte] = tagesnummern(data_df[spalte])
+    return data_df
@@ -0,0 +1,47 @@
+"""
+Verlaufsdiagramme des Notebooks (In[42]-In[44]).
+
+matplotlib wird erst beim ersten Diagramm importiert. Gezeichnet wird mit der
+objektorientierten Figure-API statt pyplot, sodass weder ein Fenster noch ein
+interaktives Backend nötig ist; Berechnungen ohne Diagramme laden matplotlib
+überhaupt nicht.
+"""
+
+import numpy
+
+
+# Farben der Bundesländer aus In[42]
+FARBEN = {'01': 'blue', '02': 'dodgerblue', '03': 'cyan', '04': 'lime', '05': 'forestgreen', '06': 'yellow',
+          '07': 'gold', '08': 'darkorange', '09': 'saddlebrown', '10': 'red', '11': 'darkred', '12': 'deeppink',
+          '13': 'darkmagenta', '14': 'mediumorchid', '15': 'silver', '16': 'midnightblue'}
+
+
+def verlauf(bl_cube, metrik, titel, pfad, namen=None):
+    """
+    7-Tage-Inzidenz von *metrik* pro Bundesland als Datei *pfad*.
+
+    *namen* bildet BL_ID auf den angezeigten Namen ab; fehlt ein Eintrag,
+    wird die Kennung verwendet.
+    """
+    from matplotlib.figure import Figure
+    import matplotlib.dates as mdates
+
+    namen = namen if namen is not None else {}
+    inzidenz = bl_cube.inzidenz()[:, :, bl_cube.metriken.index(metrik)]
+
+    fig = Figure(figsize=(35, 15))
+    ax = fig.subplots()
+    for i, bl_id in enumerate(bl_cube.ids):
+        ax.plot(bl_cube.dates, inzidenz[i], color=FARBEN.get(bl_id), linewidth=3, label=namen.get(bl_id, bl_id))
+    ax.legend(loc='upper left', fontsize=22)
+    ax.set_xlabel('Meldedatum', fontsize=20)
+    ax.set_ylabel('COVID-19-%s der letzten 7 Tage/100.000 Einwohner' % titel, fontsize=20)
+    ax.set_title('7-Tageinzidenz der COVID-19-%s pro Bundesland' % titel, fontsize=22)
+    ax.set_xlim([bl_cube.dates[0], bl_cube.dates[-1]])
+    ax.set_ylim([0, numpy.nanmax(inzidenz) * 1.05 or 1])
+    ax.xaxis.set_major_locator(mdates.WeekdayLocator(interval=2))
+    for beschriftung in ax.get_xticklabels():
+        beschriftung.set_rotation(45)
+        beschriftung.set_ha('right')
+    fig.savefig(pfad)
+    return pfad
@@ -0,0 +1,203 @@
+"""
+Dünn besetzte Fallzahlen pro Landkreis und Tag.
+
+Für Tage ohne Meldung hängen die Inzidenzschleifen des Notebooks je
+Landkreis und fehlendem Tag eine Ergänzungszeile an (*temp_data* in In[28]
+und In[32]), mit Kopien aller übrigen Spalten. Der DuennerCube speichert
+stattdessen nur die gemeldeten Tage: pro Zeitachse und Kennzahl eine
+CSR-Matrix mit einer Zeile pro Landkreis und einer Spalte pro Tag.
+
+Gleitende Summen und Inzidenzen entstehen wie im *merkmale*-Cube als Produkt
+mit einer Bandmatrix auf der Tagesachse; fehlende Tage zählen dabei als 0,
+ohne aufgefüllt zu werden. Zeitschritte beliebiger Länge sind ein Produkt mit
+einer Zuordnungsmatrix Tage x Schritte. Für Auswertungen, die ein dichtes
+Array benötigen (Hot Spots, Space-Time Cubes), liefert *als_cube()* einen
+gewöhnlichen Cube.
+
+    duenn = aggregation.aggregieren_duenn(data_df, kreise_ewz)
+    duenn.inzidenz(7)                  # CSR (Landkreise, Tage)
+    duenn.als_dataframe()              # data_ewz ohne Ergänzungszeilen
+"""
+
+import numpy
+import pandas as pd
+from scipy import sparse
+
+from covid_analyse.cube import Cube, INZIDENZ_SPALTEN, METRIKEN
+from covid_analyse.merkmale import fenster_matrix
+from covid_analyse.zeitbins import Zeitschritte, grenzen
+
+
+def zuordnung(tage, breite, ausrichtung='END_TIME'):
+    """Matrix (Tage x Schritte), die jeden Tag seinem Zeitschritt der Länge *breite* zuordnet."""
+    anfang, ende = grenzen(tage, breite, ausrichtung)
+    tag = (anfang[:, None] + numpy.arange(breite)).ravel()
+    schritt = numpy.repeat(numpy.arange(len(anfang)), breite)
+    return sparse.csr_matrix((numpy.ones(len(tag), dtype=numpy.int64), (tag, schritt)), shape=(tage, len(anfang)))
+
+
+class DuennerCube:
+    """
+    Fallzahlen einer Ebene als dünn besetzte Matrizen (Einheiten x Tage).
+
+    ids, dates, ewz, metriken, ebene, zeitachsen und zeitachse haben dieselbe
+    Bedeutung wie beim Cube. *matrizen* bildet (Zeitachse, Kennzahl) auf eine
+    CSR-Matrix der Form (len(ids), len(dates)) ab.
+    """
+
+    def __init__(self, ids, dates, ewz, matrizen, metriken=METRIKEN, ebene='kreis', zeitachsen=('Meldedatum',),
+                 zeitachse=None):
+        self.ids = numpy.asarray(ids)
+        self.dates = pd.DatetimeIndex(dates)
+        self.ewz = numpy.asarray(ewz, dtype=float)
+        self.metriken = tuple(metriken)
+        self.ebene = ebene
+        self.zeitachsen = tuple(zeitachsen)
+        self.zeitachse = zeitachse or self.zeitachsen[0]
+        self.matrizen = matrizen
+        form = (len(self.ids), len(self.dates))
+        for schluessel, matrix in matrizen.items():
+            if matrix.shape != form:
+                raise ValueError('Matrix %s hat die Form %s, erwartet %s' % (schluessel, matrix.shape, form))
+
+    def __repr__(self):
+        return '<DuennerCube %s: %d Einheiten, %d Tage nach %s, %.2f%% besetzt>' % (
+            self.ebene, len(self.ids), len(self.dates), self.zeitachse, 100.0 * self.besetzt())
+
+    def besetzt(self):
+        """Anteil der gespeicherten Einträge an allen Zellen (Einheiten x Tage x Kennzahlen x Zeitachsen)."""
+        zellen = len(self.matrizen) * len(self.ids) * len(self.dates)
+        return sum(m.nnz for m in self.matrizen.values()) / max(zellen, 1)
+
+    def mit_zeitachse(self, zeitachse):
+        """Derselbe Cube mit einer anderen aktiven Zeitachse (ohne Kopie der Daten)."""
+        if zeitachse not in self.zeitachsen:
+            raise KeyError('Zeitachse %r nicht vorhanden, verfügbar: %s' % (zeitachse, ', '.join(self.zeitachsen)))
+        return DuennerCube(self.ids, self.dates, self.ewz, self.matrizen, self.metriken, self.ebene,
+                           self.zeitachsen, zeitachse)
+
+    @classmethod
+    def aus_cube(cls, cube):
+        """Dünn besetzte Fassung eines dichten Cubes mit allen Zeitachsen."""
+        matrizen = {}
+        for a, achse in enumerate(cube.zeitachsen):
+            for m, metrik in enumerate(cube.metriken):
+                matrizen[(achse, metrik)] = sparse.csr_matrix(cube.alle_werte[a, :, :, m])
+        return cls(cube.ids, cube.dates, cube.ewz, matrizen, cube.metriken, cube.ebene, cube.zeitachsen,
+                   cube.zeitachse)
+
+    def als_cube(self):
+        """Dichte Ansicht als Cube (Tage ohne Meldung sind 0) für Auswertungen, die ein Array benötigen."""
+        dtype = numpy.result_type(*[m.dtype for m in self.matrizen.values()])
+        werte = numpy.zeros((len(self.zeitachsen), len(self.ids), len(self.dates), len(self.metriken)), dtype=dtype)
+        for a, achse in enumerate(self.zeitachsen):
+            for m, metrik in enumerate(self.metriken):
+                werte[a, :, :, m] = self.matrizen[(achse, metrik)].toarray()
+        return Cube(self.ids, self.dates, werte, self.ewz, self.metriken, self.ebene, self.zeitachsen,
+                    self.zeitachse)
+
+    def speichern(self, pfad):
+        """Legt den Cube als npz-Datei ab; gespeichert werden nur die besetzten Einträge."""
+        arrays = {}
+        for a, achse in enumerate(self.zeitachsen):
+            for m, metrik in enumerate(self.metriken):
+                matrix = self.matrizen[(achse, metrik)]
+                for teil in ('data', 'indices', 'indptr'):
+                    arrays['%s_%d_%d' % (teil, a, m)] = getattr(matrix, teil)
+        numpy.savez_compressed(
+            pfad, ids=self.ids.astype(str), start=self.dates[0].value if len(self.dates) else 0,
+            tage=len(self.dates), ewz=self.ewz, metriken=numpy.array(self.metriken), ebene=self.ebene,
+            zeitachsen=numpy.array(self.zeitachsen), **arrays)
+
+    @classmethod
+    def laden(cls, pfad):
+        """Lädt einen mit *speichern()* abgelegten Cube."""
+        with numpy.load(pfad) as npz:
+            dates = pd.date_range(start=pd.Timestamp(int(npz['start'])), periods=int(npz['tage']), freq='D')
+            metriken, zeitachsen = tuple(npz['metriken']), tuple(npz['zeitachsen'])
+            form = (len(npz['ids']), len(dates))
+            matrizen = {}
+            for a, achse in enumerate(zeitachsen):
+                for m, metrik in enumerate(metriken):
+                    matrizen[(achse, metrik)] = sparse.csr_matrix(
+                        tuple(npz['%s_%d_%d' % (teil, a, m)] for teil in ('data', 'indices', 'indptr')), shape=form)
+            return cls(npz['ids'], dates, npz['ewz'], matrizen, metriken, str(npz['ebene']), zeitachsen)
+
+    def zeitraum(self, von, bis):
+        """Ausschnitt vom Tag *von* bis einschließlich *bis* wie *Cube.zeitraum()*."""
+        start = max(self.dates.searchsorted(pd.Timestamp(von)), 0)
+        ende = self.dates.searchsorted(pd.Timestamp(bis), side='right')
+        matrizen = {schluessel: matrix[:, start:ende] for schluessel, matrix in self.matrizen.items()}
+        return DuennerCube(self.ids, self.dates[start:ende], self.ewz, matrizen, self.metriken, self.ebene,
+                           self.zeitachsen, self.zeitachse)
+
+    def matrix(self, metrik='AnzahlFall'):
+        """CSR-Matrix (Einheiten, Tage) einer Kennzahl auf der aktiven Zeitachse."""
+        return self.matrizen[(self.zeitachse, metrik)]
+
+    def metrik(self, name):
+        """Zahlen einer Kennzahl als dichtes Array (Einheiten, Tage) wie *Cube.metrik()*."""
+        return self.matrix(name).toarray()
+
+    def _pro_einwohner(self, matrix):
+        with numpy.errstate(divide='ignore'):
+            faktor = numpy.where(self.ewz > 0, 100000 / self.ewz, 0.0)
+        return (sparse.diags(faktor) @ matrix).tocsr()
+
+    def gleitende_summe(self, fenster=7, metrik='AnzahlFall'):
+        """
+        Summe über den Tag selbst und die *fenster*-1 Tage davor, weiterhin dünn
+        besetzt; besetzt sind nur die Tage bis *fenster*-1 Tage nach einer Meldung.
+        """
+        matrix = self.matrix(metrik)
+        return (matrix @ fenster_matrix(len(self.dates), fenster).astype(matrix.dtype)).tocsr()
+
+    def tagesinzidenz(self, metrik='AnzahlFall'):
+        """Tageswerte einer Kennzahl pro 100.000 Einwohner (In[27]/In[31]) als CSR-Matrix."""
+        return self._pro_einwohner(self.matrix(metrik))
+
+    def inzidenz(self, fenster=7, metrik='AnzahlFall'):
+        """Gleitende Inzidenz wie 'FaelleEWZ_7' (In[28]/In[32]) als CSR-Matrix."""
+        return self._pro_einwohner(self.gleitende_summe(fenster, metrik))
+
+    def zeitschritte(self, breite, art='summe', ausrichtung='END_TIME', metrik='AnzahlFall'):
+        """
+        Summe oder Mittel über Zeitschritte von *breite* Tagen wie *Cube.zeitschritte()*,
+        aber für eine Kennzahl und mit werte als CSR-Matrix (Einheiten, Schritte).
+        """
+        if art not in ('summe', 'mittel'):
+            raise ValueError('Unbekannte Art %r (summe oder mittel)' % art)
+        matrix = self.matrix(metrik)
+        abbildung = zuordnung(len(self.dates), breite, ausrichtung)
+        anfang, ende = grenzen(len(self.dates), breite, ausrichtung)
+        werte = (matrix @ abbildung.astype(matrix.dtype)).tocsr()
+        if art == 'mittel':
+            werte = werte / breite
+        return Zeitschritte(self.dates[anfang], self.dates[ende - 1], werte)
+
+    def als_dataframe(self, fenster=7):
+        """
+        Langes Dataframe wie *Cube.als_dataframe()*, aber nur mit den Zeilen
+        (Einheit, Tag), an denen eine Kennzahl oder ihre gleitende Summe
+        besetzt ist. Ergänzungszeilen für Tage ohne Meldung (In[28]) entfallen;
+        die Tage nach der letzten Meldung eines Landkreises bleiben enthalten,
+        solange die gleitende Inzidenz noch nicht 0 ist.
+        """
+        tag = {metrik: self.tagesinzidenz(metrik) for metrik in self.metriken}
+        inz = {metrik: self.inzidenz(fenster, metrik) for metrik in self.metriken}
+        besetzt = sum((abs(tag[m]) + abs(inz[m]) for m in self.metriken),
+                      sparse.csr_matrix((len(self.ids), len(self.dates)))).tocoo()
+        reihenfolge = numpy.lexsort((besetzt.col, besetzt.row))
+        zeile, spalte = besetzt.row[reihenfolge], besetzt.col[reihenfolge]
+
+        df = pd.DataFrame({
+            'Id': self.ids[zeile],
+            self.zeitachse: self.dates[spalte],
+            'EWZ': self.ewz[zeile],
+        })
+        for metrik in self.metriken:
+            df[metrik] = numpy.asarray(self.matrix(metrik)[zeile, spalte]).ravel()
+            spalte_name = INZIDENZ_SPALTEN.get(metrik, metrik + 'EWZ')
+            df[spalte_name] = numpy.asarray(tag[metrik][zeile, spalte]).ravel()
+            df['%s_%d' % (spalte_name, fenster)] = numpy.asarray(inz[metrik][zeile, spalte]).ravel()
+        return df
@@ -0,0 +1,101 @@
+"""
+Paralleles Einlesen und Aggregieren der RKI-Datei.
+
+Import (In[11]) und groupby (In[17]) laufen im Notebook auf einem Kern. Hier
+wird die Datei in Byte-Bereiche zerlegt, deren Grenzen auf Zeilenanfänge
+fallen. Jeder Bereich wird in einem eigenen Prozess gelesen und sofort zu
+einem Landkreis-Cube voraggregiert; zurück an den Hauptprozess gehen nur diese
+kleinen Teilsummen (Landkreise x Tage), die dort addiert werden.
+
+Die RKI-Datei enthält keine Zeilenumbrüche innerhalb von Feldern, daher ist
+jeder Zeilenumbruch eine Datensatzgrenze.
+"""
+
+import csv
+import io
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from covid_analyse import tracing
+from covid_analyse.aggregation import ZEITACHSEN, aggregieren
+from covid_analyse.cube import Cube, METRIKEN, tage_einbetten
+from covid_analyse.datum import csv_lesen
+
+
+def bereiche(pfad, groesse=64 * 2 ** 20):
+    """
+    Byte-Bereiche (start, ende) von höchstens etwa *groesse* Bytes.
+
+    Der erste Bereich beginnt nach der Kopfzeile, jede Grenze direkt nach
+    einem Zeilenumbruch. Liefert außerdem die Spaltennamen.
+    """
+    gesamt = os.path.getsize(pfad)
+    with open(pfad, 'rb') as f:
+        kopf = f.readline()
+        start = f.tell()
+        ergebnis = []
+        while start < gesamt:
+            f.seek(min(start + groesse, gesamt))
+            if f.tell() < gesamt:
+                f.readline()
+            ende = f.tell()
+            ergebnis.append((start, ende))
+            start = ende
+    namen = next(csv.reader([kopf.decode('utf-8-sig')]))
+    return namen, ergebnis
+
+
+def _bereich_aggregieren(pfad, start, ende, namen, kreise_ewz, zeitachsen, metriken):
+    with open(pfad, 'rb') as f:
+        f.seek(start)
+        daten = f.read(ende - start)
+    data_df = csv_lesen(io.BytesIO(daten), header=None, names=namen,
+                        usecols=['IdLandkreis'] + list(zeitachsen) + list(metriken))
+    return aggregieren(data_df, kreise_ewz, zeitachsen, metriken), len(data_df)
+
+
+def _addieren(summe, teil):
+    """Summe zweier Cubes mit möglicherweise unterschiedlicher Tagesliste."""
+    if summe is None:
+        return teil
+    if teil.dates[0] >= summe.dates[0] and teil.dates[-1] <= summe.dates[-1]:
+        von = (teil.dates[0] - summe.dates[0]).days
+        summe.alle_werte[:, :, von:von + len(teil.dates)] += teil.alle_werte
+        return summe
+    dates = pd.date_range(min(summe.dates[0], teil.dates[0]), max(summe.dates[-1], teil.dates[-1]), freq='D')
+    werte = tage_einbetten(summe.alle_werte, summe.dates, dates)
+    werte += tage_einbetten(teil.alle_werte, teil.dates, dates)
+    return Cube(summe.ids, dates, werte, summe.ewz, summe.metriken, zeitachsen=summe.zeitachsen)
+
+
+def aggregieren_parallel(pfad, kreise_ewz, prozesse=None, zeitachsen=ZEITACHSEN, metriken=METRIKEN,
+                         groesse=64 * 2 ** 20):
+    """
+    Wie *aggregieren()* auf pd.read_csv(pfad), aber verteilt auf *prozesse*.
+
+    Jeder Prozess hält höchstens einen Bereich von etwa *groesse* Bytes als
+    Dataframe im Speicher. Die Teilsummen werden in der Reihenfolge ihres
+    Eintreffens addiert; das Ergebnis ist unabhängig von der Aufteilung.
+    """
+    namen, teile = bereiche(pfad, groesse)
+    fehlend = set(['IdLandkreis'] + list(zeitachsen) + list(metriken)) - set(namen)
+    if fehlend:
+        raise KeyError('Spalten fehlen in %s: %s' % (pfad, ', '.join(sorted(fehlend))))
+    kreise_ewz = kreise_ewz[['AGS', 'EWZ']]
+
+    summe, zeilen = None, 0
+    with tracing.spanne('einlesen_parallel', 'io', bereiche=len(teile)) as spanne, \
+            ProcessPoolExecutor(max_workers=prozesse) as pool:
+        auftraege = [pool.submit(_bereich_aggregieren, pfad, start, ende, namen, kreise_ewz, zeitachsen, metriken)
+                     for start, ende in teile]
+        for auftrag in as_completed(auftraege):
+            teil, anzahl = auftrag.result()
+            summe = _addieren(summe, teil)
+            zeilen += anzahl
+        spanne.zeilen(zeilen, summe.alle_werte[0].shape[0] * len(summe.dates) if summe else 0)
+        spanne.bytes(os.path.getsize(pfad))
+    if summe is None:
+        raise ValueError('Keine Falldaten in %s' % pfad)
+    return summe
@@ -0,0 +1,161 @@
+"""
+Gleitende Fensterstatistiken über die Tage eines Cubes.
+
+Das Notebook berechnet nur 7-Tage-Summen, und zwar mit einem Ringpuffer über
+die Wochentage (Tag modulo 7) in einer Schleife pro Landkreis (In[28],
+In[32]). Hier werden alle Fenster aus einer einzigen kumulierten Summe über
+die Tagesachse gebildet: Eine Summe über *laenge* Tage ist die Differenz
+zweier Einträge der kumulierten Summe, für beliebige Längen und für alle
+Einheiten und Kennzahlen gleichzeitig. Gewichtete Fenster werden als Summe
+verschobener Arrays gebildet, Verhältnisse aufeinanderfolgender Fenster (z.B.
+der 4-Tage- und 7-Tage-R-Wert des RKI) aus denselben Summen.
+
+Welche Größen berechnet werden, legt eine Liste von *Kennzahl*-Einträgen fest:
+
+    kennzahlen = (Kennzahl('inzidenz_14', 'summe', 14),
+                  Kennzahl('r_7', 'verhaeltnis', 7, abstand=4))
+    ergebnis = fenster.fuer_ebenen(hierarchie.aggregieren(kreis_cube), kennzahlen)
+    ergebnis['bundesland']['r_7']
+"""
+
+from collections import OrderedDict, namedtuple
+
+import numpy
+
+
+# art: 'summe' (je 100.000 Einwohner, mit *gewichte* gewichtet) oder 'verhaeltnis'
+# (Summe der letzten *laenge* Tage geteilt durch die Summe *abstand* Tage davor)
+Kennzahl = namedtuple('Kennzahl', ['name', 'art', 'laenge', 'gewichte', 'abstand'], defaults=(None, None))
+
+KENNZAHLEN = (
+    Kennzahl('inzidenz_7', 'summe', 7),
+    Kennzahl('inzidenz_14', 'summe', 14),
+    Kennzahl('inzidenz_28', 'summe', 28),
+    # R-Werte nach RKI: Generationszeit 4 Tage
+    Kennzahl('r_4', 'verhaeltnis', 4, abstand=4),
+    Kennzahl('r_7', 'verhaeltnis', 7, abstand=4),
+)
+
+
+def kumuliert(werte, achse=1):
+    """
+    Kumulierte Summe entlang *achse* mit einer führenden Null.
+
+    Ganzzahlen werden als int64 summiert, damit Differenzen exakt bleiben.
+    """
+    werte = numpy.asarray(werte)
+    dtype = numpy.int64 if werte.dtype.kind in 'iub' else numpy.float64
+    form = list(werte.shape)
+    form[achse] += 1
+    summe = numpy.zeros(form, dtype=dtype)
+    ziel = [slice(None)] * werte.ndim
+    ziel[achse] = slice(1, None)
+    numpy.cumsum(werte, axis=achse, dtype=dtype, out=summe[tuple(ziel)])
+    return summe
+
+
+def _fenster_aus_kumuliert(summe, laenge, versatz=0, achse=1):
+    """Summe über die *laenge* Tage, die *versatz* Tage vor jedem Tag enden; am Anfang nur vorhandene Tage."""
+    tage = summe.shape[achse] - 1
+    ende = numpy.clip(numpy.arange(1, tage + 1) - versatz, 0, tage)
+    start = numpy.clip(ende - laenge, 0, tage)
+    return numpy.take(summe, ende, axis=achse) - numpy.take(summe, start, axis=achse)
+
+
+def gleitende_summe(werte, laenge, achse=1):
+    """
+    Summe über den Tag selbst und die *laenge*-1 Tage davor.
+
+    Die ersten Tage summieren nur über die bereits vorhandenen Tage (wie
+    'FaelleEWZ_7' im Notebook).
+    """
+    return _fenster_aus_kumuliert(kumuliert(werte, achse), laenge, achse=achse)
+
+
+def gewichtete_summe(werte, gewichte, achse=1):
+    """
+    Gewichtete Summe über die letzten len(*gewichte*) Tage.
+
+    *gewichte*[0] gilt für den Tag selbst, *gewichte*[k] für den k-ten Tag
+    davor. Mit numpy.full(7, 1 / 7) ergibt sich z.B. der 7-Tage-Mittelwert.
+    """
+    werte = numpy.moveaxis(numpy.asarray(werte, dtype=float), achse, -1)
+    ergebnis = numpy.zeros_like(werte)
+    for k, gewicht in enumerate(gewichte):
+        if gewicht and k < werte.shape[-1]:
+            ergebnis[..., k:] += gewicht * werte[..., :werte.shape[-1] - k]
+    return numpy.moveaxis(ergebnis, -1, achse)
+
+
+def verhaeltnis(werte, laenge, abstand=None, achse=1):
+    """
+    Summe der letzten *laenge* Tage geteilt durch die Summe der *laenge*
+    Tage, die *abstand* Tage (Standard: *laenge*) früher enden.
+
+    Mit laenge=4, abstand=4 ist das der 4-Tage-R-Wert des RKI, mit laenge=7,
+    abstand=4 der 7-Tage-R-Wert. Ist der Nenner 0 oder liegt das frühere
+    Fenster nicht vollständig im Cube, ist das Ergebnis NaN.
+    """
+    summe = kumuliert(werte, achse)
+    return _verhaeltnis_aus_kumuliert(summe, laenge, laenge if abstand is None else abstand, achse)
+
+
+def _verhaeltnis_aus_kumuliert(summe, laenge, abstand, achse):
+    zaehler = _fenster_aus_kumuliert(summe, laenge, achse=achse).astype(float)
+    nenner = _fenster_aus_kumuliert(summe, laenge, abstand, achse=achse).astype(float)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        r = zaehler / nenner
+    r[nenner == 0] = numpy.nan
+    unvollstaendig = [slice(None)] * r.ndim
+    unvollstaendig[achse] = slice(0, min(laenge + abstand - 1, r.shape[achse]))
+    r[tuple(unvollstaendig)] = numpy.nan
+    return r
+
+
+def berechnen(werte, ewz, kennzahlen=KENNZAHLEN):
+    """
+    Alle *kennzahlen* für ein Array (Einheiten, Tage, ...) in einem Durchlauf.
+
+    Die kumulierte Summe wird einmal gebildet und für alle ungewichteten
+    Summen und Verhältnisse verwendet. Summen werden auf 100.000 Einwohner
+    (*ewz* pro Einheit) bezogen. Liefert ein geordnetes Dict Name -> Array in
+    der Form von *werte*.
+    """
+    werte = numpy.asarray(werte)
+    ewz = numpy.asarray(ewz, dtype=float).reshape((-1,) + (1,) * (werte.ndim - 1))
+    summe = kumuliert(werte)
+    ergebnis = OrderedDict()
+    for k in kennzahlen:
+        if k.art == 'summe':
+            if k.gewichte is not None:
+                roh = gewichtete_summe(werte, k.gewichte)
+            else:
+                roh = _fenster_aus_kumuliert(summe, k.laenge)
+            ergebnis[k.name] = roh / ewz * 100000
+        elif k.art == 'verhaeltnis':
+            ergebnis[k.name] = _verhaeltnis_aus_kumuliert(summe, k.laenge, k.abstand or k.laenge, 1)
+        else:
+            raise ValueError('Unbekannte Art %r der Kennzahl %s' % (k.art, k.name))
+    return ergebnis
+
+
+def fuer_ebenen(cubes, kennzahlen=KENNZAHLEN, metrik='AnzahlFall'):
+    """
+    *kennzahlen* für alle Ebenen aus *Hierarchie.aggregieren()* zugleich.
+
+    Die Einheiten aller Ebenen werden zu einem Array gestapelt, sodass
+    Landkreise, Bundesländer und Deutschland in einem Durchlauf entstehen.
+    Liefert ein Dict Ebene -> {Name -> Array (Einheiten, Tage)}.
+    """
+    ebenen = list(cubes)
+    erster = cubes[ebenen[0]]
+    for e in ebenen[1:]:
+        if not cubes[e].dates.equals(erster.dates):
+            raise ValueError('Ebene %s hat eine andere Tagesliste als %s' % (e, ebenen[0]))
+    werte = numpy.concatenate([cubes[e].metrik(metrik) for e in ebenen])
+    ewz = numpy.concatenate([cubes[e].ewz for e in ebenen])
+    gesamt = berechnen(werte, ewz, kennzahlen)
+
+    grenzen = numpy.cumsum([0] + [len(cubes[e].ids) for e in ebenen])
+    return {e: OrderedDict((name, a[start:ende]) for name, a in gesamt.items())
+            for e, start, ende in zip(ebenen, grenzen[:-1], grenzen[1:])}
@@ -0,0 +1,374 @@
+"""
+Ergebnisse einer Auswertung in einer einzigen GeoPackage-Datei (SQLite).
+
+Das Notebook schreibt Wellenausschnitte und Geometrien einzeln mit
+spatial.to_table bzw. to_featureclass in die Results.gdb (In[77], In[79],
+In[82], ...) und liest Ergebnisse mit from_featureclass zurück; das benötigt
+arcpy und arbeitet Zeile für Zeile. Hier entsteht stattdessen eine
+GeoPackage-Datei (OGC 1.3), die QGIS, GDAL und ArcGIS Pro direkt öffnen und
+die mit dem sqlite3 der Standardbibliothek geschrieben und gelesen wird:
+
+- alle Tabellen in einer Transaktion, Zeilen blockweise mit executemany
+- Journal im WAL-Modus
+- Geometrien werden einmal als GeoPackage-Blob (Kopf mit Umgebung + WKB)
+  kodiert und in jeder Tabelle wiederverwendet, die dieselben Landkreise
+  enthält
+- R-Tree-Indizes der Umgebungen werden erst nach dem Laden aller Zeilen
+  angelegt (ohne die Trigger der Spezifikation, die SpatiaLite-Funktionen
+  voraussetzen; die Datei wird nach dem Schreiben nicht mehr geändert)
+
+    with Geopackage('results.gpkg') as gpkg:
+        geo = geometrien(kreise_df['SHAPE'])
+        gpkg.schreiben('kreise', kreise_df.drop(columns='SHAPE'), geo)
+        gpkg.schreiben('data_ewz', data_ewz)
+    geopackage.lesen('results.gpkg', 'kreise')
+"""
+
+import json
+import os
+import sqlite3
+import struct
+from collections import OrderedDict, namedtuple
+
+import numpy
+import pandas as pd
+
+from covid_analyse import tracing
+from covid_analyse.nachbarschaft import polygone
+
+
+# 'GPKG' als application_id, Version 1.3.0
+APPLICATION_ID = 0x47504B47
+USER_VERSION = 10300
+
+# Zeilen pro executemany
+BLOCK = 50000
+
+# WKB-Typen
+POLYGON, MULTIPOLYGON = 3, 6
+
+_WGS84 = ('GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563,AUTHORITY["EPSG","7030"]],'
+          'AUTHORITY["EPSG","6326"]],PRIMEM["Greenwich",0,AUTHORITY["EPSG","8901"]],'
+          'UNIT["degree",0.0174532925199433,AUTHORITY["EPSG","9122"]],AUTHORITY["EPSG","4326"]]')
+
+# Koordinatensysteme der Landkreis-Geometrien (Esri-wkid -> EPSG, Name, WKT)
+KOORDINATENSYSTEME = {
+    4326: ('WGS 84', _WGS84),
+    3857: ('WGS 84 / Pseudo-Mercator',
+           'PROJCS["WGS 84 / Pseudo-Mercator",' + _WGS84 + ',PROJECTION["Mercator_1SP"],'
+           'PARAMETER["central_meridian",0],PARAMETER["scale_factor",1],PARAMETER["false_easting",0],'
+           'PARAMETER["false_northing",0],UNIT["metre",1,AUTHORITY["EPSG","9001"]],AXIS["Easting",EAST],'
+           'AXIS["Northing",NORTH],AUTHORITY["EPSG","3857"]]'),
+    25832: ('ETRS89 / UTM zone 32N',
+            'PROJCS["ETRS89 / UTM zone 32N",GEOGCS["ETRS89",DATUM["European_Terrestrial_Reference_System_1989",'
+            'SPHEROID["GRS 1980",6378137,298.257222101,AUTHORITY["EPSG","7019"]],AUTHORITY["EPSG","6258"]],'
+            'PRIMEM["Greenwich",0,AUTHORITY["EPSG","8901"]],UNIT["degree",0.0174532925199433,'
+            'AUTHORITY["EPSG","9122"]],AUTHORITY["EPSG","4258"]],PROJECTION["Transverse_Mercator"],'
+            'PARAMETER["latitude_of_origin",0],PARAMETER["central_meridian",9],PARAMETER["scale_factor",0.9996],'
+            'PARAMETER["false_easting",500000],PARAMETER["false_northing",0],UNIT["metre",1,AUTHORITY["EPSG","9001"]],'
+            'AXIS["Easting",EAST],AXIS["Northing",NORTH],AUTHORITY["EPSG","25832"]]'),
+}
+
+# Esri-Kennungen, die einem EPSG-Code entsprechen
+WKID_EPSG = {102100: 3857, 102113: 3857}
+
+# blobs: kodierte Geometrien (object-Array); umgebung: (Geometrien, 4) als minx, maxx, miny, maxy
+Geometrien = namedtuple('Geometrien', ['blobs', 'umgebung', 'srs_id'])
+
+_SYSTEMTABELLEN = (
+    '''CREATE TABLE gpkg_spatial_ref_sys (srs_name TEXT NOT NULL, srs_id INTEGER PRIMARY KEY,
+       organization TEXT NOT NULL, organization_coordsys_id INTEGER NOT NULL, definition TEXT NOT NULL,
+       description TEXT)''',
+    '''CREATE TABLE gpkg_contents (table_name TEXT NOT NULL PRIMARY KEY, data_type TEXT NOT NULL,
+       identifier TEXT UNIQUE, description TEXT DEFAULT '',
+       last_change DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now')),
+       min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE, srs_id INTEGER,
+       CONSTRAINT fk_gc_r_srs_id FOREIGN KEY (srs_id) REFERENCES gpkg_spatial_ref_sys(srs_id))''',
+    '''CREATE TABLE gpkg_geometry_columns (table_name TEXT NOT NULL, column_name TEXT NOT NULL,
+       geometry_type_name TEXT NOT NULL, srs_id INTEGER NOT NULL, z TINYINT NOT NULL, m TINYINT NOT NULL,
+       CONSTRAINT pk_geom_cols PRIMARY KEY (table_name, column_name),
+       CONSTRAINT fk_gc_tn FOREIGN KEY (table_name) REFERENCES gpkg_contents(table_name),
+       CONSTRAINT fk_gc_srs FOREIGN KEY (srs_id) REFERENCES gpkg_spatial_ref_sys (srs_id))''',
+    '''CREATE TABLE gpkg_extensions (table_name TEXT, column_name TEXT, extension_name TEXT NOT NULL,
+       definition TEXT NOT NULL, scope TEXT NOT NULL,
+       CONSTRAINT ge_tce UNIQUE (table_name, column_name, extension_name))''',
+)
+
+
+def srs_id(shape):
+    """EPSG-Code einer Esri-JSON-Geometrie aus 'spatialReference' (latestWkid bevorzugt), sonst -1."""
+    if isinstance(shape, str):
+        shape = json.loads(shape)
+    referenz = shape.get('spatialReference', {}) if hasattr(shape, 'get') else {}
+    wkid = referenz.get('latestWkid', referenz.get('wkid'))
+    return -1 if wkid is None else WKID_EPSG.get(int(wkid), int(wkid))
+
+
+def _geschlossen(ring):
+    return ring if (ring[0] == ring[-1]).all() else numpy.vstack([ring, ring[:1]])
+
+
+def kodieren(shape, srs=None):
+    """
+    GeoPackage-Blob einer Polygon-Geometrie (Esri-JSON) als MultiPolygon und
+    ihre Umgebung (minx, maxx, miny, maxy). Leere Geometrien erhalten das
+    Leer-Flag und eine Umgebung aus NaN.
+    """
+    srs = srs_id(shape) if srs is None else srs
+    teile_polygone = polygone(shape)
+    teile = [struct.pack('<BII', 1, MULTIPOLYGON, len(teile_polygone))]
+    for polygon in teile_polygone:
+        teile.append(struct.pack('<BII', 1, POLYGON, len(polygon)))
+        for ring in polygon:
+            ring = _geschlossen(ring)
+            teile.append(struct.pack('<I', len(ring)))
+            teile.append(numpy.ascontiguousarray(ring, dtype='<f8').tobytes())
+    if teile_polygone:
+        punkte = numpy.concatenate([r for p in teile_polygone for r in p])
+        umgebung = (punkte[:, 0].min(), punkte[:, 0].max(), punkte[:, 1].min(), punkte[:, 1].max())
+        # Flags: Little Endian, Umgebung [minx, maxx, miny, maxy]
+        kopf = struct.pack('<2sBBi4d', b'GP', 0, 0b011, srs, *umgebung)
+    else:
+        umgebung = (numpy.nan,) * 4
+        kopf = struct.pack('<2sBBi', b'GP', 0, 0b10001, srs)
+    return kopf + b''.join(teile), umgebung
+
+
+def geometrien(shapes, srs=None):
+    """Kodiert alle *shapes* einmal; das Ergebnis kann in beliebig vielen Tabellen verwendet werden."""
+    shapes = list(shapes)
+    if srs is None:
+        srs = srs_id(shapes[0]) if shapes else -1
+    blobs = numpy.empty(len(shapes), dtype=object)
+    umgebung = numpy.empty((len(shapes), 4))
+    for i, shape in enumerate(shapes):
+        blobs[i], umgebung[i] = kodieren(shape, srs)
+    return Geometrien(blobs, umgebung, srs)
+
+
+def auswahl(geo, index):
+    """Geometrien in der Reihenfolge von *index*, z.B. für eine Ergebnistabelle nach AGS."""
+    return Geometrien(geo.blobs[index], geo.umgebung[index], geo.srs_id)
+
+
+def dekodieren(blob):
+    """Esri-JSON {'rings': ..., 'spatialReference': ...} aus einem GeoPackage-Blob."""
+    if blob is None:
+        return None
+    blob = bytes(blob)
+    flags = blob[3]
+    srs = struct.unpack_from('<i', blob, 4)[0]
+    umgebung_laenge = {0: 0, 1: 32, 2: 48, 3: 48, 4: 64}[(flags >> 1) & 0b111]
+    shape = {'rings': [], 'spatialReference': {'wkid': srs}}
+    if flags & 0b10000:
+        return shape
+    _wkb_ringe(memoryview(blob)[8 + umgebung_laenge:], 0, shape['rings'])
+    return shape
+
+
+def _wkb_ringe(wkb, pos, ergebnis):
+    """Hängt die Ringe eines WKB-Polygons bzw. -MultiPolygons ab *pos* an; liefert die neue Position."""
+    ordnung = '<' if wkb[pos] == 1 else '>'
+    typ, anzahl = struct.unpack_from(ordnung + 'II', wkb, pos + 1)
+    pos += 9
+    if typ % 1000 == MULTIPOLYGON:
+        for _ in range(anzahl):
+            pos = _wkb_ringe(wkb, pos, ergebnis)
+        return pos
+    if typ % 1000 != POLYGON:
+        raise ValueError('Nur Polygone werden unterstützt, nicht WKB-Typ %d' % typ)
+    for _ in range(anzahl):
+        punkte = struct.unpack_from(ordnung + 'I', wkb, pos)[0]
+        ring = numpy.frombuffer(wkb, dtype=ordnung + 'f8', count=2 * punkte, offset=pos + 4).reshape(-1, 2)
+        ergebnis.append(ring.tolist())
+        pos += 4 + 16 * punkte
+    return pos
+
+
+def _spaltentyp(spalte):
+    """SQL-Typ und Umwandlung in Python-Werte für eine Spalte eines Dataframes."""
+    kind = spalte.dtype.kind
+    if kind == 'b':
+        return 'BOOLEAN', spalte.astype(int).tolist()
+    if kind in 'iu':
+        return 'INTEGER', spalte.tolist()
+    if kind == 'f':
+        werte = spalte.astype(float)
+        return 'DOUBLE', werte.where(werte.notna(), None).tolist()
+    if kind == 'M':
+        if (spalte.dropna().dt.normalize() == spalte.dropna()).all():
+            return 'DATE', spalte.dt.strftime('%Y-%m-%d').where(spalte.notna(), None).tolist()
+        return 'DATETIME', spalte.dt.strftime('%Y-%m-%dT%H:%M:%S.%fZ').where(spalte.notna(), None).tolist()
+    werte = spalte.astype(object)
+    return 'TEXT', [None if pd.isna(w) else w if isinstance(w, str) else str(w) for w in werte]
+
+
+def _name(name):
+    return '"%s"' % str(name).replace('"', '""')
+
+
+class Geopackage:
+    """
+    Schreibt Tabellen in eine neue GeoPackage-Datei; eine vorhandene Datei wird ersetzt.
+
+    Alle Tabellen entstehen in einer Transaktion, die *schliessen()* (bzw.
+    das Verlassen des with-Blocks) nach dem Anlegen der R-Tree-Indizes
+    festschreibt.
+    """
+
+    def __init__(self, pfad, block=BLOCK):
+        self.pfad = pfad
+        self.block = block
+        for endung in ('', '-wal', '-shm'):
+            if os.path.exists(pfad + endung):
+                os.remove(pfad + endung)
+        self._db = sqlite3.connect(pfad, isolation_level=None)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('PRAGMA application_id=%d' % APPLICATION_ID)
+        self._db.execute('PRAGMA user_version=%d' % USER_VERSION)
+        self._db.execute('BEGIN')
+        for sql in _SYSTEMTABELLEN:
+            self._db.execute(sql)
+        self._db.executemany('INSERT INTO gpkg_spatial_ref_sys VALUES (?, ?, ?, ?, ?, ?)', [
+            ('Undefined cartesian SRS', -1, 'NONE', -1, 'undefined', None),
+            ('Undefined geographic SRS', 0, 'NONE', 0, 'undefined', None),
+        ] + [(name, epsg, 'EPSG', epsg, wkt, None) for epsg, (name, wkt) in sorted(KOORDINATENSYSTEME.items())])
+        self._srs = {-1, 0} | set(KOORDINATENSYSTEME)
+        self._rtrees = OrderedDict()
+        self.tabellen = []
+
+    def __repr__(self):
+        return '<Geopackage %s: %d Tabellen>' % (self.pfad, len(self.tabellen))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, typ, wert, verfolgung):
+        if typ is None:
+            self.schliessen()
+        else:
+            self._db.execute('ROLLBACK')
+            self._db.close()
+
+    def _srs_anlegen(self, srs):
+        if srs not in self._srs:
+            self._db.execute('INSERT INTO gpkg_spatial_ref_sys VALUES (?, ?, ?, ?, ?, ?)',
+                             ('EPSG:%d' % srs, srs, 'EPSG', srs, 'undefined', None))
+            self._srs.add(srs)
+
+    def schreiben(self, name, df, geo=None, beschreibung=''):
+        """
+        Legt die Tabelle *name* mit den Spalten von *df* an und fügt alle Zeilen ein.
+
+        Mit *geo* (aus *geometrien()*, eine Geometrie pro Zeile) entsteht eine
+        Feature-Tabelle mit der Spalte 'geom', sonst eine Attributtabelle.
+        """
+        if geo is not None and len(geo.blobs) != len(df):
+            raise ValueError('%d Geometrien für %d Zeilen in %s' % (len(geo.blobs), len(df), name))
+        with tracing.spanne('geopackage ' + name, 'schreiben', zeilen=len(df)):
+            typen, spalten = [], []
+            for spalte in df.columns:
+                typ, werte = _spaltentyp(df[spalte])
+                typen.append('%s %s' % (_name(spalte), typ))
+                spalten.append(werte)
+            if geo is not None:
+                typen.append('geom MULTIPOLYGON')
+                spalten.append(geo.blobs.tolist())
+            self._db.execute('CREATE TABLE %s (fid INTEGER PRIMARY KEY AUTOINCREMENT%s)' % (
+                _name(name), ''.join(', ' + t for t in typen)))
+
+            einfuegen = 'INSERT INTO %s (%s) VALUES (%s)' % (
+                _name(name), ', '.join([_name(s) for s in df.columns] + (['geom'] if geo is not None else [])),
+                ', '.join('?' * len(spalten)))
+            zeilen = list(zip(*spalten)) if spalten else [()] * len(df)
+            for start in range(0, len(zeilen), self.block):
+                self._db.executemany(einfuegen, zeilen[start:start + self.block])
+
+            if geo is None:
+                self._db.execute('INSERT INTO gpkg_contents (table_name, data_type, identifier, description) '
+                                 'VALUES (?, ?, ?, ?)', (name, 'attributes', name, beschreibung))
+            else:
+                self._srs_anlegen(geo.srs_id)
+                with numpy.errstate(invalid='ignore'):
+                    minx, maxx = numpy.nanmin(geo.umgebung[:, 0]), numpy.nanmax(geo.umgebung[:, 1])
+                    miny, maxy = numpy.nanmin(geo.umgebung[:, 2]), numpy.nanmax(geo.umgebung[:, 3])
+                self._db.execute('INSERT INTO gpkg_contents (table_name, data_type, identifier, description, min_x, '
+                                 'min_y, max_x, max_y, srs_id) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                 (name, 'features', name, beschreibung, float(minx), float(miny), float(maxx),
+                                  float(maxy), geo.srs_id))
+                self._db.execute('INSERT INTO gpkg_geometry_columns VALUES (?, ?, ?, ?, 0, 0)',
+                                 (name, 'geom', 'MULTIPOLYGON', geo.srs_id))
+                self._rtrees[name] = geo.umgebung
+        self.tabellen.append(name)
+
+    def _rtree_anlegen(self, name, umgebung):
+        """R-Tree der Umgebungen mit den fid 1..n aus *schreiben()*."""
+        rtree = 'rtree_%s_geom' % name
+        self._db.execute('CREATE VIRTUAL TABLE %s USING rtree(id, minx, maxx, miny, maxy)' % _name(rtree))
+        gueltig = numpy.flatnonzero(numpy.isfinite(umgebung).all(axis=1))
+        fid = self._db.execute('SELECT min(fid) FROM %s' % _name(name)).fetchone()[0] or 1
+        zeilen = list(zip((gueltig + fid).tolist(), *umgebung[gueltig].T.tolist()))
+        self._db.executemany('INSERT INTO %s VALUES (?, ?, ?, ?, ?)' % _name(rtree), zeilen)
+        self._db.execute("INSERT INTO gpkg_extensions VALUES (?, 'geom', 'gpkg_rtree_index', "
+                         "'http://www.geopackage.org/spec120/#extension_rtree', 'write-only')", (name,))
+
+    def schliessen(self):
+        """Legt die R-Tree-Indizes an und schreibt die Transaktion fest."""
+        with tracing.spanne('geopackage rtree', 'schreiben', tabellen=len(self._rtrees)):
+            for name, umgebung in self._rtrees.items():
+                self._rtree_anlegen(name, umgebung)
+        self._db.execute('COMMIT')
+        self._db.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+        self._db.close()
+
+
+def schreiben(pfad, tabellen, geo=None):
+    """
+    Schreibt ein Dict Name -> Dataframe in die GeoPackage-Datei *pfad*.
+
+    *geo* bildet Tabellennamen auf Geometrien ab (siehe *geometrien()*);
+    Tabellen ohne Eintrag werden Attributtabellen.
+    """
+    geo = geo or {}
+    with Geopackage(pfad) as gpkg:
+        for name, df in tabellen.items():
+            gpkg.schreiben(name, df, geo.get(name))
+    return pfad
+
+
+def tabellen(pfad):
+    """Inhaltsverzeichnis (gpkg_contents) einer GeoPackage-Datei."""
+    with sqlite3.connect(pfad) as db:
+        return pd.read_sql_query('SELECT table_name, data_type, min_x, min_y, max_x, max_y, srs_id '
+                                 'FROM gpkg_contents ORDER BY rowid', db)
+
+
+def lesen(pfad, name, umgebung=None):
+    """
+    Liest eine Tabelle als Dataframe; Geometrien werden zur Spalte 'SHAPE' im
+    Esri-JSON-Format wie bei from_featureclass, DATE/DATETIME zu Zeitstempeln.
+
+    Mit *umgebung* (minx, miny, maxx, maxy) werden über den R-Tree nur
+    Features gelesen, deren Umgebung sie schneidet.
+    """
+    with sqlite3.connect(pfad) as db:
+        info = db.execute('PRAGMA table_info(%s)' % _name(name)).fetchall()
+        if not info:
+            raise KeyError('Tabelle %r nicht in %s' % (name, pfad))
+        typen = {spalte[1]: spalte[2].upper() for spalte in info}
+        sql = 'SELECT * FROM %s' % _name(name)
+        parameter = ()
+        if umgebung is not None:
+            sql += (' WHERE fid IN (SELECT id FROM %s WHERE maxx >= ? AND minx <= ? AND maxy >= ? AND miny <= ?)'
+                    % _name('rtree_%s_geom' % name))
+            parameter = (umgebung[0], umgebung[2], umgebung[1], umgebung[3])
+        df = pd.read_sql_query(sql, db, params=parameter)
+    for spalte, typ in typen.items():
+        if typ in ('DATE', 'DATETIME'):
+            df[spalte] = pd.to_datetime(df[spalte].str.rstrip('Z'))
+        elif typ == 'BOOLEAN':
+            df[spalte] = df[spalte].astype(bool)
+    if 'geom' in df:
+        df['SHAPE'] = [dekodieren(b) for b in df.pop('geom')]
+    return df.drop(columns='fid')
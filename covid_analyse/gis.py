@@ -0,0 +1,100 @@
+"""
+Anbindung an ArcGIS mit verzögertem Import.
+
+Das Notebook importiert arcgis, arcpy und matplotlib gleich zu Beginn (In[116])
+und legt die Geodatabase an (In[117]), bevor überhaupt Daten gelesen werden.
+Hier wird arcgis bzw. arcpy erst beim ersten Aufruf einer Funktion geladen;
+Verbindungen und der Workspace werden einmal angelegt und wiederverwendet.
+Datenvorbereitung und Statistik (*cube*, *aggregation*, *analyse*, *pipeline*)
+importieren dieses Modul nicht und laufen daher ohne ArcGIS.
+"""
+
+import importlib
+import os
+
+import pandas as pd
+
+from covid_analyse import tracing
+from covid_analyse.datum import csv_lesen
+
+
+PORTAL = 'https://arcgis.services.fbbgg.hs-woe.de/arcgis'
+
+# Items aus dem ArcGIS-Hub (In[5], In[10])
+ITEM_KREISE = '917fc37a709542548cc3be077a786c17'
+ITEM_FALLDATEN = 'f10774f1c63e40168479a1feb6c7ca74'
+
+_module = {}
+_verbindungen = {}
+_workspaces = {}
+
+
+def _modul(name):
+    """Importiert *name* beim ersten Zugriff."""
+    if name not in _module:
+        try:
+            with tracing.spanne('import ' + name, 'import'):
+                _module[name] = importlib.import_module(name)
+        except ImportError as fehler:
+            raise ImportError('%s ist nicht installiert; die Funktion benötigt die ArcGIS-Umgebung' % name) \
+                from fehler
+    return _module[name]
+
+
+def verbindung(url=PORTAL):
+    """GIS-Verbindung (In[119]); mit url=None anonym zu ArcGIS Online wie *agol_gis* (In[5])."""
+    if url not in _verbindungen:
+        gis = _modul('arcgis.gis')
+        with tracing.spanne('GIS', 'fern', url=url or 'arcgis.com'):
+            _verbindungen[url] = gis.GIS(url) if url else gis.GIS(set_active=False)
+    return _verbindungen[url]
+
+
+def workspace(home='home'):
+    """
+    Pfad der Geodatabase Results.gdb in *home*; legt sie bei Bedarf an und
+    setzt arcpy.env.workspace (In[117], In[118]).
+    """
+    home = os.path.abspath(home)
+    if home not in _workspaces:
+        arcpy = _modul('arcpy')
+        gdb = os.path.join(home, 'Results.gdb')
+        if not arcpy.Exists(gdb):
+            with tracing.spanne('CreateFileGDB', 'io'):
+                arcpy.CreateFileGDB_management(home, 'Results.gdb')
+        _workspaces[home] = gdb
+    _modul('arcpy').env.workspace = _workspaces[home]
+    return _workspaces[home]
+
+
+def kreise_laden(item_id=ITEM_KREISE):
+    """Landkreise des RKI als spatially-enabled Dataframe (In[5], In[7])."""
+    _modul('arcgis.features')
+    item = verbindung(None).content.get(item_id)
+    with tracing.spanne('from_layer', 'fern', item=item_id) as spanne:
+        kreise_df = pd.DataFrame.spatial.from_layer(item.layers[0])
+        spanne.zeilen(aus=len(kreise_df))
+    return kreise_df
+
+
+def falldaten_laden(item_id=ITEM_FALLDATEN):
+    """Falldaten wie *data_df* nach In[11], Datumsangaben als Tagesnummern."""
+    item = verbindung(None).content.get(item_id)
+    with tracing.spanne('get_data', 'fern', item=item_id) as spanne:
+        pfad = item.get_data()
+        spanne.bytes(os.path.getsize(pfad))
+    return csv_lesen(pfad)
+
+
+def hochladen(sdf, titel, gis=None, tags=('Corona', 'COVID-19'), ordner='Masterprojekt'):
+    """
+    Veröffentlicht *sdf* als Feature Layer *titel* (z.B. In[39]); vorhandene
+    Items mit diesem Titel werden vorher gelöscht.
+    """
+    _modul('arcgis.features')
+    gis = gis or verbindung()
+    for item in gis.content.search(query=titel):
+        item.delete()
+    with tracing.spanne('to_featurelayer', 'fern', titel=titel) as spanne:
+        spanne.zeilen(len(sdf))
+        return sdf.spatial.to_featurelayer(titel, gis=gis, tags=list(tags), folder=ordner)
@@ -0,0 +1,94 @@
+"""
+Empirical-Bayes-Glättung der Inzidenzen kleiner Landkreise.
+
+Die Inzidenzen aus In[31] sind Fallzahlen geteilt durch 'EWZ'. Bei kleinen
+Landkreisen schwanken sie stark von Tag zu Tag, was Hot Spots und Ausreißer
+verrauscht. Die Empirical-Bayes-Schätzer ziehen jede Rate umso stärker zu
+einem Referenzwert, je kleiner die Bevölkerung ist (Momentenschätzer nach
+Marshall 1991):
+
+    b   = Summe Fälle / Summe Einwohner          (Referenzrate)
+    s2  = gewichtete Varianz der Raten um b
+    a   = max(s2 - b / mittlere Einwohnerzahl, 0)
+    C_i = a / (a + b / n_i)
+    geglättet_i = C_i * r_i + (1 - C_i) * b
+
+Global ist die Referenz ganz Deutschland, räumlich die Nachbarschaft des
+Landkreises einschließlich seiner selbst. Alle Größen entstehen für alle
+Landkreise und Tage zugleich; die räumlichen Summen sind Produkte mit der
+dünn besetzten Nachbarschaftsmatrix (siehe *nachbarschaft*).
+"""
+
+import numpy
+from scipy import sparse
+
+from covid_analyse.fenster import gleitende_summe
+
+
+# Analysefelder für Hot Spots, Ausreißer und Space-Time Cubes
+ANALYSEFELDER = ('inzidenz', 'eb_global', 'eb_raeumlich')
+
+
+def eb_global(faelle, ewz):
+    """
+    Globale Empirical-Bayes-Raten (pro Einwohner) für jede Spalte von *faelle*
+    (Einheiten, ...).
+    """
+    y = numpy.asarray(faelle, dtype=float)
+    n = numpy.asarray(ewz, dtype=float).reshape((-1,) + (1,) * (y.ndim - 1))
+    r = y / n
+    b = y.sum(axis=0) / n.sum()
+    s2 = (n * (r - b) ** 2).sum(axis=0) / n.sum()
+    a = numpy.maximum(s2 - b / n.mean(), 0)
+    return _schrumpfen(r, b, a, n)
+
+
+def eb_raeumlich(faelle, ewz, gewichte):
+    """
+    Räumliche Empirical-Bayes-Raten (pro Einwohner): Referenzrate und
+    Varianz stammen aus dem Landkreis und seinen Nachbarn laut *gewichte*.
+    """
+    y = numpy.asarray(faelle, dtype=float)
+    eindim = y.ndim == 1
+    if eindim:
+        y = y[:, None]
+    form = y.shape
+    y = y.reshape(form[0], -1)
+    n = numpy.asarray(ewz, dtype=float)
+    umgebung = sparse.csr_matrix(gewichte, dtype=bool).astype(float) + sparse.identity(len(n), format='csr')
+
+    summe_n = umgebung @ n
+    anzahl = numpy.asarray(umgebung.sum(axis=1)).ravel()
+    b = (umgebung @ y) / summe_n[:, None]
+    # Summe n_j (r_j - b_i)^2 / Summe n_j = Summe (y_j^2 / n_j) / Summe n_j - b_i^2
+    s2 = (umgebung @ (y ** 2 / n[:, None])) / summe_n[:, None] - b ** 2
+    a = numpy.maximum(s2 - b / (summe_n / anzahl)[:, None], 0)
+    ergebnis = _schrumpfen(y / n[:, None], b, a, n[:, None]).reshape(form)
+    return ergebnis[:, 0] if eindim else ergebnis
+
+
+def _schrumpfen(r, b, a, n):
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        c = a / (a + b / n)
+    c = numpy.where(numpy.isfinite(c), c, 1.0)
+    return c * r + (1 - c) * b
+
+
+def inzidenz(cube, art='inzidenz', gewichte=None, fenster=7, metrik='AnzahlFall'):
+    """
+    7-Tage-Inzidenz (bzw. *fenster* Tage) einer Kennzahl als Array (Einheiten, Tage).
+
+    *art* ist eines der ANALYSEFELDER: 'inzidenz' wie 'FaelleEWZ_7',
+    'eb_global' oder 'eb_raeumlich' (benötigt *gewichte* in der Reihenfolge
+    von *cube.ids*).
+    """
+    if art == 'inzidenz':
+        return cube.inzidenz(fenster)[:, :, cube.metriken.index(metrik)]
+    faelle = gleitende_summe(cube.metrik(metrik), fenster)
+    if art == 'eb_global':
+        return eb_global(faelle, cube.ewz) * 100000
+    if art == 'eb_raeumlich':
+        if gewichte is None:
+            raise ValueError('Räumliche Glättung benötigt eine Nachbarschaftsmatrix')
+        return eb_raeumlich(faelle, cube.ewz, gewichte) * 100000
+    raise ValueError('Unbekanntes Analysefeld %r (verfügbar: %s)' % (art, ', '.join(ANALYSEFELDER)))
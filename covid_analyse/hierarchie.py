@@ -0,0 +1,128 @@
+"""
+Räumliche Hierarchie Landkreis -> Bundesland -> Deutschland.
+
+Jede Ebene wird als dünn besetzte Aggregationsmatrix (Gruppen x Landkreise)
+abgelegt. Alle Ebenen werden übereinandergestapelt, sodass die Zahlen sämtlicher
+Ebenen mit einem einzigen Matrixprodukt aus dem Landkreis-Cube entstehen. Damit
+sind die Ebenen immer konsistent und die zweite Aggregation auf Bundesländer
+(In[24]) sowie deren eigene Inzidenzschleife (In[28]) entfallen.
+"""
+
+import numpy
+import pandas as pd
+from scipy import sparse
+
+from covid_analyse.cube import Cube
+
+
+class Hierarchie:
+    """
+    Ebenen oberhalb der Landkreise als Aggregationsmatrizen.
+
+    Standardmäßig gibt es die Ebenen 'kreis', 'bundesland' (über die ersten
+    beiden Stellen des AGS) und 'deutschland'. Weitere Gruppierungen können
+    über *ebene_hinzufuegen()* ergänzt werden.
+    """
+
+    def __init__(self, ags):
+        self.ags = numpy.asarray(ags)
+        self._ebenen = {}
+        self._ewz = {}
+        self._gestapelt = None
+        self.ebene_hinzufuegen('kreis', self.ags)
+        self.ebene_hinzufuegen('bundesland', numpy.array([a[:2] for a in self.ags]))
+        self.ebene_hinzufuegen('deutschland', numpy.full(len(self.ags), 'DE'))
+
+    @classmethod
+    def aus_kreisen(cls, kreise_ewz):
+        """
+        Hierarchie mit den Einwohnerzahlen der Bundesländer aus 'EWZ_BL'.
+
+        *kreise_ewz* ist das Dataframe aus In[19] mit 'AGS', 'EWZ' und 'EWZ_BL'.
+        """
+        kreise_ewz = kreise_ewz.drop_duplicates('AGS')
+        ags = kreise_ewz['AGS'].astype(str).str.zfill(5)
+        hierarchie = cls(numpy.sort(ags.to_numpy()))
+        ewz_bl = kreise_ewz.groupby(ags.str[:2])['EWZ_BL'].first()
+        hierarchie.ewz_setzen('bundesland', ewz_bl.to_dict())
+        return hierarchie
+
+    @property
+    def ebenen(self):
+        return list(self._ebenen)
+
+    def ebene_hinzufuegen(self, name, zuordnung):
+        """
+        Ergänzt eine Gruppierung der Landkreise.
+
+        *zuordnung* ist entweder eine Gruppe pro Landkreis (in der Reihenfolge
+        von *ags*) oder ein Dictionary AGS -> Gruppe. Landkreise ohne Gruppe
+        werden in dieser Ebene nicht berücksichtigt.
+        """
+        if isinstance(zuordnung, dict):
+            zuordnung = numpy.array([zuordnung.get(a) for a in self.ags], dtype=object)
+        zuordnung = numpy.asarray(zuordnung)
+        if len(zuordnung) != len(self.ags):
+            raise ValueError('Zuordnung hat %d Einträge, erwartet %d' % (len(zuordnung), len(self.ags)))
+
+        vorhanden = pd.notnull(zuordnung)
+        labels, gruppe = numpy.unique(zuordnung[vorhanden].astype(str), return_inverse=True)
+        spalten = numpy.flatnonzero(vorhanden)
+        matrix = sparse.csr_matrix(
+            (numpy.ones(len(spalten)), (gruppe, spalten)), shape=(len(labels), len(self.ags)))
+        self._ebenen[name] = (labels, matrix)
+        self._gestapelt = None
+
+    def ewz_setzen(self, name, ewz):
+        """
+        Amtliche Einwohnerzahlen einer Ebene (Dictionary Gruppe -> EWZ).
+
+        Ohne Angabe wird die Summe der Landkreise verwendet.
+        """
+        self._ewz[name] = dict(ewz)
+
+    def matrix(self, name):
+        """Aggregationsmatrix (Gruppen x Landkreise) einer Ebene."""
+        return self._ebenen[name][1]
+
+    def labels(self, name):
+        return self._ebenen[name][0]
+
+    def _stapel(self, ebenen):
+        if self._gestapelt is None or self._gestapelt[0] != ebenen:
+            matrix = sparse.vstack([self._ebenen[e][1] for e in ebenen], format='csr')
+            grenzen = numpy.cumsum([0] + [self._ebenen[e][1].shape[0] for e in ebenen])
+            self._gestapelt = (ebenen, matrix, grenzen)
+        return self._gestapelt[1:]
+
+    def aggregieren(self, cube, ebenen=None):
+        """
+        Fasst einen Landkreis-Cube auf alle (oder die angegebenen) Ebenen zusammen.
+
+        Die Zahlen aller Ebenen entstehen in einem einzigen dünn besetzten
+        Matrixprodukt. Zurückgegeben wird ein Dictionary Ebene -> Cube.
+        """
+        if cube.ebene != 'kreis':
+            raise ValueError('Nur Landkreis-Cubes können aggregiert werden, nicht %r' % cube.ebene)
+        if not numpy.array_equal(cube.ids, self.ags):
+            reihenfolge = cube.index(self.ags)
+            cube = Cube(self.ags, cube.dates, cube.alle_werte[:, reihenfolge], cube.ewz[reihenfolge],
+                        cube.metriken, zeitachsen=cube.zeitachsen, zeitachse=cube.zeitachse)
+        ebenen = tuple(ebenen or self._ebenen)
+        matrix, grenzen = self._stapel(ebenen)
+
+        # Alle Zeitachsen, Tage und Kennzahlen als Spalten einer Matrix
+        a, n, t, m = cube.alle_werte.shape
+        werte = matrix @ cube.alle_werte.transpose(1, 0, 2, 3).reshape(n, a * t * m)
+        ewz = matrix @ cube.ewz
+
+        ergebnis = {}
+        for e, start, ende in zip(ebenen, grenzen[:-1], grenzen[1:]):
+            labels = self._ebenen[e][0]
+            ewz_e = ewz[start:ende]
+            if e in self._ewz:
+                ewz_e = numpy.array([self._ewz[e].get(l, s) for l, s in zip(labels, ewz_e)], dtype=float)
+            werte_e = werte[start:ende].reshape(-1, a, t, m).transpose(1, 0, 2, 3)
+            ergebnis[e] = Cube(labels, cube.dates, werte_e.astype(cube.alle_werte.dtype), ewz_e, cube.metriken,
+                               ebene=e, zeitachsen=cube.zeitachsen, zeitachse=cube.zeitachse)
+        return ergebnis
@@ -0,0 +1,407 @@
+"""
+Vektorkacheln der Landkreise mit Tageswerten als getrennten Attributdateien.
+
+Für jede Tageskarte legt das Notebook einen neuen Feature-Layer mit allen
+Geometrien an (In[39], In[47], ...). Hier werden die Landkreis-Polygone
+einmal pro Zoomstufe in Vektorkacheln (Mapbox Vector Tile 2.1, Protobuf von
+Hand kodiert) zerlegt; die Kacheln enthalten nur Geometrie, AGS und Namen.
+Die Werte jedes Tages stehen in einer kleinen JSON-Datei, deren Schlüssel die
+Feature-IDs der Kacheln sind (der AGS als Zahl). Ein Web-Client lädt die
+Kacheln einmal und für jeden Tag nur noch wenige Kilobyte, z.B. um die ganze
+Pandemie als Animation über feature-state einzufärben.
+
+Ablage in *verzeichnis*:
+
+    index.json            TileJSON 3.0 mit Zoomstufen, Tagen und Feldern
+    {z}/{x}/{y}.pbf       Kacheln (Layer 'kreise')
+    tage/{datum}.json     {"1001": 123.4, ...} bzw. Listen bei mehreren Feldern
+
+Die Kandidaten pro Kachel liefert der R-Baum aus *verortung*; jedes Polygon
+wird an der Kachel (mit Puffer) nach Sutherland-Hodgman abgeschnitten und auf
+das ganzzahlige Kachelraster gerundet; dabei zusammenfallende Punkte werden
+entfernt, was die Kacheln auf niedrigen Zoomstufen klein hält.
+"""
+
+import json
+import os
+from collections import OrderedDict
+
+import numpy
+
+from covid_analyse import tracing
+from covid_analyse.nachbarschaft import flaeche, polygone
+from covid_analyse.verortung import RBaum
+
+
+ZOOM = (4, 9)
+
+# Auflösung und Puffer einer Kachel in Kachelkoordinaten
+EXTENT = 4096
+PUFFER = 64
+
+LAYER = 'kreise'
+
+# Halbe Breite der Web-Mercator-Welt in Metern
+WELT = 20037508.342789244
+
+# Befehle der Geometriekodierung
+MOVE_TO, LINE_TO, CLOSE_PATH = 1, 2, 7
+
+
+def kachelgroesse(z):
+    """Kantenlänge einer Kachel der Zoomstufe *z* in Metern (Web Mercator)."""
+    return 2 * WELT / 2 ** z
+
+
+def kachelbereich(umgebung, z):
+    """Kleinste und größte Kachelnummer (x0, x1, y0, y1) für eine Umgebung (minx, maxx, miny, maxy)."""
+    groesse, anzahl = kachelgroesse(z), 2 ** z
+    x0 = int(numpy.clip((umgebung[0] + WELT) // groesse, 0, anzahl - 1))
+    x1 = int(numpy.clip((umgebung[1] + WELT) // groesse, 0, anzahl - 1))
+    y0 = int(numpy.clip((WELT - umgebung[3]) // groesse, 0, anzahl - 1))
+    y1 = int(numpy.clip((WELT - umgebung[2]) // groesse, 0, anzahl - 1))
+    return x0, x1, y0, y1
+
+
+def kachelumgebung(z, x, y):
+    """Umgebung (minx, maxx, miny, maxy) der Kachel in Metern."""
+    groesse = kachelgroesse(z)
+    minx, maxy = -WELT + x * groesse, WELT - y * groesse
+    return minx, minx + groesse, maxy - groesse, maxy
+
+
+# Protobuf
+
+def _varints(werte):
+    """Varint-Kodierung eines Arrays nichtnegativer Ganzzahlen."""
+    werte = numpy.asarray(werte, dtype=numpy.uint64).ravel()
+    laenge = numpy.ones(len(werte), dtype=numpy.intp)
+    for k in range(1, 10):
+        laenge += werte >= numpy.uint64(1) << numpy.uint64(7 * k)
+    ergebnis = numpy.empty(int(laenge.sum()), dtype=numpy.uint8)
+    position = numpy.cumsum(laenge) - laenge
+    for k in range(int(laenge.max()) if len(werte) else 0):
+        auswahl = laenge > k
+        byte = (werte[auswahl] >> numpy.uint64(7 * k)) & numpy.uint64(0x7F)
+        byte |= numpy.where(laenge[auswahl] > k + 1, numpy.uint64(0x80), numpy.uint64(0))
+        ergebnis[position[auswahl] + k] = byte
+    return ergebnis.tobytes()
+
+
+def _varint(wert):
+    """Varint-Kodierung einer einzelnen Zahl (Feldköpfe, Längen, IDs)."""
+    teile = bytearray()
+    while wert > 0x7F:
+        teile.append((wert & 0x7F) | 0x80)
+        wert >>= 7
+    teile.append(wert)
+    return bytes(teile)
+
+
+def _zigzag(werte):
+    werte = numpy.asarray(werte, dtype=numpy.int64)
+    return ((werte << 1) ^ (werte >> 63)).astype(numpy.uint64)
+
+
+def _feld(nummer, daten):
+    """Feld *nummer* mit Länge und Inhalt (Wire-Typ 2)."""
+    return _varint((nummer << 3) | 2) + _varint(len(daten)) + daten
+
+
+def _zahl(nummer, wert):
+    """Feld *nummer* als Varint (Wire-Typ 0)."""
+    return _varint(nummer << 3) + _varint(wert)
+
+
+def _ringbefehle(ringe):
+    """Befehle und Parameter der Geometrie aus Ringen in ganzzahligen Kachelkoordinaten."""
+    teile, cursor = [], numpy.zeros(2, dtype=numpy.int64)
+    for ring in ringe:
+        delta = numpy.diff(numpy.vstack([cursor, ring]), axis=0)
+        cursor = ring[-1]
+        zickzack = _zigzag(delta).reshape(-1, 2)
+        teile += [numpy.array([MOVE_TO | (1 << 3)], dtype=numpy.uint64), zickzack[0],
+                  numpy.array([LINE_TO | ((len(ring) - 1) << 3)], dtype=numpy.uint64), zickzack[1:].ravel(),
+                  numpy.array([CLOSE_PATH | (1 << 3)], dtype=numpy.uint64)]
+    return numpy.concatenate(teile) if teile else numpy.empty(0, dtype=numpy.uint64)
+
+
+def _wert(text):
+    """Value-Nachricht mit string_value."""
+    return _feld(1, text.encode('utf-8'))
+
+
+def layer_kodieren(name, features, schluessel, extent=EXTENT):
+    """
+    Layer-Nachricht aus *features* [(id, {Schlüssel: Text}, Ringe)], deren
+    Eigenschaften Texte aus *schluessel* sind.
+    """
+    werte, teile = OrderedDict(), []
+    for kennung, eigenschaften, ringe in features:
+        tags = []
+        for k, text in eigenschaften.items():
+            tags += [schluessel.index(k), werte.setdefault(text, len(werte))]
+        teile.append(_feld(2, _zahl(1, kennung) + _feld(2, _varints(tags)) + _zahl(3, 3)
+                           + _feld(4, _varints(_ringbefehle(ringe)))))
+    teile += [_feld(3, k.encode('utf-8')) for k in schluessel]
+    teile += [_feld(4, _wert(text)) for text in werte]
+    return _feld(1, name.encode('utf-8')) + b''.join(teile) + _zahl(5, extent) + _zahl(15, 2)
+
+
+def _varint_lesen(daten, pos):
+    wert, verschiebung = 0, 0
+    while True:
+        byte = daten[pos]
+        wert |= (byte & 0x7F) << verschiebung
+        pos += 1
+        if byte < 0x80:
+            return wert, pos
+        verschiebung += 7
+
+
+def _nachricht(daten):
+    """Felder (Nummer, Wert) einer Protobuf-Nachricht; Wire-Typ 2 als bytes."""
+    pos = 0
+    while pos < len(daten):
+        schluessel, pos = _varint_lesen(daten, pos)
+        if schluessel & 7 == 0:
+            wert, pos = _varint_lesen(daten, pos)
+        elif schluessel & 7 == 2:
+            laenge, pos = _varint_lesen(daten, pos)
+            wert, pos = daten[pos:pos + laenge], pos + laenge
+        else:
+            raise ValueError('Wire-Typ %d wird nicht unterstützt' % (schluessel & 7))
+        yield schluessel >> 3, wert
+
+
+def _gepackt(daten):
+    werte, pos = [], 0
+    while pos < len(daten):
+        wert, pos = _varint_lesen(daten, pos)
+        werte.append(wert)
+    return werte
+
+
+def dekodieren(daten):
+    """
+    Inhalt einer Kachel als {Layer: [(id, {Schlüssel: Wert}, Ringe)]} mit Ringen
+    in Kachelkoordinaten, z.B. zur Kontrolle der erzeugten Dateien.
+    """
+    ergebnis = OrderedDict()
+    for nummer, layer in _nachricht(bytes(daten)):
+        if nummer != 3:
+            continue
+        felder = list(_nachricht(layer))
+        name = next(bytes(w).decode('utf-8') for n, w in felder if n == 1)
+        schluessel = [bytes(w).decode('utf-8') for n, w in felder if n == 3]
+        werte = [bytes(dict(_nachricht(w))[1]).decode('utf-8') for n, w in felder if n == 4]
+        features = []
+        for n, feature in felder:
+            if n != 2:
+                continue
+            inhalt = dict(_nachricht(feature))
+            tags = _gepackt(inhalt.get(2, b''))
+            befehle = _gepackt(inhalt.get(4, b''))
+            ringe, ring, cursor, pos = [], [], [0, 0], 0
+            while pos < len(befehle):
+                befehl, anzahl = befehle[pos] & 7, befehle[pos] >> 3
+                pos += 1
+                if befehl == CLOSE_PATH:
+                    ringe.append(ring)
+                    ring = []
+                    continue
+                for _ in range(anzahl):
+                    dx, dy = befehle[pos], befehle[pos + 1]
+                    cursor = [cursor[0] + ((dx >> 1) ^ -(dx & 1)), cursor[1] + ((dy >> 1) ^ -(dy & 1))]
+                    ring.append(cursor)
+                    pos += 2
+            features.append((inhalt.get(1), {schluessel[tags[i]]: werte[tags[i + 1]]
+                                             for i in range(0, len(tags), 2)}, ringe))
+        ergebnis[name] = features
+    return ergebnis
+
+
+# Geometrie
+
+def _abschneiden(ring, minimum, maximum):
+    """Sutherland-Hodgman: Ring (Punkte, 2) an den Kanten des Quadrats [minimum, maximum]^2."""
+    if ((ring >= minimum) & (ring <= maximum)).all():
+        return ring
+    for achse, grenze, innen_groesser in ((0, minimum, True), (0, maximum, False),
+                                          (1, minimum, True), (1, maximum, False)):
+        if len(ring) == 0:
+            break
+        folgend = numpy.roll(ring, -1, axis=0)
+        innen = ring[:, achse] >= grenze if innen_groesser else ring[:, achse] <= grenze
+        innen_folgend = numpy.roll(innen, -1)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            t = (grenze - ring[:, achse]) / (folgend[:, achse] - ring[:, achse])
+            schnitt = ring + t[:, None] * (folgend - ring)
+        # Pro Kante: Schnittpunkt beim Wechsel, danach der Endpunkt, falls innen
+        kandidaten = numpy.stack([schnitt, folgend], axis=1).reshape(-1, 2)
+        behalten = numpy.column_stack([innen != innen_folgend, innen_folgend]).ravel()
+        ring = kandidaten[behalten]
+    return ring
+
+
+def _kachelringe(polygone_, umgebung, extent, puffer):
+    """Ringe aller Polygone in ganzzahligen Koordinaten der Kachel, abgeschnitten und richtig orientiert."""
+    minx, maxx, _, maxy = umgebung
+    faktor = extent / (maxx - minx)
+    ergebnis = []
+    for polygon in polygone_:
+        for nummer, ring in enumerate(polygon):
+            if (ring[0] == ring[-1]).all():
+                ring = ring[:-1]
+            punkte = numpy.column_stack([(ring[:, 0] - minx) * faktor, (maxy - ring[:, 1]) * faktor])
+            punkte = numpy.round(_abschneiden(punkte, -puffer, extent + puffer)).astype(numpy.int64)
+            if len(punkte):
+                punkte = punkte[(numpy.diff(punkte, axis=0, append=punkte[:1]) != 0).any(axis=1)]
+            if len(punkte) < 3:
+                if nummer == 0:
+                    break
+                continue
+            groesse = flaeche(punkte.astype(float))
+            if groesse == 0:
+                if nummer == 0:
+                    break
+                continue
+            # Außenringe mit positiver Fläche in Kachelkoordinaten (y nach unten), Löcher negativ
+            if (groesse > 0) != (nummer == 0):
+                punkte = punkte[::-1]
+            ergebnis.append(punkte)
+    return ergebnis
+
+
+def umgebungen(teile):
+    """Umgebung (minx, maxx, miny, maxy) jeder Liste von Polygonen aus *polygone()*; NaN ohne Ringe."""
+    umgebung = numpy.full((len(teile), 4), numpy.nan)
+    for i, polygon in enumerate(teile):
+        if polygon:
+            punkte = numpy.concatenate([r for p in polygon for r in p])
+            umgebung[i] = punkte[:, 0].min(), punkte[:, 0].max(), punkte[:, 1].min(), punkte[:, 1].max()
+    return umgebung
+
+
+def kennungen(ags):
+    """Feature-IDs: der AGS als Zahl, bei nicht numerischen AGS die laufende Nummer ab 1."""
+    ags = [str(a) for a in ags]
+    if all(a.isdigit() for a in ags):
+        return [int(a) for a in ags]
+    return list(range(1, len(ags) + 1))
+
+
+def kacheln_schreiben(verzeichnis, shapes, ids, eigenschaften=None, zoom=ZOOM, extent=EXTENT, puffer=PUFFER,
+                      layer=LAYER):
+    """
+    Zerlegt *shapes* (Esri-JSON in Web Mercator) in Kacheln der Zoomstufen
+    zoom[0] bis zoom[1]. *eigenschaften* ist ein Dict Name -> Texte pro
+    Polygon. Liefert die Anzahl der Kacheln pro Zoomstufe.
+    """
+    teile = [polygone(s) for s in shapes]
+    umgebung = umgebungen(teile)
+    gueltig = numpy.flatnonzero(numpy.isfinite(umgebung).all(axis=1))
+    baum = RBaum(umgebung[gueltig])
+    eigenschaften = eigenschaften or {}
+    schluessel = list(eigenschaften)
+    anzahl = OrderedDict()
+
+    for z in range(zoom[0], zoom[1] + 1):
+        with tracing.spanne('kacheln z%d' % z, 'kacheln'):
+            kacheln = set()
+            for u in umgebung[gueltig]:
+                x0, x1, y0, y1 = kachelbereich(u, z)
+                kacheln.update((x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+            kacheln = sorted(kacheln)
+            rand = puffer / extent * kachelgroesse(z)
+            abfrage = numpy.array([kachelumgebung(z, x, y) for x, y in kacheln]).reshape(-1, 4)
+            kachel, polygon = baum.suchen(abfrage + [-rand, rand, -rand, rand])
+            polygon = gueltig[polygon]
+            reihenfolge = numpy.lexsort((polygon, kachel))
+            kachel, polygon = kachel[reihenfolge], polygon[reihenfolge]
+            grenzen = numpy.searchsorted(kachel, numpy.arange(len(kacheln) + 1))
+
+            geschrieben = 0
+            for k, (x, y) in enumerate(kacheln):
+                features = []
+                for p in polygon[grenzen[k]:grenzen[k + 1]]:
+                    ringe = _kachelringe(teile[p], abfrage[k], extent, puffer)
+                    if ringe:
+                        features.append((ids[p], {s: str(eigenschaften[s][p]) for s in schluessel}, ringe))
+                if not features:
+                    continue
+                pfad = os.path.join(verzeichnis, str(z), str(x), '%d.pbf' % y)
+                os.makedirs(os.path.dirname(pfad), exist_ok=True)
+                with open(pfad, 'wb') as f:
+                    f.write(_feld(3, layer_kodieren(layer, features, schluessel, extent)))
+                geschrieben += 1
+            anzahl[z] = geschrieben
+    return anzahl
+
+
+def tage_schreiben(verzeichnis, ids, dates, felder, stellen=1):
+    """
+    Eine JSON-Datei pro Tag mit den Werten aller Einheiten, Schlüssel ist die
+    Feature-ID. *felder* bildet Namen auf Arrays (Einheiten, Tage) ab; bei
+    einem Feld ist jeder Eintrag eine Zahl, sonst eine Liste in der
+    Reihenfolge der Felder. Fehlende Werte (NaN) werden null.
+    """
+    os.makedirs(os.path.join(verzeichnis, 'tage'), exist_ok=True)
+    werte = numpy.stack([numpy.round(numpy.asarray(a, dtype=float), stellen) for a in felder.values()], axis=-1)
+    schluessel = [str(k) for k in ids]
+    namen = []
+    with tracing.spanne('kacheln tage', 'kacheln', tage=len(dates)):
+        for t, datum in enumerate(dates):
+            tag = werte[:, t, :].tolist()
+            tag = [[None if w != w else w for w in zeile] for zeile in tag]
+            inhalt = dict(zip(schluessel, (z[0] for z in tag) if len(felder) == 1 else tag))
+            name = '%s.json' % datum.strftime('%Y-%m-%d')
+            with open(os.path.join(verzeichnis, 'tage', name), 'w') as f:
+                json.dump(inhalt, f, separators=(',', ':'))
+            namen.append(name)
+    return namen
+
+
+def _grad(x, y):
+    """Web Mercator in Länge und Breite (Grad)."""
+    return numpy.degrees(x / 6378137.0), numpy.degrees(2 * numpy.arctan(numpy.exp(y / 6378137.0)) - numpy.pi / 2)
+
+
+def schreiben(verzeichnis, kreise_df, dates, felder, ids=None, zoom=ZOOM, extent=EXTENT, puffer=PUFFER, stellen=1):
+    """
+    Kacheln der Landkreise aus *kreise_df* (AGS, GEN, SHAPE) und Tageswerte aus
+    *felder* (Name -> Array (Einheiten, Tage) in der Reihenfolge von *ids*,
+    Standard: kreise_df['AGS']) samt index.json; liefert deren Pfad.
+    """
+    ags = kreise_df['AGS'].astype(str).to_numpy()
+    kennung = kennungen(ags)
+    eigenschaften = OrderedDict([('AGS', ags)])
+    if 'GEN' in kreise_df:
+        eigenschaften['GEN'] = kreise_df['GEN'].astype(str).to_numpy()
+    anzahl = kacheln_schreiben(verzeichnis, kreise_df['SHAPE'], kennung, eigenschaften, zoom, extent, puffer)
+
+    if ids is not None:
+        # Werte auf die Reihenfolge von kreise_df bringen
+        position = {str(k): i for i, k in enumerate(ids)}
+        index = numpy.array([position[a] for a in ags])
+        felder = OrderedDict((name, numpy.asarray(a)[index]) for name, a in felder.items())
+    tage = tage_schreiben(verzeichnis, kennung, dates, felder, stellen)
+
+    umgebung = umgebungen([polygone(s) for s in kreise_df['SHAPE']])
+    west, sued = _grad(numpy.nanmin(umgebung[:, 0]), numpy.nanmin(umgebung[:, 2]))
+    ost, nord = _grad(numpy.nanmax(umgebung[:, 1]), numpy.nanmax(umgebung[:, 3]))
+    index = OrderedDict([
+        ('tilejson', '3.0.0'),
+        ('tiles', ['{z}/{x}/{y}.pbf']),
+        ('minzoom', zoom[0]), ('maxzoom', zoom[1]),
+        ('bounds', [round(float(v), 5) for v in (west, sued, ost, nord)]),
+        ('vector_layers', [{'id': LAYER, 'fields': {k: 'String' for k in eigenschaften},
+                            'minzoom': zoom[0], 'maxzoom': zoom[1]}]),
+        ('kacheln', {str(z): n for z, n in anzahl.items()}),
+        ('felder', list(felder)),
+        ('tage', ['tage/' + t for t in tage]),
+    ])
+    pfad = os.path.join(verzeichnis, 'index.json')
+    with open(pfad, 'w') as f:
+        json.dump(index, f, indent=1)
+    return pfad
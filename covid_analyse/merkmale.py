@@ -0,0 +1,176 @@
+"""
+Fallzahlen nach Landkreis, Altersgruppe und Geschlecht.
+
+Das Notebook verwirft 'Altersgruppe' und 'Geschlecht' bei der Aggregation
+(In[17]), weil eine dichte Aufteilung sehr groß würde: 412 Landkreise x 7
+Altersgruppen x 3 Geschlechter x über 700 Tage, von denen die meisten Zellen 0
+sind. Der MerkmalsCube legt die Zahlen daher dünn besetzt ab: pro Zeitachse und
+Kennzahl eine CSR-Matrix mit einer Zeile pro Kombination (Landkreis,
+Altersgruppe, Geschlecht) und einer Spalte pro Tag.
+
+Summen über beliebige Merkmale entstehen über dünn besetzte
+Gruppierungsmatrizen wie in *hierarchie*, gleitende Inzidenzen über eine
+Bandmatrix auf der Tagesachse, ohne die Nullen je aufzufüllen.
+"""
+
+import numpy
+import pandas as pd
+from scipy import sparse
+
+from covid_analyse.cube import Cube, METRIKEN
+
+
+ALTERSGRUPPEN = ('A00-A04', 'A05-A14', 'A15-A34', 'A35-A59', 'A60-A79', 'A80+', 'unbekannt')
+GESCHLECHTER = ('M', 'W', 'unbekannt')
+
+ACHSEN = ('kreis', 'altersgruppe', 'geschlecht')
+
+
+def fenster_matrix(tage, fenster):
+    """
+    Bandmatrix (Tage x Tage) für gleitende Summen über *fenster* Tage.
+
+    X @ fenster_matrix(...) summiert jede Zeile von X über den Tag selbst und
+    die fenster-1 Tage davor.
+    """
+    zeilen = []
+    spalten = []
+    for versatz in range(fenster):
+        ziel = numpy.arange(versatz, tage)
+        zeilen.append(ziel - versatz)
+        spalten.append(ziel)
+    zeilen = numpy.concatenate(zeilen)
+    spalten = numpy.concatenate(spalten)
+    return sparse.csr_matrix((numpy.ones(len(zeilen)), (zeilen, spalten)), shape=(tage, tage))
+
+
+def kategorien(werte, bekannt):
+    """Codes und Kategorien eines Merkmals, bekannte Ausprägungen zuerst."""
+    werte = pd.Series(werte).fillna('unbekannt').astype(str)
+    zusaetzlich = sorted(set(werte.unique()) - set(bekannt))
+    kategorien = tuple(bekannt) + tuple(zusaetzlich)
+    codes = pd.Categorical(werte, categories=kategorien).codes
+    return codes.astype(numpy.intp), kategorien
+
+
+class MerkmalsCube:
+    """
+    Dünn besetzter Cube (Landkreis x Altersgruppe x Geschlecht) x Tage.
+
+    ids, dates, ewz, zeitachsen und metriken haben dieselbe Bedeutung wie beim
+    Cube. *matrizen* bildet (Zeitachse, Kennzahl) auf eine CSR-Matrix der Form
+    (Landkreise * Altersgruppen * Geschlechter, Tage) ab.
+    """
+
+    def __init__(self, ids, dates, ewz, matrizen, altersgruppen=ALTERSGRUPPEN, geschlechter=GESCHLECHTER,
+                 metriken=METRIKEN, zeitachsen=('Meldedatum',), zeitachse=None):
+        self.ids = numpy.asarray(ids)
+        self.dates = pd.DatetimeIndex(dates)
+        self.ewz = numpy.asarray(ewz, dtype=float)
+        self.altersgruppen = tuple(altersgruppen)
+        self.geschlechter = tuple(geschlechter)
+        self.metriken = tuple(metriken)
+        self.zeitachsen = tuple(zeitachsen)
+        self.zeitachse = zeitachse or self.zeitachsen[0]
+        self.matrizen = matrizen
+        form = (len(self.ids) * len(self.altersgruppen) * len(self.geschlechter), len(self.dates))
+        for schluessel, matrix in matrizen.items():
+            if matrix.shape != form:
+                raise ValueError('Matrix %s hat die Form %s, erwartet %s' % (schluessel, matrix.shape, form))
+
+    def __repr__(self):
+        nnz = sum(m.nnz for m in self.matrizen.values())
+        zellen = len(self.matrizen) * numpy.prod(self.form)
+        return '<MerkmalsCube %d Landkreise x %d Altersgruppen x %d Geschlechter x %d Tage, %.2f%% besetzt>' % (
+            self.form + (100.0 * nnz / max(zellen, 1),))
+
+    @property
+    def form(self):
+        return len(self.ids), len(self.altersgruppen), len(self.geschlechter), len(self.dates)
+
+    @property
+    def achsen_laengen(self):
+        return {'kreis': len(self.ids), 'altersgruppe': len(self.altersgruppen),
+                'geschlecht': len(self.geschlechter)}
+
+    def mit_zeitachse(self, zeitachse):
+        """Derselbe Cube mit einer anderen aktiven Zeitachse (ohne Kopie der Daten)."""
+        if zeitachse not in self.zeitachsen:
+            raise KeyError('Zeitachse %r nicht vorhanden, verfügbar: %s' % (zeitachse, ', '.join(self.zeitachsen)))
+        return MerkmalsCube(self.ids, self.dates, self.ewz, self.matrizen, self.altersgruppen, self.geschlechter,
+                            self.metriken, self.zeitachsen, zeitachse)
+
+    def matrix(self, metrik='AnzahlFall'):
+        """CSR-Matrix (Zeilen, Tage) einer Kennzahl auf der aktiven Zeitachse."""
+        return self.matrizen[(self.zeitachse, metrik)]
+
+    def _zeilen_auswahl(self, altersgruppe=None, geschlecht=None):
+        """Gruppierungsmatrix (Landkreise x Zeilen) über die gewählten Merkmale."""
+        n, g, s, _ = self.form
+        alter = numpy.ones(g, dtype=bool) if altersgruppe is None else numpy.isin(
+            self.altersgruppen, numpy.atleast_1d(altersgruppe))
+        geschl = numpy.ones(s, dtype=bool) if geschlecht is None else numpy.isin(
+            self.geschlechter, numpy.atleast_1d(geschlecht))
+        maske = (alter[:, None] & geschl[None, :]).ravel()
+        zeilen = numpy.flatnonzero(numpy.tile(maske, n))
+        return sparse.csr_matrix((numpy.ones(len(zeilen)), (zeilen // (g * s), zeilen)), shape=(n, n * g * s))
+
+    def summe(self, behalten=('kreis',), metrik='AnzahlFall'):
+        """
+        Randsumme über alle nicht in *behalten* genannten Merkmale.
+
+        Das Ergebnis bleibt dünn besetzt; die Zeilen sind die Kombinationen der
+        behaltenen Merkmale in der Reihenfolge von ACHSEN, die Spalten die Tage.
+        Ohne Tagesachse hilft zusätzlich ein .sum(axis=1).
+        """
+        laengen = self.achsen_laengen
+        for achse in behalten:
+            if achse not in laengen:
+                raise KeyError('Unbekanntes Merkmal %r, verfügbar: %s' % (achse, ', '.join(ACHSEN)))
+        indizes = numpy.indices([laengen[a] for a in ACHSEN]).reshape(len(ACHSEN), -1)
+        ziel = numpy.zeros(indizes.shape[1], dtype=numpy.intp)
+        anzahl = 1
+        for a, achse in enumerate(ACHSEN):
+            if achse in behalten:
+                ziel = ziel * laengen[achse] + indizes[a]
+                anzahl *= laengen[achse]
+        gruppierung = sparse.csr_matrix(
+            (numpy.ones(len(ziel)), (ziel, numpy.arange(len(ziel)))), shape=(anzahl, len(ziel)))
+        return (gruppierung @ self.matrix(metrik)).tocsr()
+
+    def gleitende_summe(self, fenster=7, metrik='AnzahlFall'):
+        """Summe der letzten *fenster* Tage pro Zeile, weiterhin dünn besetzt."""
+        return (self.matrix(metrik) @ fenster_matrix(len(self.dates), fenster)).tocsr()
+
+    def inzidenz(self, fenster=7, metrik='AnzahlFall', ewz=None):
+        """
+        Gleitende Inzidenz pro 100.000 Einwohner für jede Zeile.
+
+        *ewz* kann als Array (Landkreise, Altersgruppen, Geschlechter) die
+        Bevölkerung der jeweiligen Gruppe enthalten. Ohne Angabe wird wie im
+        Notebook durch die Einwohnerzahl des gesamten Landkreises geteilt.
+        """
+        n, g, s, _ = self.form
+        if ewz is None:
+            ewz = numpy.repeat(self.ewz, g * s)
+        else:
+            ewz = numpy.asarray(ewz, dtype=float).reshape(n * g * s)
+        with numpy.errstate(divide='ignore'):
+            faktor = numpy.where(ewz > 0, 100000 / ewz, 0.0)
+        return (sparse.diags(faktor) @ self.gleitende_summe(fenster, metrik)).tocsr()
+
+    def als_cube(self, altersgruppe=None, geschlecht=None):
+        """
+        Dichter Landkreis-Cube für eine Auswahl an Altersgruppen/Geschlechtern.
+
+        Damit laufen alle Auswertungen des Cubes, z.B. Hot Spots nur für die
+        Altersgruppe 'A80+'. Die Einwohnerzahl bleibt die des Landkreises.
+        """
+        auswahl = self._zeilen_auswahl(altersgruppe, geschlecht)
+        werte = numpy.empty((len(self.zeitachsen), len(self.ids), len(self.dates), len(self.metriken)),
+                            dtype=numpy.int64)
+        for a, achse in enumerate(self.zeitachsen):
+            for m, metrik in enumerate(self.metriken):
+                werte[a, :, :, m] = (auswahl @ self.matrizen[(achse, metrik)]).toarray()
+        return Cube(self.ids, self.dates, werte, self.ewz, self.metriken, zeitachsen=self.zeitachsen,
+                    zeitachse=self.zeitachse)
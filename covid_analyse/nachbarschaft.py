@@ -0,0 +1,140 @@
+"""
+Nachbarschaften und einfache Geometrie der Landkreis-Polygone.
+
+Die Geometrien liegen im Notebook als Spalte 'SHAPE' eines "spatially-enabled"
+Dataframes vor (In[19]). Die Funktionen hier arbeiten direkt auf den Ringen im
+Esri-JSON-Format ({'rings': [[[x, y], ...], ...]}), sodass sie sowohl mit
+arcgis-Geometrien als auch mit einfachen Dictionaries funktionieren.
+
+Die Nachbarschaft wird als dünn besetzte Gewichtsmatrix (Landkreise x
+Landkreise) abgelegt und von allen lokalen Statistiken gemeinsam genutzt.
+"""
+
+import json
+
+import numpy
+from scipy import sparse
+
+
+def ringe(shape):
+    """Ringe einer Polygon-Geometrie als Liste von Arrays (Punkte, 2)."""
+    if isinstance(shape, str):
+        shape = json.loads(shape)
+    if isinstance(shape, dict) or hasattr(shape, 'get'):
+        shape = shape.get('rings', shape.get('curveRings'))
+    if shape is None:
+        return []
+    return [numpy.asarray(ring, dtype=float)[:, :2] for ring in shape]
+
+
+def _flaeche_schwerpunkt(ring):
+    x, y = ring[:, 0], ring[:, 1]
+    kreuz = x[:-1] * y[1:] - x[1:] * y[:-1]
+    flaeche = kreuz.sum() / 2
+    if flaeche == 0:
+        return 0.0, ring.mean(axis=0)
+    cx = ((x[:-1] + x[1:]) * kreuz).sum() / (6 * flaeche)
+    cy = ((y[:-1] + y[1:]) * kreuz).sum() / (6 * flaeche)
+    return flaeche, numpy.array([cx, cy])
+
+
+def schwerpunkte(shapes):
+    """
+    Flächenschwerpunkte der Polygone als Array (Landkreise, 2).
+
+    Löcher (gegenläufig orientierte Ringe) werden mit negativer Fläche
+    berücksichtigt.
+    """
+    ergebnis = numpy.empty((len(shapes), 2))
+    for i, shape in enumerate(shapes):
+        teile = [_flaeche_schwerpunkt(r) for r in ringe(shape) if len(r) > 2]
+        flaechen = numpy.array([f for f, _ in teile])
+        punkte = numpy.array([p for _, p in teile])
+        if not len(teile) or flaechen.sum() == 0:
+            ergebnis[i] = punkte.mean(axis=0) if len(teile) else numpy.nan
+        else:
+            ergebnis[i] = (flaechen[:, None] * punkte).sum(axis=0) / flaechen.sum()
+    return ergebnis
+
+
+def flaeche(ring):
+    """Vorzeichenbehaftete Fläche eines Rings; negativ im Uhrzeigersinn wie die Außenringe im Esri-JSON."""
+    x, y = ring[:, 0], ring[:, 1]
+    return (x[:-1] * y[1:] - x[1:] * y[:-1]).sum() / 2 + (x[-1] * y[0] - x[0] * y[-1]) / 2
+
+
+def im_ring(punkte, ring):
+    """
+    Welche *punkte* (n, 2) innerhalb von *ring* (m, 2) liegen, nach der
+    Anzahl der Schnitte eines waagrechten Strahls mit den Kanten (gerade
+    Anzahl: außerhalb). Der Ring wird bei Bedarf geschlossen.
+    """
+    punkte = numpy.asarray(punkte, dtype=float).reshape(-1, 2)
+    if len(ring) and (ring[0] != ring[-1]).any():
+        ring = numpy.vstack([ring, ring[:1]])
+    x, y = punkte[:, 0, None], punkte[:, 1, None]
+    x1, y1, x2, y2 = ring[:-1, 0], ring[:-1, 1], ring[1:, 0], ring[1:, 1]
+    kreuzt = (y1 > y) != (y2 > y)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        schnitt = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+    return (kreuzt & (x < schnitt)).sum(axis=1) % 2 == 1
+
+
+def polygone(shape):
+    """
+    Ringe einer Esri-Geometrie als Liste von Polygonen [Außenring, Löcher...].
+
+    Außenringe laufen im Esri-JSON im Uhrzeigersinn, Löcher gegen ihn; jedes
+    Loch gehört zum Außenring, der seinen ersten Punkt enthält.
+    """
+    alle = [r for r in ringe(shape) if len(r) > 2]
+    aussen = [r for r in alle if flaeche(r) <= 0]
+    if not aussen:
+        return [[r] for r in alle]
+    polygone = [[r] for r in aussen]
+    for loch in (r for r in alle if flaeche(r) > 0):
+        treffer = [i for i, r in enumerate(aussen) if im_ring(loch[:1], r)[0]]
+        polygone[treffer[0] if treffer else -1].append(loch)
+    return polygone
+
+
+def queen(shapes, genauigkeit=1e-6):
+    """
+    Binäre Nachbarschaftsmatrix: Polygone mit mindestens einem gemeinsamen Eckpunkt.
+
+    Die Koordinaten werden auf *genauigkeit* gerundet, damit numerisch leicht
+    abweichende gemeinsame Grenzpunkte zusammenfallen. Die Diagonale ist 0.
+    """
+    punkte = []
+    polygon = []
+    for i, shape in enumerate(shapes):
+        for ring in ringe(shape):
+            punkte.append(ring)
+            polygon.append(numpy.full(len(ring), i))
+    punkte = numpy.round(numpy.concatenate(punkte) / genauigkeit).astype(numpy.int64)
+    polygon = numpy.concatenate(polygon)
+
+    # Gleiche Eckpunkte erhalten dieselbe Nummer; eine Inzidenzmatrix
+    # (Polygone x Eckpunkte) liefert über ihr Produkt mit sich selbst die Nachbarn
+    _, punkt = numpy.unique(punkte, axis=0, return_inverse=True)
+    inzidenz = sparse.csr_matrix(
+        (numpy.ones(len(punkt)), (polygon, punkt.ravel())), shape=(len(shapes), punkt.max() + 1))
+    inzidenz.data[:] = 1
+    nachbarn = (inzidenz @ inzidenz.T).tocsr()
+    nachbarn.setdiag(0)
+    nachbarn.eliminate_zeros()
+    nachbarn.data[:] = 1
+    return nachbarn
+
+
+def zeilennormiert(gewichte):
+    """Gewichtsmatrix mit Zeilensumme 1 (Zeilen ohne Nachbarn bleiben 0)."""
+    summe = numpy.asarray(gewichte.sum(axis=1)).ravel()
+    with numpy.errstate(divide='ignore'):
+        faktor = numpy.where(summe > 0, 1 / summe, 0.0)
+    return (sparse.diags(faktor) @ gewichte).tocsr()
+
+
+def inseln(gewichte):
+    """Indizes der Polygone ohne Nachbarn (z.B. Inselkreise)."""
+    return numpy.flatnonzero(numpy.diff(gewichte.tocsr().indptr) == 0)
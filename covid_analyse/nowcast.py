@@ -0,0 +1,145 @@
+"""
+Nowcasting der noch nicht gemeldeten Fälle der letzten Tage.
+
+Ein Fall mit Erkrankungsbeginn (Refdatum) am Tag d erscheint erst mit seinem
+Meldedatum in den Daten. Für die letzten Tage vor dem Datenstand fehlt deshalb
+ein Teil der Fälle, was am Ende jeder Welle als künstlicher Rückgang bzw. als
+Cold Spot auftritt.
+
+Die Verzugsverteilung wird aus den Rohdaten geschätzt: Eine Tabelle zählt die
+Fälle pro Tag von *von* und Verzug in Tagen (ein einziges numpy.bincount über
+alle Zeilen). Für die Verteilung werden nur Tage verwendet, deren Meldungen
+bereits vollständig vorliegen (mindestens *max_verzug* Tage vor dem
+Datenstand), und davon die letzten *fenster* Tage, damit sie den aktuellen
+Meldeverzug widerspiegeln. Ist F(a) der Anteil der Fälle mit Verzug <= a, so
+sind von einem Tag, für den a Tage Meldezeit vergangen sind, im Mittel
+F(a) der Fälle bekannt; die Schätzung ist beobachtet / F(a). Die fehlenden
+Fälle sind negativ-binomialverteilt (beobachtet Erfolge mit Wahrscheinlichkeit
+F(a)), daraus ergeben sich die Unsicherheitsbänder. Die Unsicherheit der
+Verteilung selbst ist darin nicht enthalten.
+
+Korrigiert werden nur die letzten *max_verzug* Tage, für alle Einheiten
+eines Cubes gleichzeitig.
+"""
+
+from collections import namedtuple
+
+import numpy
+from scipy import stats
+
+from covid_analyse.cube import Cube
+from covid_analyse.datum import tagesnummern
+
+
+MAX_VERZUG = 21
+
+# tabelle: Fälle (Tage von *von* ab *erster*, Verzug 0..max_verzug); letzter: letzter gemeldeter Tag
+Verzugstabelle = namedtuple('Verzugstabelle', ['von', 'bis', 'erster', 'tabelle', 'letzter'])
+
+# anteil[a]: Anteil der Fälle mit Verzug <= a; letzter: letzter gemeldeter Tag (Tagesnummer)
+Verzug = namedtuple('Verzug', ['von', 'bis', 'wahrscheinlichkeit', 'anteil', 'letzter', 'faelle'])
+
+Nowcast = namedtuple('Nowcast', ['cube', 'beobachtet', 'unten', 'oben', 'anteil', 'metrik'])
+
+
+def verzugstabelle(data_df, von='Refdatum', bis='Meldedatum', max_verzug=MAX_VERZUG, metrik='AnzahlFall'):
+    """
+    Fälle pro Tag von *von* und Verzug (*bis* - *von*) in Tagen.
+
+    Verzüge über *max_verzug* werden dem letzten Eintrag zugeschlagen,
+    negative als 0 gezählt. Der letzte gemeldete Tag ist der Tag vor dem
+    Datenstand oder, ohne Spalte 'Datenstand', der letzte Tag von *bis*.
+    """
+    tag_von = tagesnummern(data_df[von]).astype(numpy.int64)
+    tag_bis = tagesnummern(data_df[bis]).astype(numpy.int64)
+    if 'Datenstand' in data_df:
+        letzter = int(tagesnummern(data_df['Datenstand']).max()) - 1
+    else:
+        letzter = int(tag_bis.max())
+    erster = int(tag_von.min())
+    verzug = numpy.clip(tag_bis - tag_von, 0, max_verzug)
+    faelle = numpy.clip(data_df[metrik].to_numpy(), 0, None)
+    breite = max_verzug + 1
+    tabelle = numpy.bincount((tag_von - erster) * breite + verzug, weights=faelle,
+                             minlength=(int(tag_von.max()) - erster + 1) * breite).reshape(-1, breite)
+    return Verzugstabelle(von, bis, erster, tabelle, letzter)
+
+
+def zusammenfassen(tabellen):
+    """Summe mehrerer Verzugstabellen, z.B. aus den Partitionen der Bundesländer."""
+    tabellen = list(tabellen)
+    erster = min(t.erster for t in tabellen)
+    ende = max(t.erster + len(t.tabelle) for t in tabellen)
+    summe = numpy.zeros((ende - erster, tabellen[0].tabelle.shape[1]))
+    for t in tabellen:
+        summe[t.erster - erster:t.erster - erster + len(t.tabelle)] += t.tabelle
+    return Verzugstabelle(tabellen[0].von, tabellen[0].bis, erster, summe, max(t.letzter for t in tabellen))
+
+
+def verteilung(tabelle, fenster=28):
+    """
+    Verzugsverteilung aus den letzten *fenster* vollständig gemeldeten Tagen.
+
+    Reichen die Daten nicht über *max_verzug* Tage vor den Datenstand zurück,
+    werden alle Tage verwendet.
+    """
+    max_verzug = tabelle.tabelle.shape[1] - 1
+    ende = tabelle.letzter - max_verzug - tabelle.erster + 1
+    if ende <= 0:
+        ende = len(tabelle.tabelle)
+    auswahl = tabelle.tabelle[max(ende - fenster, 0):ende]
+    faelle = auswahl.sum()
+    if faelle == 0:
+        raise ValueError('Keine Fälle zur Schätzung des Meldeverzugs')
+    wahrscheinlichkeit = auswahl.sum(axis=0) / faelle
+    return Verzug(tabelle.von, tabelle.bis, wahrscheinlichkeit, numpy.cumsum(wahrscheinlichkeit), tabelle.letzter,
+                  faelle)
+
+
+def schaetzen(data_df, von='Refdatum', bis='Meldedatum', max_verzug=MAX_VERZUG, fenster=28):
+    """Verzugsverteilung direkt aus einem Dataframe wie *data_df* (In[11])."""
+    return verteilung(verzugstabelle(data_df, von, bis, max_verzug), fenster)
+
+
+def anteil_gemeldet(dates, verzug):
+    """Erwarteter Anteil bereits gemeldeter Fälle für jeden Tag aus *dates*."""
+    vergangen = verzug.letzter - tagesnummern(dates).astype(numpy.int64)
+    anteil = numpy.ones(len(vergangen))
+    offen = (vergangen >= 0) & (vergangen < len(verzug.anteil) - 1)
+    anteil[offen] = verzug.anteil[vergangen[offen]]
+    # Tage nach dem letzten Meldetag können noch keine Fälle enthalten
+    anteil[vergangen < 0] = 0.0
+    return anteil
+
+
+def nowcast(cube, verzug, metrik='AnzahlFall', konfidenz=0.95):
+    """
+    Korrigiert *metrik* in den letzten Tagen aller Einheiten von *cube*.
+
+    Verwendet wird die Zeitachse *verzug.von* des Cubes. Liefert
+    Nowcast(cube, beobachtet, unten, oben, anteil, metrik): einen Cube mit
+    der geschätzten Anzahl (Gleitkommazahlen, nur *metrik* geändert), die
+    beobachteten Werte und die Grenzen des *konfidenz*-Intervalls als Arrays
+    (Einheiten, Tage) sowie den gemeldeten Anteil pro Tag.
+    """
+    if verzug.von in cube.zeitachsen:
+        cube = cube.mit_zeitachse(verzug.von)
+    m = cube.metriken.index(metrik)
+    beobachtet = cube.werte[:, :, m].astype(float)
+    anteil = anteil_gemeldet(cube.dates, verzug)
+
+    schaetzung, unten, oben = beobachtet.copy(), beobachtet.copy(), beobachtet.copy()
+    offen = numpy.flatnonzero((anteil < 1) & (anteil > 0))
+    if len(offen):
+        b, f = beobachtet[:, offen], anteil[offen][None, :]
+        schaetzung[:, offen] = b / f
+        # Fehlende Fälle ~ NB(beobachtet, F); ohne beobachtete Fälle ist keine Aussage möglich
+        n = numpy.maximum(b, 1e-9)
+        rand = (1 - konfidenz) / 2
+        unten[:, offen] = b + numpy.where(b > 0, stats.nbinom.ppf(rand, n, f), 0)
+        oben[:, offen] = b + numpy.where(b > 0, stats.nbinom.ppf(1 - rand, n, f), 0)
+
+    werte = cube.werte.astype(float)
+    werte[:, :, m] = schaetzung
+    ergebnis = Cube(cube.ids, cube.dates, werte, cube.ewz, cube.metriken, cube.ebene, (cube.zeitachse,))
+    return Nowcast(ergebnis, beobachtet, unten, oben, anteil, metrik)
@@ -0,0 +1,218 @@
+"""
+Verarbeitung der Falldaten nach Bundesländern, ohne die Datei vollständig zu laden.
+
+Die RKI-Datei wird zeilenweise gelesen und unverändert auf eine Datei pro
+'IdBundesland' verteilt. Aggregation und Inzidenzen werden danach Bundesland
+für Bundesland berechnet: Im Speicher liegt immer nur die Partition eines
+Landes, der Bedarf richtet sich also nach dem größten Bundesland (NRW) und
+nicht nach ganz Deutschland.
+
+Da die Landkreise im Cube nach AGS sortiert sind und die ersten beiden
+Stellen des AGS das Bundesland angeben, bilden die Landkreise eines Landes
+einen zusammenhängenden Block. Die Teil-Cubes der Länder werden deshalb nur
+auf eine gemeinsame Tagesliste gelegt und aneinandergehängt.
+"""
+
+import csv
+import json
+import os
+
+import numpy
+import pandas as pd
+from scipy import sparse
+
+from covid_analyse import tracing
+from covid_analyse.aggregation import ZEITACHSEN, aggregieren, aggregieren_merkmale
+from covid_analyse.cube import Cube, METRIKEN, ags_str, kreise_aus_ewz, tage_einbetten
+from covid_analyse.datum import csv_lesen
+from covid_analyse.merkmale import ALTERSGRUPPEN, GESCHLECHTER, MerkmalsCube
+
+
+INDEX_DATEI = 'partitionen.json'
+
+
+def _quelle(pfad):
+    info = os.stat(pfad)
+    return {'pfad': os.path.abspath(pfad), 'groesse': info.st_size, 'geaendert': info.st_mtime_ns}
+
+
+class Partitionen:
+    """
+    Verzeichnis mit einer CSV-Datei der Falldaten pro Bundesland.
+
+    *zeilen* enthält die Anzahl der Fälle pro Bundesland ('01' bis '16').
+    """
+
+    def __init__(self, verzeichnis):
+        self.verzeichnis = verzeichnis
+        with open(os.path.join(verzeichnis, INDEX_DATEI), encoding='utf-8') as f:
+            index = json.load(f)
+        self.quelle = index['quelle']
+        self.zeilen = index['zeilen']
+
+    def __repr__(self):
+        return '<Partitionen %s: %d Bundesländer, %d Zeilen>' % (
+            self.verzeichnis, len(self.zeilen), sum(self.zeilen.values()))
+
+    @property
+    def bundeslaender(self):
+        return sorted(self.zeilen)
+
+    def datei(self, bl):
+        return os.path.join(self.verzeichnis, 'IdBundesland=%s.csv' % bl)
+
+    def laden(self, bl, spalten=None):
+        """Falldaten eines Bundeslands wie *data_df* nach In[11], Datumsangaben als Tagesnummern."""
+        return csv_lesen(self.datei(bl), usecols=spalten)
+
+
+def _land_spalte(kopf, spalte):
+    namen = next(csv.reader([kopf.decode('utf-8-sig')]))
+    if spalte not in namen:
+        raise KeyError('Spalte %s fehlt in der Kopfzeile' % spalte)
+    return namen.index(spalte)
+
+
+def partitionieren(pfad, verzeichnis, spalte='IdBundesland'):
+    """
+    Verteilt die RKI-Datei *pfad* auf eine Datei pro Bundesland.
+
+    Die Zeilen werden unverändert als Bytes kopiert; gelesen wird nur das Feld
+    *spalte*, sodass weder Datumsangaben noch Texte geparst werden. Liegen im
+    Verzeichnis bereits Partitionen derselben Quelldatei (Größe und
+    Änderungszeit), werden diese verwendet.
+    """
+    os.makedirs(verzeichnis, exist_ok=True)
+    quelle = _quelle(pfad)
+    index = os.path.join(verzeichnis, INDEX_DATEI)
+    if os.path.exists(index):
+        partitionen = Partitionen(verzeichnis)
+        if partitionen.quelle == quelle:
+            return partitionen
+        os.remove(index)
+    for datei in os.listdir(verzeichnis):
+        if datei.startswith('IdBundesland='):
+            os.remove(os.path.join(verzeichnis, datei))
+
+    zeilen, dateien, schluessel = {}, {}, {}
+    with tracing.spanne('partitionieren', 'io') as spanne, open(pfad, 'rb', buffering=2 ** 20) as f:
+        kopf = f.readline()
+        position = _land_spalte(kopf, spalte)
+        try:
+            for zeile in f:
+                teile = zeile.split(b',', position + 1)
+                if any(t.startswith(b'"') for t in teile[:position]):
+                    # Komma innerhalb eines Textfelds vor der Spalte: vollständig parsen
+                    feld = next(csv.reader([zeile.decode('utf-8')]))[position].encode()
+                else:
+                    feld = teile[position]
+                land = schluessel.get(feld)
+                if land is None:
+                    land = schluessel[feld] = '%02d' % int(feld.strip(b'" '))
+                if land not in dateien:
+                    dateien[land] = open(os.path.join(verzeichnis, 'IdBundesland=%s.csv' % land), 'wb',
+                                         buffering=2 ** 20)
+                    dateien[land].write(kopf)
+                    zeilen[land] = 0
+                dateien[land].write(zeile)
+                zeilen[land] += 1
+        finally:
+            for datei in dateien.values():
+                datei.close()
+        spanne.zeilen(sum(zeilen.values()), len(zeilen))
+        spanne.bytes(quelle['groesse'])
+
+    tmp = index + '.tmp'
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump({'quelle': quelle, 'zeilen': dict(sorted(zeilen.items()))}, f, indent=1)
+    os.replace(tmp, index)
+    return Partitionen(verzeichnis)
+
+
+def _laender(kreise_ewz):
+    """Landkreise pro Bundesland in der Reihenfolge des Cubes."""
+    land = ags_str(kreise_ewz['AGS']).astype('U2')
+    return [(bl, kreise_ewz[land == bl]) for bl in numpy.unique(land)]
+
+
+def _pro_land(partitionen, kreise_ewz, spalten, funktion):
+    """Wendet *funktion(data_df, kreise_bl)* auf jede Partition an; None für Länder ohne Fälle."""
+    teile = []
+    for bl, kreise_bl in _laender(kreise_ewz):
+        if bl not in partitionen.zeilen:
+            teile.append((kreise_bl, None))
+            continue
+        with tracing.spanne('aggregation_bl', bundesland=bl) as spanne:
+            data_df = partitionen.laden(bl, spalten)
+            teile.append((kreise_bl, funktion(data_df, kreise_bl)))
+            spanne.zeilen(len(data_df))
+            del data_df
+    vorhanden = [t for _, t in teile if t is not None]
+    if not vorhanden:
+        raise ValueError('Keine Falldaten in %s' % partitionen.verzeichnis)
+    alle_dates = pd.date_range(min(t.dates[0] for t in vorhanden), max(t.dates[-1] for t in vorhanden), freq='D')
+    return teile, alle_dates
+
+
+def aggregieren_partitioniert(partitionen, kreise_ewz, zeitachsen=ZEITACHSEN, metriken=METRIKEN):
+    """
+    Wie *aggregieren()*, aber ein Bundesland nach dem anderen.
+
+    Bundesländer ohne Fälle erhalten Nullen. Das Ergebnis ist identisch mit
+    *aggregieren()* auf der vollständigen Datei; Inzidenzen lassen sich
+    danach wie gewohnt mit *Cube.inzidenz()* berechnen, da sie nur vom
+    (kleinen) Landkreis-Cube abhängen.
+    """
+    spalten = ['IdLandkreis'] + list(zeitachsen) + list(metriken)
+    teile, alle_dates = _pro_land(partitionen, kreise_ewz, spalten,
+                                  lambda df, kreise_bl: aggregieren(df, kreise_bl, zeitachsen, metriken))
+
+    werte, ids, ewz = [], [], []
+    for kreise_bl, teil in teile:
+        bl_ids, bl_ewz = kreise_aus_ewz(kreise_bl)
+        if teil is None:
+            werte.append(numpy.zeros((len(zeitachsen), len(bl_ids), len(alle_dates), len(metriken)),
+                                     dtype=numpy.int64))
+        else:
+            werte.append(tage_einbetten(teil.alle_werte, teil.dates, alle_dates))
+        ids.append(bl_ids)
+        ewz.append(bl_ewz)
+    return Cube(numpy.concatenate(ids), alle_dates, numpy.concatenate(werte, axis=1), numpy.concatenate(ewz),
+                metriken, zeitachsen=zeitachsen)
+
+
+def aggregieren_merkmale_partitioniert(partitionen, kreise_ewz, zeitachsen=ZEITACHSEN, metriken=METRIKEN):
+    """Wie *aggregieren_merkmale()*, aber ein Bundesland nach dem anderen."""
+    spalten = ['IdLandkreis', 'Altersgruppe', 'Geschlecht'] + list(zeitachsen) + list(metriken)
+    teile, alle_dates = _pro_land(
+        partitionen, kreise_ewz, spalten,
+        lambda df, kreise_bl: aggregieren_merkmale(df, kreise_bl, zeitachsen, metriken))
+
+    # Alle Länder auf dieselben Kategorien abbilden, damit die Zeilenblöcke passen
+    vorhanden = [t for _, t in teile if t is not None]
+    altersgruppen = ALTERSGRUPPEN + tuple(sorted({a for t in vorhanden for a in t.altersgruppen} - set(ALTERSGRUPPEN)))
+    geschlechter = GESCHLECHTER + tuple(sorted({g for t in vorhanden for g in t.geschlechter} - set(GESCHLECHTER)))
+    zellen = len(altersgruppen) * len(geschlechter)
+
+    ids, ewz, bloecke = [], [], {schluessel: [] for schluessel in vorhanden[0].matrizen}
+    for kreise_bl, teil in teile:
+        bl_ids, bl_ewz = kreise_aus_ewz(kreise_bl)
+        ids.append(bl_ids)
+        ewz.append(bl_ewz)
+        for schluessel, liste in bloecke.items():
+            if teil is None:
+                liste.append(sparse.csr_matrix((len(bl_ids) * zellen, len(alle_dates)), dtype=numpy.int64))
+                continue
+            matrix = teil.matrizen[schluessel].tocoo()
+            # Zeilen auf die gemeinsamen Kategorien und Spalten auf die gemeinsame Tagesliste umrechnen
+            kreis, rest = numpy.divmod(matrix.row, len(teil.altersgruppen) * len(teil.geschlechter))
+            alter, geschlecht = numpy.divmod(rest, len(teil.geschlechter))
+            alter = numpy.array([altersgruppen.index(a) for a in teil.altersgruppen])[alter]
+            geschlecht = numpy.array([geschlechter.index(g) for g in teil.geschlechter])[geschlecht]
+            zeile = (kreis * len(altersgruppen) + alter) * len(geschlechter) + geschlecht
+            spalte = matrix.col + (teil.dates[0] - alle_dates[0]).days
+            liste.append(sparse.csr_matrix((matrix.data, (zeile, spalte)),
+                                           shape=(len(bl_ids) * zellen, len(alle_dates))))
+    matrizen = {schluessel: sparse.vstack(liste, format='csr') for schluessel, liste in bloecke.items()}
+    return MerkmalsCube(numpy.concatenate(ids), alle_dates, numpy.concatenate(ewz), matrizen, altersgruppen,
+                        geschlechter, metriken, zeitachsen)
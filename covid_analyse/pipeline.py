@@ -0,0 +1,618 @@
+"""
+Stufen des Notebooks als Abhängigkeitsgraph mit unbeaufsichtigter Ausführung.
+
+Das Notebook läuft linear von oben nach unten, obwohl z.B. die drei
+Verlaufsdiagramme (In[42]-In[44]), die Space-Time Cubes der Wellen
+(In[81]-In[91]) und die Hot-Spot- und Ausreißer-Analysen (In[61]-In[80])
+nicht voneinander abhängen. Hier ist jede Stufe eine Funktion mit einer Liste
+von Vorgängern; *ausfuehren()* startet alle Stufen, deren Vorgänger fertig
+sind, gleichzeitig in einem Thread- oder Prozesspool.
+
+Nach jeder Stufe wird ihr Ergebnis im Zustandsverzeichnis abgelegt. Ein
+erneuter Aufruf mit derselben Konfiguration setzt nach der letzten fertigen
+Stufe fort; ändern sich Eingabedateien oder Parameter, wird neu begonnen.
+
+Die Analysen verwenden standardmäßig die lokalen Implementierungen
+(*backends*, *analyse*), sodass weder ArcGIS noch eine Anmeldung nötig
+ist; mit --ohne-diagramme entfällt auch matplotlib. Aufruf:
+
+    python -m covid_analyse --daten RKI_COVID19.csv --kreise kreise.csv --ausgabe home
+    python -m covid_analyse --synthetisch 0.1 --ausgabe /tmp/lauf --arbeiter 8
+    python -m covid_analyse --daten RKI_COVID19.csv --partitionen /tmp/teile --ausgabe home
+    python -m covid_analyse --daten RKI_COVID19.csv --ohne-diagramme --ausgabe home
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import pickle
+import time
+from collections import OrderedDict, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from functools import partial
+
+import numpy
+import pandas as pd
+
+from covid_analyse import (autokorrelation, backends, diagramme, fenster, geopackage, glaettung, kacheln,
+                           nachbarschaft, nowcast, scan, speicherprofil, synthetisch, tracing, wellen)
+from covid_analyse.aggregation import aggregieren
+from covid_analyse.cube import INZIDENZ_SPALTEN, ags_str
+from covid_analyse.datum import csv_lesen
+from covid_analyse.einlesen import aggregieren_parallel
+from covid_analyse.hierarchie import Hierarchie
+from covid_analyse.partition import Partitionen, aggregieren_partitioniert, partitionieren
+from covid_analyse.wellen import WELLEN_NOTEBOOK
+
+
+log = logging.getLogger(__name__)
+
+Stufe = namedtuple('Stufe', ['name', 'funktion', 'abhaengig', 'zwischenstand'], defaults=((), True))
+
+
+def _pfad(cfg, datei):
+    os.makedirs(cfg['ausgabe'], exist_ok=True)
+    return os.path.join(cfg['ausgabe'], datei)
+
+
+def kreise_sortiert(kreise_df):
+    """Landkreise nach AGS sortiert wie die Zeilen des Cubes, AGS fünfstellig."""
+    kreise_df = kreise_df.assign(AGS=ags_str(kreise_df['AGS'])).drop_duplicates('AGS')
+    return kreise_df.sort_values('AGS', kind='stable').reset_index(drop=True)
+
+
+def kreise(cfg):
+    """Landkreise mit AGS, EWZ, EWZ_BL und SHAPE (In[7], In[18]) in der Reihenfolge des Cubes."""
+    if not cfg.get('kreise'):
+        return kreise_sortiert(synthetisch.kreise(seed=cfg.get('seed', 0)))
+    kreise_df = pd.read_csv(cfg['kreise'], dtype={'AGS': str, 'RS': str, 'BL_ID': str})
+    # Berliner Bezirke haben keinen AGS, aber einen Regionalschlüssel
+    if 'RS' in kreise_df:
+        kreise_df['AGS'] = kreise_df['AGS'].fillna(kreise_df['RS'])
+    return kreise_sortiert(kreise_df)
+
+
+def daten(cfg, kreise_df):
+    """
+    Falldaten wie *data_df* nach In[11], Datumsangaben als Tagesnummern.
+
+    Mit 'partitionen' in *cfg* wird die Datei nur nach Bundesländern aufgeteilt
+    und statt eines Dataframes das Partitionen-Objekt weitergegeben. Mit
+    'einlesen' (Anzahl Prozesse) wird nur der Pfad weitergegeben; gelesen
+    wird dann parallel in *cube()*.
+    """
+    if not cfg.get('daten'):
+        return synthetisch.falldaten(kreise_df, cfg.get('synthetisch', 0.1), cfg.get('seed', 0))
+    if cfg.get('partitionen'):
+        return partitionieren(cfg['daten'], cfg['partitionen'])
+    if cfg.get('einlesen'):
+        return cfg['daten']
+    return csv_lesen(cfg['daten'])
+
+
+def cube(cfg, data_df, kreise_df):
+    """Landkreis-Cube nach Meldedatum und Refdatum (In[17]); wird als cube.npz abgelegt."""
+    if isinstance(data_df, Partitionen):
+        ergebnis = aggregieren_partitioniert(data_df, kreise_df[['AGS', 'EWZ', 'EWZ_BL']])
+    elif isinstance(data_df, str):
+        ergebnis = aggregieren_parallel(data_df, kreise_df[['AGS', 'EWZ', 'EWZ_BL']], cfg['einlesen'])
+    else:
+        ergebnis = aggregieren(data_df, kreise_df[['AGS', 'EWZ', 'EWZ_BL']])
+    ergebnis.speichern(_pfad(cfg, 'cube.npz'))
+    return ergebnis
+
+
+def ebenen(cfg, kreis_cube, kreise_df):
+    """Landkreise, Bundesländer und Deutschland (In[24])."""
+    return Hierarchie.aus_kreisen(kreise_df[['AGS', 'EWZ', 'EWZ_BL']]).aggregieren(kreis_cube)
+
+
+def _profil(cfg, df, tabelle, typen, berichte):
+    """Mit cfg['speicherprofil'] *df* in kleineren Datentypen; *typen* gilt für alle Tabellen eines Laufs."""
+    if not cfg.get('speicherprofil'):
+        return df
+    df, bericht = speicherprofil.anpassen(df, typen, kategorien=tabelle != 'kreise')
+    bericht.insert(0, 'tabelle', tabelle)
+    berichte.append(bericht)
+    return df
+
+
+def _data_ewz(cfg, kreis_cube, kreise_df, typen=None, berichte=None):
+    """
+    *data_ewz* (In[28]-In[35]). Mit cfg['speicherprofil'] werden die Werte aus
+    dem Cube und die Einwohnerzahlen schon vor dem Join umgewandelt und der
+    AGS als Kategorie verknüpft.
+    """
+    typen = {} if typen is None else typen
+    berichte = [] if berichte is None else berichte
+    werte = _profil(cfg, kreis_cube.als_dataframe().drop(columns='EWZ'), 'data_ewz', typen, berichte)
+    kreise_ewz = _profil(cfg, kreise_df[['AGS', 'EWZ', 'EWZ_BL']], 'kreise', typen, berichte)
+    if isinstance(werte['Id'].dtype, pd.CategoricalDtype):
+        kreise_ewz = kreise_ewz.assign(AGS=kreise_ewz['AGS'].astype(werte['Id'].dtype))
+    return pd.merge(kreise_ewz, werte, left_on='AGS', right_on='Id', how='right').drop(columns='Id')
+
+
+def export(cfg, stufen, kreise_df):
+    """
+    Tabellen *data_ewz* und *data_bl* mit Inzidenzen als data.csv und
+    data_bl.csv (In[35]). Mit cfg['speicherprofil'] werden beide Tabellen in
+    kleineren Datentypen aufgebaut (siehe *speicherprofil*), der Bericht
+    dazu als speicherprofil.csv.
+    """
+    typen, berichte = {}, []
+    data_ewz = _data_ewz(cfg, stufen['kreis'], kreise_df, typen, berichte)
+    data_bl = _profil(cfg, stufen['bundesland'].als_dataframe(), 'data_bl', typen, berichte)
+    if berichte:
+        bericht = pd.concat(berichte, ignore_index=True)
+        bericht.to_csv(_pfad(cfg, 'speicherprofil.csv'), index=False)
+        log.info('Speicherprofil data_ewz und data_bl: %s', speicherprofil.zusammenfassung(bericht))
+    data_bl.to_csv(_pfad(cfg, 'data_bl.csv'), index=False)
+    pfad = _pfad(cfg, 'data.csv')
+    data_ewz.to_csv(pfad, index=False)
+    return pfad
+
+
+def kennzahlen(cfg, stufen):
+    """Inzidenzen über 7, 14 und 28 Tage und R-Werte aller Ebenen als kennzahlen.csv."""
+    ergebnis = fenster.fuer_ebenen(stufen)
+    teile = []
+    for ebene, werte in ergebnis.items():
+        cube = stufen[ebene]
+        df = pd.DataFrame({'Ebene': ebene, 'Id': numpy.repeat(cube.ids, len(cube.dates)),
+                           cube.zeitachse: numpy.tile(cube.dates.to_numpy(), len(cube.ids))})
+        for name, a in werte.items():
+            df[name] = a.ravel()
+        teile.append(df)
+    pfad = _pfad(cfg, 'kennzahlen.csv')
+    pd.concat(teile, ignore_index=True).to_csv(pfad, index=False)
+    return pfad
+
+
+def nowcast_stufe(cfg, data_df, stufen):
+    """
+    Nowcast der Fälle nach Refdatum für die letzten Tage aller Ebenen als nowcast.csv.
+
+    Die Verzugstabelle wird je nach Form der Falldaten aus dem Dataframe,
+    Bundesland für Bundesland oder aus den benötigten Spalten der Datei gebildet.
+    """
+    spalten = ['Refdatum', 'Meldedatum', 'Datenstand', 'AnzahlFall']
+    if isinstance(data_df, Partitionen):
+        tabelle = nowcast.zusammenfassen(nowcast.verzugstabelle(data_df.laden(bl, spalten))
+                                         for bl in data_df.bundeslaender)
+    elif isinstance(data_df, str):
+        tabelle = nowcast.verzugstabelle(csv_lesen(data_df, usecols=spalten))
+    else:
+        tabelle = nowcast.verzugstabelle(data_df)
+    verzug = nowcast.verteilung(tabelle)
+
+    teile = []
+    for ebene, cube in stufen.items():
+        ergebnis = nowcast.nowcast(cube, verzug)
+        tage = numpy.flatnonzero(ergebnis.anteil < 1)
+        inzidenz = ergebnis.cube.inzidenz()[:, tage, cube.metriken.index('AnzahlFall')]
+        teile.append(pd.DataFrame({
+            'Ebene': ebene, 'Id': numpy.repeat(cube.ids, len(tage)),
+            'Refdatum': numpy.tile(cube.dates[tage].to_numpy(), len(cube.ids)),
+            'anteil_gemeldet': numpy.tile(ergebnis.anteil[tage], len(cube.ids)),
+            'beobachtet': ergebnis.beobachtet[:, tage].ravel(),
+            'schaetzung': ergebnis.cube.metrik('AnzahlFall')[:, tage].ravel(),
+            'unten': ergebnis.unten[:, tage].ravel(), 'oben': ergebnis.oben[:, tage].ravel(),
+            'FaelleEWZ_7': inzidenz.ravel()}))
+    pfad = _pfad(cfg, 'nowcast.csv')
+    pd.concat(teile, ignore_index=True).to_csv(pfad, index=False)
+    return pfad
+
+
+def wellen_stufe(cfg, stufen):
+    """
+    Wellen in der Tagesinzidenz der Fälle aller Ebenen (siehe *wellen.Wellenerkennung*)
+    als wellen.csv; liefert die Wellen für Deutschland.
+    """
+    zeilen, ergebnis = [], ()
+    for ebene, cube in stufen.items():
+        gefunden = wellen.erkennen(cube.tagesinzidenz()[:, :, cube.metriken.index('AnzahlFall')], cube.dates)
+        for kennung, liste in zip(cube.ids, gefunden):
+            zeilen += [dict(w._asdict(), Ebene=ebene, Id=kennung) for w in liste]
+        if ebene == 'deutschland':
+            ergebnis = tuple(gefunden[0])
+    pd.DataFrame(zeilen, columns=['Ebene', 'Id'] + list(wellen.Welle._fields)).to_csv(_pfad(cfg, 'wellen.csv'),
+                                                                                     index=False)
+    return ergebnis
+
+
+def gewichte(cfg, kreise_df):
+    """Nachbarschaftsmatrix der Landkreise (Queen)."""
+    return nachbarschaft.queen(kreise_df['SHAPE'])
+
+
+def diagramm(cfg, stufen, kreise_df, metrik, titel, datei):
+    """Verlauf der 7-Tage-Inzidenz pro Bundesland als PDF (In[42]-In[44])."""
+    namen = kreise_df.assign(BL_ID=kreise_df['AGS'].str[:2]).groupby('BL_ID')['BL'].first() \
+        if 'BL' in kreise_df else {}
+    return diagramme.verlauf(stufen['bundesland'], metrik, titel, _pfad(cfg, datei), namen)
+
+
+def analysefeld(cfg, stufen, w):
+    """
+    7-Tage-Inzidenz der Landkreise, auf der Hot Spots, Ausreißer und Space-Time
+    Cubes rechnen; mit cfg['analysefeld'] Empirical-Bayes-geglättet (siehe *glaettung*).
+    """
+    kreis = stufen['kreis']
+    art = cfg.get('analysefeld', 'inzidenz')
+    return {'ids': kreis.ids, 'dates': kreis.dates, 'art': art, 'werte': glaettung.inzidenz(kreis, art, w)}
+
+
+def moran(cfg, feld, w):
+    """Globales Moran's I des Analysefelds für jeden Tag als moran.csv (siehe *autokorrelation*)."""
+    ergebnis = autokorrelation.globales_moran(feld['werte'], w)
+    df = pd.DataFrame({'Datum': feld['dates'], 'moran_i': ergebnis.i, 'erwartung': ergebnis.erwartung,
+                       'varianz': ergebnis.varianz, 'z': ergebnis.z, 'p': ergebnis.p})
+    df.to_csv(_pfad(cfg, 'moran.csv'), index=False)
+    return df
+
+
+def _am_peak(feld, welle):
+    return feld['ids'], feld['werte'][:, wellen.peak_tag(welle, feld['dates'])]
+
+
+def hotspot(cfg, feld, w, kreise_df, welle):
+    """Getis-Ord Gi* der 7-Tage-Inzidenz am Hochpunkt der Welle (In[61]-In[67])."""
+    ids, werte = _am_peak(feld, welle)
+    ergebnis = backends.ausfuehren('hotspot', cfg, ids, werte, w, kreise_df, 'HotSpot_' + welle.name)
+    ergebnis.insert(1, 'faelle_ewz_7', werte)
+    ergebnis.to_csv(_pfad(cfg, 'hotspot_%s.csv' % welle.name), index=False)
+    return ergebnis
+
+
+def ausreisser(cfg, feld, w, kreise_df, welle):
+    """Local Moran's I der 7-Tage-Inzidenz am Hochpunkt der Welle (In[68]-In[80])."""
+    ids, werte = _am_peak(feld, welle)
+    ergebnis = backends.ausfuehren('ausreisser', cfg, ids, werte, w, kreise_df, 'Outliers_' + welle.name)
+    ergebnis.insert(1, 'faelle_ewz_7', werte)
+    ergebnis.to_csv(_pfad(cfg, 'ausreisser_%s.csv' % welle.name), index=False)
+    return ergebnis
+
+
+def space_time_cube(cfg, feld, kreise_df, welle):
+    """
+    Mittlere 7-Tage-Inzidenz pro Landkreis und Zeitschritt der Welle
+    (CreateSpaceTimeCubeDefinedLocations, In[81]-In[91]); als stc_<Welle>.npz.
+    """
+    auswahl = (feld['dates'] >= welle.start) & (feld['dates'] <= welle.ende)
+    ergebnis = backends.ausfuehren('cube', cfg, feld['ids'], feld['dates'][auswahl], feld['werte'][:, auswahl],
+                                   welle.intervall, kreise_df, 'stc_' + welle.name)
+    numpy.savez_compressed(_pfad(cfg, 'stc_%s.npz' % welle.name), ids=ergebnis['ids'],
+                           enden=ergebnis['enden'].values, werte=ergebnis['werte'])
+    return ergebnis
+
+
+def emerging(cfg, stc, w, kreise_df, welle):
+    """Emerging Hot Spot Analysis auf dem Space-Time Cube der Welle (In[120]-In[138])."""
+    ergebnis = backends.ausfuehren('emerging', cfg, stc, w, kreise_df, 'emerg_' + welle.name)
+    ergebnis.to_csv(_pfad(cfg, 'emerg_%s.csv' % welle.name), index=False)
+    return ergebnis
+
+
+def clustering(cfg, stc, kreise_df, welle):
+    """Time Series Clustering nach Wert (In[161]-In[167])."""
+    ergebnis = backends.ausfuehren('clustering', cfg, stc, kreise_df, 'clust_' + welle.name, cfg.get('seed', 0))
+    ergebnis.to_csv(_pfad(cfg, 'clust_%s.csv' % welle.name), index=False)
+    return ergebnis
+
+
+def raumzeit_scan(cfg, stufen, kreise_df):
+    """
+    Space-Time-Cluster der Fälle nach Kulldorff über den ganzen Zeitraum als
+    scan.csv (siehe *scan*); Anzahl der Replikationen aus cfg['scan_replikationen'].
+    """
+    kreis = stufen['kreis']
+    zentren = nachbarschaft.schwerpunkte(kreise_df['SHAPE'])
+    ergebnis = scan.fuer_cube(kreis, zentren, replikationen=cfg.get('scan_replikationen', scan.REPLIKATIONEN),
+                              seed=cfg.get('seed', 0))
+    ergebnis.to_csv(_pfad(cfg, 'scan.csv'), index=False)
+    return ergebnis
+
+
+def ergebnisse_speichern(cfg, kreise_df, kreis_cube, *ergebnisse, namen=()):
+    """
+    Landkreise mit Geometrie, *data_ewz* und die Ergebnisse der Stufen *namen*
+    als results.gpkg statt der Results.gdb (In[77]-In[167], siehe *geopackage*).
+    Ergebnisse pro Landkreis (mit Spalte 'AGS') erhalten dessen Geometrie.
+    """
+    geo = geopackage.geometrien(kreise_df['SHAPE'])
+    ags = kreise_df['AGS'].to_numpy()
+    pfad = _pfad(cfg, 'results.gpkg')
+    with geopackage.Geopackage(pfad) as gpkg:
+        gpkg.schreiben('kreise', kreise_df.drop(columns='SHAPE'), geo)
+        gpkg.schreiben('data_ewz', _data_ewz(cfg, kreis_cube, kreise_df))
+        for name, df in zip(namen, ergebnisse):
+            if 'AGS' in df:
+                gpkg.schreiben(name, df, geopackage.auswahl(geo, numpy.searchsorted(ags, df['AGS'].astype(str))))
+            else:
+                gpkg.schreiben(name, df)
+    return pfad
+
+
+def kacheln_stufe(cfg, kreise_df, feld):
+    """
+    Vektorkacheln der Landkreise und eine Datei mit den Werten des
+    Analysefelds pro Tag statt einer Tageskarte mit allen Geometrien
+    (In[39], In[47]); im Verzeichnis 'kacheln' (siehe *kacheln*).
+    """
+    name = 'FaelleEWZ_7' if feld['art'] == 'inzidenz' else feld['art']
+    return kacheln.schreiben(_pfad(cfg, 'kacheln'), kreise_df, feld['dates'], {name: feld['werte']},
+                             ids=feld['ids'], zoom=tuple(cfg.get('kachel_zoom', kacheln.ZOOM)))
+
+
+def notebook_graph(wellen=WELLEN_NOTEBOOK, mit_diagrammen=True):
+    """
+    Abhängigkeitsgraph der Notebook-Stufen als geordnetes Dict Name -> Stufe.
+
+    Ohne *mit_diagrammen* fehlen die Verlaufsdiagramme; dann wird matplotlib
+    nie geladen. Für jede Welle aus *wellen* entstehen Hot-Spot-, Ausreißer-,
+    Cube-, Emerging- und Clustering-Stufen; die Stufe 'wellen' erkennt die
+    Wellen in den Daten (siehe *main()* mit --wellen erkennen).
+    """
+    stufen = [
+        Stufe('kreise', kreise),
+        Stufe('daten', daten, ('kreise',), zwischenstand=False),
+        Stufe('cube', cube, ('daten', 'kreise')),
+        Stufe('ebenen', ebenen, ('cube', 'kreise')),
+        Stufe('gewichte', gewichte, ('kreise',)),
+        Stufe('analysefeld', analysefeld, ('ebenen', 'gewichte')),
+        Stufe('moran', moran, ('analysefeld', 'gewichte')),
+        Stufe('export', export, ('ebenen', 'kreise')),
+        Stufe('kennzahlen', kennzahlen, ('ebenen',)),
+        Stufe('nowcast', nowcast_stufe, ('daten', 'ebenen')),
+        Stufe('scan', raumzeit_scan, ('ebenen', 'kreise')),
+        Stufe('wellen', wellen_stufe, ('ebenen',)),
+        Stufe('kacheln', kacheln_stufe, ('kreise', 'analysefeld')),
+    ]
+    for metrik, titel in (('AnzahlFall', 'Fälle'), ('AnzahlTodesfall', 'Todesfälle'),
+                          ('AnzahlGenesen', 'Genesene')) if mit_diagrammen else ():
+        name = INZIDENZ_SPALTEN[metrik][:-3]
+        stufen.append(Stufe('diagramm_' + name.lower(), partial(diagramm, metrik=metrik, titel=titel,
+                                                                datei='Verlauf%s.pdf' % name), ('ebenen', 'kreise')))
+    for welle in wellen:
+        stufen += [
+            Stufe('hotspot_' + welle.name, partial(hotspot, welle=welle), ('analysefeld', 'gewichte', 'kreise')),
+            Stufe('ausreisser_' + welle.name, partial(ausreisser, welle=welle), ('analysefeld', 'gewichte', 'kreise')),
+            Stufe('stc_' + welle.name, partial(space_time_cube, welle=welle), ('analysefeld', 'kreise')),
+            Stufe('emerging_' + welle.name, partial(emerging, welle=welle),
+                  ('stc_' + welle.name, 'gewichte', 'kreise')),
+            Stufe('clustering_' + welle.name, partial(clustering, welle=welle), ('stc_' + welle.name, 'kreise')),
+        ]
+    namen = ('moran', 'scan') + tuple('%s_%s' % (art, welle.name) for welle in wellen
+                                      for art in ('hotspot', 'ausreisser', 'emerging', 'clustering'))
+    stufen.append(Stufe('geopackage', partial(ergebnisse_speichern, namen=namen), ('kreise', 'cube') + namen))
+    return OrderedDict((s.name, s) for s in stufen)
+
+
+def _vorgaenger(graph, ziele):
+    """Alle Stufen, die für *ziele* nötig sind, in der Reihenfolge des Graphen."""
+    offen, noetig = list(ziele), set()
+    while offen:
+        name = offen.pop()
+        if name not in graph:
+            raise KeyError('Unbekannte Stufe %s' % name)
+        if name not in noetig:
+            noetig.add(name)
+            offen.extend(graph[name].abhaengig)
+    return [n for n in graph if n in noetig]
+
+
+def _kennung(cfg):
+    """Hash der Konfiguration inklusive Größe und Änderungszeit der Eingabedateien."""
+    teile = dict(cfg)
+    for schluessel in ('daten', 'kreise'):
+        if cfg.get(schluessel) and os.path.exists(cfg[schluessel]):
+            info = os.stat(cfg[schluessel])
+            teile[schluessel + '_datei'] = (info.st_size, info.st_mtime_ns)
+    return hashlib.sha1(json.dumps(teile, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+class Zustand:
+    """Zwischenstände fertiger Stufen in einem Verzeichnis (Pickle pro Stufe)."""
+
+    def __init__(self, pfad, kennung, neu=False):
+        self.pfad = pfad
+        self.kennung = kennung
+        os.makedirs(pfad, exist_ok=True)
+        self.fertig = []
+        datei = os.path.join(pfad, 'zustand.json')
+        if not neu and os.path.exists(datei):
+            with open(datei, encoding='utf-8') as f:
+                gespeichert = json.load(f)
+            if gespeichert['kennung'] == kennung:
+                self.fertig = [n for n in gespeichert['fertig'] if os.path.exists(self._datei(n))]
+            else:
+                log.info('Konfiguration oder Eingabedaten geändert, beginne neu')
+
+    def _datei(self, name):
+        return os.path.join(self.pfad, name + '.pkl')
+
+    def _index_schreiben(self):
+        tmp = os.path.join(self.pfad, 'zustand.json.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'kennung': self.kennung, 'fertig': self.fertig}, f, indent=1)
+        os.replace(tmp, os.path.join(self.pfad, 'zustand.json'))
+
+    def speichern(self, name, ergebnis):
+        tmp = self._datei(name) + '.tmp'
+        with open(tmp, 'wb') as f:
+            pickle.dump(ergebnis, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._datei(name))
+        if name not in self.fertig:
+            self.fertig.append(name)
+        self._index_schreiben()
+
+    def laden(self, name):
+        with open(self._datei(name), 'rb') as f:
+            return pickle.load(f)
+
+
+def _stufe_ausfuehren(stufe, cfg, eingaben):
+    with tracing.spanne(stufe.name):
+        wand, cpu = time.perf_counter(), time.process_time()
+        ergebnis = stufe.funktion(cfg, *eingaben)
+        return ergebnis, time.perf_counter() - wand, time.process_time() - cpu
+
+
+def ausfuehren(graph, cfg, ziele=None, arbeiter=None, prozesse=False, zustand=None):
+    """
+    Führt die für *ziele* (Standard: alle) nötigen Stufen aus.
+
+    Unabhängige Stufen laufen gleichzeitig auf *arbeiter* Threads bzw. mit
+    *prozesse* in eigenen Prozessen. Stufen aus *zustand* werden nicht erneut
+    ausgeführt; ihre Ergebnisse werden nur geladen, wenn eine offene Stufe sie
+    braucht. Schlägt eine Stufe fehl, laufen alle von ihr unabhängigen Stufen
+    weiter. Liefert ein Dict Name -> 'fertig', 'übernommen', 'fehler' oder
+    'übersprungen'.
+    """
+    stufen = _vorgaenger(graph, ziele or list(graph))
+    fertig = set(zustand.fertig if zustand else ()) & {n for n in stufen if graph[n].zwischenstand}
+
+    # Stufen ohne Zwischenstand nur ausführen, wenn eine offene Stufe sie braucht
+    offen = set()
+    for name in reversed(stufen):
+        ziel = name in ziele if ziele else graph[name].zwischenstand
+        if name not in fertig and (ziel or any(name in graph[n].abhaengig for n in offen)):
+            offen.add(name)
+    status = {n: 'übernommen' for n in stufen if n not in offen}
+    nachfolger = {n: [m for m in offen if n in graph[m].abhaengig] for n in stufen}
+    ergebnisse = {}
+
+    def eingabe(name):
+        if name not in ergebnisse:
+            ergebnisse[name] = zustand.laden(name)
+        return ergebnisse[name]
+
+    pool = (ProcessPoolExecutor if prozesse else ThreadPoolExecutor)(max_workers=arbeiter)
+    laufend = {}
+    try:
+        while offen or laufend:
+            for name in [n for n in stufen if n in offen]:
+                if all(status.get(v) in ('fertig', 'übernommen') for v in graph[name].abhaengig):
+                    offen.discard(name)
+                    eingaben = [eingabe(v) for v in graph[name].abhaengig]
+                    laufend[pool.submit(_stufe_ausfuehren, graph[name], cfg, eingaben)] = name
+                    log.info('Starte %s', name)
+                elif any(status.get(v) in ('fehler', 'übersprungen') for v in graph[name].abhaengig):
+                    offen.discard(name)
+                    status[name] = 'übersprungen'
+                    log.warning('Überspringe %s', name)
+            if not laufend:
+                continue
+            erledigt, _ = wait(laufend, return_when=FIRST_COMPLETED)
+            for future in erledigt:
+                name = laufend.pop(future)
+                try:
+                    ergebnis, wand, cpu = future.result()
+                except Exception:
+                    status[name] = 'fehler'
+                    log.exception('Stufe %s fehlgeschlagen', name)
+                    continue
+                status[name] = 'fertig'
+                ergebnisse[name] = ergebnis
+                if zustand and graph[name].zwischenstand:
+                    zustand.speichern(name, ergebnis)
+                log.info('Fertig %s (%.2f s, CPU %.2f s)', name, wand, cpu)
+            # Ergebnisse ohne offene Nachfolger freigeben
+            for name in list(ergebnisse):
+                if all(status.get(m) in ('fertig', 'fehler', 'übersprungen') for m in nachfolger[name]):
+                    del ergebnisse[name]
+    finally:
+        pool.shutdown(cancel_futures=True)
+    return OrderedDict((n, status[n]) for n in stufen)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Unbeaufsichtigte Ausführung der Notebook-Stufen')
+    quelle = parser.add_mutually_exclusive_group()
+    quelle.add_argument('--daten', help='RKI_COVID19.csv')
+    quelle.add_argument('--synthetisch', type=float, default=None,
+                        help='synthetische Daten als Vielfaches von 3.627.499 Zeilen (Standard 0.1)')
+    parser.add_argument('--kreise', help='Landkreise als CSV mit AGS, EWZ, EWZ_BL, BL und SHAPE (Esri-JSON)')
+    parser.add_argument('--partitionen', help='Falldaten nach Bundesländern in dieses Verzeichnis aufteilen und '
+                                              'einzeln verarbeiten (begrenzt den Speicherbedarf)')
+    parser.add_argument('--einlesen', type=int, metavar='PROZESSE',
+                        help='Falldaten mit so vielen Prozessen parallel einlesen und aggregieren')
+    parser.add_argument('--ausgabe', default='home', help='Verzeichnis für alle Ergebnisse')
+    parser.add_argument('--zustand', help='Verzeichnis für Zwischenstände (Standard: <ausgabe>/.zustand)')
+    parser.add_argument('--stufen', nargs='+', help='nur diese Stufen und ihre Vorgänger')
+    parser.add_argument('--arbeiter', type=int, default=None, help='Anzahl paralleler Stufen')
+    parser.add_argument('--prozesse', action='store_true', help='Prozesse statt Threads verwenden')
+    parser.add_argument('--neu', action='store_true', help='Zwischenstände verwerfen')
+    parser.add_argument('--ohne-diagramme', action='store_true',
+                        help='nur rechnen: keine Verlaufsdiagramme, matplotlib wird nicht geladen')
+    parser.add_argument('--analysefeld', choices=glaettung.ANALYSEFELDER, default='inzidenz',
+                        help='7-Tage-Inzidenz roh oder Empirical-Bayes-geglättet als Grundlage der Analysen')
+    parser.add_argument('--backend', nargs='+', help='Analyse-Backend für alle Arten (z.B. arcgis) oder art=name, '
+                                                     'siehe python -m covid_analyse.backends liste')
+    parser.add_argument('--wellen', choices=('notebook', 'erkennen'), default='notebook',
+                        help='Wellen aus dem Notebook oder in den Daten erkannte Wellen (Deutschland) analysieren')
+    parser.add_argument('--scan-replikationen', type=int, default=scan.REPLIKATIONEN,
+                        help='Monte-Carlo-Replikationen der Scan-Statistik')
+    parser.add_argument('--speicherprofil', action='store_true',
+                        help='data_ewz in kleineren Datentypen ablegen und die Ersparnis berichten')
+    parser.add_argument('--kachel-zoom', type=int, nargs=2, metavar=('MIN', 'MAX'), default=kacheln.ZOOM,
+                        help='Zoomstufen der Vektorkacheln (Standard %d %d)' % kacheln.ZOOM)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--trace', help='Chrome-Trace in diese Datei schreiben')
+    parser.add_argument('--liste', action='store_true', help='Stufen und Abhängigkeiten ausgeben')
+    args = parser.parse_args(argv)
+
+    graph = notebook_graph(mit_diagrammen=not args.ohne_diagramme)
+    if args.liste:
+        for stufe in graph.values():
+            print('%-22s <- %s' % (stufe.name, ', '.join(stufe.abhaengig) or '-'))
+        return 0
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    cfg = {'ausgabe': os.path.abspath(args.ausgabe), 'seed': args.seed}
+    if args.daten:
+        cfg['daten'] = os.path.abspath(args.daten)
+        if args.partitionen:
+            cfg['partitionen'] = os.path.abspath(args.partitionen)
+        elif args.einlesen:
+            cfg['einlesen'] = args.einlesen
+    else:
+        cfg['synthetisch'] = args.synthetisch if args.synthetisch is not None else 0.1
+    if args.kreise:
+        cfg['kreise'] = os.path.abspath(args.kreise)
+    if args.analysefeld != 'inzidenz':
+        cfg['analysefeld'] = args.analysefeld
+    if args.backend:
+        cfg['backends'] = backends.aus_argumenten(args.backend)
+    if args.scan_replikationen != scan.REPLIKATIONEN:
+        cfg['scan_replikationen'] = args.scan_replikationen
+    if args.wellen != 'notebook':
+        cfg['wellen'] = args.wellen
+    if args.speicherprofil:
+        cfg['speicherprofil'] = True
+    if tuple(args.kachel_zoom) != kacheln.ZOOM:
+        cfg['kachel_zoom'] = tuple(args.kachel_zoom)
+    zustand = Zustand(args.zustand or os.path.join(cfg['ausgabe'], '.zustand'), _kennung(cfg), args.neu)
+
+    with tracing.aufzeichnen(args.trace) if args.trace else tracing.spanne('pipeline'):
+        if args.wellen == 'erkennen':
+            # Erst bis zur Wellenerkennung rechnen, dann den Graphen mit den erkannten Wellen aufbauen;
+            # fertige Stufen werden dabei aus dem Zustand übernommen
+            status = ausfuehren(graph, cfg, ['wellen'], args.arbeiter, args.prozesse, zustand)
+            if status['wellen'] in ('fertig', 'übernommen'):
+                erkannt = zustand.laden('wellen')
+                log.info('Erkannte Wellen: %s', ', '.join('%s %s - %s' % (w.name, w.start.date(), w.ende.date())
+                                                          for w in erkannt) or '-')
+                graph = notebook_graph(erkannt, mit_diagrammen=not args.ohne_diagramme)
+                status = ausfuehren(graph, cfg, args.stufen, args.arbeiter, args.prozesse, zustand)
+        else:
+            status = ausfuehren(graph, cfg, args.stufen, args.arbeiter, args.prozesse, zustand)
+    for name, wert in status.items():
+        print('%-22s %s' % (name, wert))
+    return 1 if any(w in ('fehler', 'übersprungen') for w in status.values()) else 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
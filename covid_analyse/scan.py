@@ -0,0 +1,245 @@
+"""
+Raum-zeitliche Scan-Statistik nach Kulldorff (Poisson-Modell).
+
+Hot Spots und Emerging Hot Spots (In[61]-In[67], In[120]-In[138]) bewerten
+jeden Landkreis einzeln. Die Scan-Statistik sucht dagegen zusammenhängende
+Cluster: Zylinder aus benachbarten Landkreisen (Grundfläche) und einem
+Zeitfenster (Höhe), in denen mehr Fälle auftreten als erwartet.
+
+Kandidaten:
+
+- Grundflächen sind für jeden Landkreis er selbst und seine nächsten
+  Nachbarn (nach Abstand der Schwerpunkte), bis zusammen höchstens
+  *max_anteil* der Bevölkerung erreicht ist.
+- Zeitfenster sind alle Folgen von 1 bis *max_dauer* Tagen, in
+  Zeitschritten von *schritt* Tagen wie in einem Space-Time Cube.
+
+Erwartet werden in einem Zylinder die Fälle aller Landkreise im Zeitfenster
+mal dem Bevölkerungsanteil der Grundfläche. Die Zylinder werden nicht
+einzeln summiert: Eine kumulierte Summe über die Nachbarn (in
+Abstandsreihenfolge) und eine über die Zeit liefern die Fälle jedes
+Zylinders als Differenz zweier Einträge, für alle Zentren und Fensterenden
+gleichzeitig. Aus denselben Differenzen folgt die obere Schranke
+c (c - e) / e der Log-Likelihood-Ratio (c beobachtet, e erwartet); berechnet
+wird die Ratio nur für Zylinder, deren Schranke über dem bisher besten Wert
+liegt. Bei den Replikationen bleibt so meist nur ein kleiner Teil übrig.
+
+Die Signifikanz ergibt sich aus Monte-Carlo-Replikationen, in denen die
+Fälle jedes Zeitschritts nach Bevölkerung auf die Landkreise verteilt
+werden. Die Replikationen laufen in Blöcken mit eigenem Seed in einem
+Prozesspool; das Ergebnis hängt daher nicht von der Anzahl der Prozesse ab.
+"""
+
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy
+import pandas as pd
+
+from covid_analyse import tracing, zeitbins
+from covid_analyse.fenster import kumuliert
+
+
+MAX_ANTEIL = 0.1
+MAX_DAUER = 91
+REPLIKATIONEN = 999
+
+# Replikationen pro Auftrag an den Prozesspool
+BLOCK = 25
+
+# reihenfolge: Landkreise jeder Grundfläche nach Abstand (Zentren, Nachbarn);
+# gueltig: Grundfläche innerhalb der Bevölkerungsgrenze; anteil: Bevölkerungsanteil
+Zonen = namedtuple('Zonen', ['reihenfolge', 'gueltig', 'anteil'])
+
+
+def zonen(zentren, ewz, max_anteil=MAX_ANTEIL):
+    """
+    Grundflächen um jeden Schwerpunkt aus *zentren* (Landkreise, 2).
+
+    Die k-te Grundfläche eines Zentrums enthält das Zentrum und seine k-1
+    nächsten Nachbarn. Jedes Zentrum hat mindestens die Grundfläche aus sich
+    selbst, auch wenn es allein *max_anteil* überschreitet.
+    """
+    zentren = numpy.asarray(zentren, dtype=float)
+    ewz = numpy.asarray(ewz, dtype=float)
+    abstand = ((zentren[:, None, :] - zentren[None, :, :]) ** 2).sum(axis=2)
+    # Das Zentrum selbst zuerst, auch bei identischen Schwerpunkten
+    numpy.fill_diagonal(abstand, -1)
+    reihenfolge = numpy.argsort(abstand, axis=1, kind='stable')
+    anteil = numpy.cumsum(ewz[reihenfolge], axis=1) / ewz.sum()
+    gueltig = anteil <= max_anteil
+    gueltig[:, 0] = True
+    breite = int(gueltig.sum(axis=1).max())
+    return Zonen(reihenfolge[:, :breite], gueltig[:, :breite], anteil[:, :breite])
+
+
+def likelihood_ratio(beobachtet, erwartet, gesamt):
+    """
+    Log-Likelihood-Ratio des Poisson-Modells für erhöhte Fallzahlen.
+
+    0, wo nicht mehr als erwartet beobachtet wird.
+    """
+    c, e = numpy.broadcast_arrays(numpy.asarray(beobachtet, dtype=float), numpy.asarray(erwartet, dtype=float))
+    ergebnis = numpy.zeros(c.shape)
+    hoch = c > e
+    ergebnis[hoch] = _llr(c[hoch], e[hoch], gesamt)
+    return ergebnis
+
+
+def _llr(c, e, gesamt):
+    """Log-Likelihood-Ratio für c > e (eindimensionale Arrays)."""
+    aussen = gesamt - c
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        rest = aussen * numpy.log(aussen / (gesamt - e))
+    return c * numpy.log(c / e) + numpy.where(aussen > 0, rest, 0.0)
+
+
+def _zylinder_summen(werte, zonen_):
+    """Kumulierte Fälle (Zentren, Nachbarn, Schritte + 1) aller Grundflächen."""
+    raeumlich = numpy.cumsum(werte[zonen_.reihenfolge], axis=1)
+    return kumuliert(raeumlich, achse=2)
+
+
+def _bestes_fenster(summe, zonen_, gesamt_kumuliert, max_dauer, nur_maximum=False):
+    """
+    Höchste Log-Likelihood-Ratio jeder Grundfläche über alle Zeitfenster bis
+    *max_dauer* Schritte. Liefert (llr, Ende, Länge), jeweils (Zentren,
+    Nachbarn), mit *nur_maximum* nur den höchsten Wert aller Zylinder.
+
+    Mit ln(x) <= (x^2 - 1) / 2x für x >= 1 und ln(y) <= y - 1 ist die Ratio
+    höchstens (c - e)^2 (C + e) / (2 e (C - e)) (C alle Fälle). Diese
+    Schranke wird für alle Zylinder in einfacher Genauigkeit gebildet;
+    exakt berechnet werden nur Zylinder, deren Schranke den bisher besten
+    Wert der Grundfläche (bzw. aller Grundflächen) übersteigt.
+    """
+    gesamt = float(gesamt_kumuliert[-1])
+    form = zonen_.gueltig.shape
+    bestes = numpy.zeros(form)
+    ende = numpy.zeros(form, dtype=numpy.int64)
+    laenge = numpy.zeros(form, dtype=numpy.int64)
+    maximum = 0.0
+    grob = summe.astype(numpy.float32)
+    anteil = zonen_.anteil.astype(numpy.float32)[:, :, None]
+    gueltig = zonen_.gueltig[:, :, None]
+    for dauer in range(1, min(max_dauer, len(gesamt_kumuliert) - 1) + 1):
+        fenster = gesamt_kumuliert[dauer:] - gesamt_kumuliert[:-dauer]
+        c = grob[:, :, dauer:] - grob[:, :, :-dauer]
+        e = anteil * fenster.astype(numpy.float32)
+        # (C - e) / (C + e) durch den kleinsten Wert ersetzt; 0.999 als Reserve für Rundungsfehler
+        e_max = zonen_.anteil.max() * fenster.max()
+        faktor = 2 * 0.999 * (gesamt - e_max) / (gesamt + e_max)
+        schwelle = numpy.float32(faktor) * (numpy.float32(maximum) if nur_maximum else
+                                            bestes.astype(numpy.float32)[:, :, None])
+        d = c - e
+        z, k, t = numpy.nonzero((d > 0) & (d * d > schwelle * e) & gueltig)
+        if not len(z):
+            continue
+        exakt_e = zonen_.anteil[z, k] * fenster[t]
+        exakt_c = (summe[z, k, t + dauer] - summe[z, k, t]).astype(float)
+        werte = numpy.where(exakt_c > exakt_e, _llr(exakt_c, exakt_e, gesamt), 0.0)
+        if nur_maximum:
+            maximum = max(maximum, werte.max())
+            continue
+        llr = numpy.zeros(c.shape)
+        llr[z, k, t] = werte
+        position = llr.argmax(axis=2)
+        wert = numpy.take_along_axis(llr, position[:, :, None], axis=2)[:, :, 0]
+        besser = wert > bestes
+        bestes[besser] = wert[besser]
+        ende[besser] = position[besser] + dauer
+        laenge[besser] = dauer
+    if nur_maximum:
+        return maximum
+    return bestes, ende, laenge
+
+
+def _replikationen(zonen_, gesamt_schritte, ewz_anteil, max_dauer, seed, anzahl):
+    """Höchste Log-Likelihood-Ratio von *anzahl* Replikationen unter der Nullhypothese."""
+    rng = numpy.random.default_rng(seed)
+    gesamt_kumuliert = kumuliert(gesamt_schritte, achse=0)
+    ergebnis = numpy.empty(anzahl)
+    for i in range(anzahl):
+        werte = rng.multinomial(gesamt_schritte, ewz_anteil).T
+        ergebnis[i] = _bestes_fenster(_zylinder_summen(werte, zonen_), zonen_, gesamt_kumuliert, max_dauer, True)
+    return ergebnis
+
+
+def monte_carlo(zonen_, gesamt_schritte, ewz, max_dauer, replikationen=REPLIKATIONEN, prozesse=None, seed=0):
+    """
+    Höchste Log-Likelihood-Ratio jeder Replikation.
+
+    Die Fälle jedes Zeitschritts (*gesamt_schritte*) werden multinomial nach
+    *ewz* verteilt. Mit prozesse=1 läuft alles im aufrufenden Prozess.
+    """
+    ewz = numpy.asarray(ewz, dtype=float)
+    gesamt_schritte = numpy.asarray(gesamt_schritte, dtype=numpy.int64)
+    bloecke = [min(BLOCK, replikationen - start) for start in range(0, replikationen, BLOCK)]
+    seeds = numpy.random.SeedSequence(seed).spawn(len(bloecke))
+    argumente = [(zonen_, gesamt_schritte, ewz / ewz.sum(), max_dauer, s, n) for s, n in zip(seeds, bloecke)]
+    with tracing.spanne('monte_carlo', replikationen=replikationen):
+        if prozesse == 1 or len(bloecke) < 2:
+            teile = [_replikationen(*a) for a in argumente]
+        else:
+            with ProcessPoolExecutor(max_workers=prozesse) as pool:
+                teile = list(pool.map(_replikationen, *zip(*argumente)))
+    return numpy.concatenate(teile) if teile else numpy.empty(0)
+
+
+def scan(faelle, ewz, zentren, ids, dates, schritt=7, max_anteil=MAX_ANTEIL, max_dauer=MAX_DAUER,
+         replikationen=REPLIKATIONEN, prozesse=None, seed=0, anzahl=10):
+    """
+    Space-Time-Cluster in *faelle* (Landkreise, Tage) als Dataframe.
+
+    *max_dauer* ist in Tagen angegeben. Berichtet werden bis zu *anzahl*
+    Cluster absteigend nach Log-Likelihood-Ratio, deren Landkreise sich nicht
+    mit einem höher bewerteten Cluster überschneiden (wie die sekundären
+    Cluster in SaTScan). Der p-Wert vergleicht jeden Cluster mit den höchsten
+    Werten der Replikationen und ist für sekundäre Cluster konservativ.
+    Negative Fallzahlen (Korrekturen) werden als 0 gezählt.
+    """
+    faelle = numpy.clip(numpy.rint(numpy.asarray(faelle, dtype=float)), 0, None).astype(numpy.int64)
+    werte = zeitbins.summen(faelle, schritt)
+    if not werte.size or not werte.sum():
+        raise ValueError('Keine Fälle für die Scan-Statistik')
+    rest = len(dates) - werte.shape[1] * schritt
+    enden = pd.DatetimeIndex(dates)[rest + schritt - 1::schritt]
+    dauer = max(max_dauer // schritt, 1)
+
+    zonen_ = zonen(zentren, ewz, max_anteil)
+    gesamt_schritte = werte.sum(axis=0)
+    with tracing.spanne('scan', zentren=zonen_.gueltig.shape[0], nachbarn=zonen_.gueltig.shape[1],
+                        schritte=werte.shape[1]):
+        llr, ende, laenge = _bestes_fenster(_zylinder_summen(werte, zonen_), zonen_,
+                                            kumuliert(gesamt_schritte, achse=0), dauer)
+    maxima = monte_carlo(zonen_, gesamt_schritte, ewz, dauer, replikationen, prozesse, seed)
+
+    ids = numpy.asarray(ids)
+    gesamt = gesamt_schritte.sum()
+    belegt = numpy.zeros(len(ids), dtype=bool)
+    zeilen = []
+    for flach in numpy.argsort(-llr, axis=None, kind='stable'):
+        z, k = numpy.unravel_index(flach, llr.shape)
+        if len(zeilen) == anzahl or llr[z, k] <= 0:
+            break
+        kreise = zonen_.reihenfolge[z, :k + 1]
+        if belegt[kreise].any():
+            continue
+        belegt[kreise] = True
+        von, bis = ende[z, k] - laenge[z, k], ende[z, k]
+        c = float(werte[kreise, von:bis].sum())
+        e = zonen_.anteil[z, k] * gesamt_schritte[von:bis].sum()
+        zeilen.append({
+            'zentrum': ids[z], 'kreise': ';'.join(sorted(ids[kreise])), 'anzahl_kreise': k + 1,
+            'start': enden[von] - pd.Timedelta(days=schritt - 1), 'ende': enden[bis - 1],
+            'beobachtet': c, 'erwartet': e, 'relatives_risiko': (c / e) / ((gesamt - c) / (gesamt - e)),
+            'llr': llr[z, k], 'p_wert': (1 + (maxima >= llr[z, k]).sum()) / (len(maxima) + 1)})
+    spalten = ['zentrum', 'kreise', 'anzahl_kreise', 'start', 'ende', 'beobachtet', 'erwartet', 'relatives_risiko',
+               'llr', 'p_wert']
+    ergebnis = pd.DataFrame(zeilen, columns=spalten)
+    ergebnis.insert(0, 'cluster', numpy.arange(1, len(ergebnis) + 1))
+    return ergebnis
+
+
+def fuer_cube(cube, zentren, metrik='AnzahlFall', **optionen):
+    """*scan()* für eine Kennzahl eines Landkreis-Cubes; *zentren* in der Reihenfolge von *cube.ids*."""
+    return scan(cube.metrik(metrik), cube.ewz, zentren, cube.ids, cube.dates, **optionen)
@@ -0,0 +1,235 @@
+"""
+Lokaler HTTP-Dienst für Abfragen auf dem vorberechneten Inzidenz-Cube.
+
+Der Cube wird einmal geladen, auf Bundesländer und Deutschland aggregiert und
+alle Kennzahlen (Fallzahlen, Tagesinzidenz, 7-Tage-Inzidenz) werden als
+Arrays (Einheiten, Tage) vorberechnet. Eine Abfrage ist danach nur noch ein
+Slice aus dem Speicher.
+
+Endpunkte (nur GET):
+
+    /meta                           Einheiten, Kennzahlen, Zeitraum und Datenversion
+    /reihe?id=01001&metrik=FaelleEWZ_7&von=2021-11-01&bis=2021-11-30
+                                    Zeitreihe einer oder mehrerer Einheiten
+                                    (id=01001,01002 oder id=05 für NRW, id=DE)
+
+Optionale Parameter von /reihe sind 'zeitachse' (Meldedatum/Refdatum) und
+'format' (json oder bin). Im Binärformat wird eine Matrix (Einheiten, Tage)
+als float32 little-endian geliefert; Zeitraum und Form stehen in den Headern.
+Jede Antwort trägt ein ETag aus der Datenversion, sodass Dashboards per
+If-None-Match nur bei neuen Daten tatsächlich Daten übertragen.
+
+Start: python -m covid_analyse.server home/cube.npz --port 8050
+"""
+
+import argparse
+import hashlib
+import json
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import numpy
+import pandas as pd
+
+from covid_analyse import tracing
+from covid_analyse.cube import Cube, INZIDENZ_SPALTEN
+from covid_analyse.hierarchie import Hierarchie
+
+
+class Abfragen:
+    """
+    Vorberechnete Kennzahlen aller Ebenen für schnelle Abfragen.
+
+    *reihen[(zeitachse, metrik)]* ist ein Array (alle Einheiten, Tage); die
+    Zeile einer Einheit steht in *zeile*.
+    """
+
+    def __init__(self, cube, version, hierarchie=None, fenster=7):
+        hierarchie = hierarchie or Hierarchie(cube.ids)
+        self.version = version
+        self.dates = cube.dates
+        self.zeitachsen = cube.zeitachsen
+        self.ebenen = {}
+        self.zeile = {}
+        self.reihen = {}
+
+        ebenen = hierarchie.aggregieren(cube)
+        for ebene, teil in ebenen.items():
+            self.ebenen[ebene] = teil.ids.tolist()
+            for i in teil.ids:
+                self.zeile[str(i)] = len(self.zeile)
+
+        for achse in cube.zeitachsen:
+            teile = [ebenen[e].mit_zeitachse(achse) for e in ebenen]
+            tag = [t.tagesinzidenz() for t in teile]
+            inz = [t.inzidenz(fenster) for t in teile]
+            for m, metrik in enumerate(cube.metriken):
+                spalte = INZIDENZ_SPALTEN.get(metrik, metrik + 'EWZ')
+                self.reihen[(achse, metrik)] = numpy.concatenate(
+                    [t.werte[:, :, m] for t in teile]).astype(numpy.float32)
+                self.reihen[(achse, spalte)] = numpy.concatenate([x[:, :, m] for x in tag]).astype(numpy.float32)
+                self.reihen[(achse, '%s_%d' % (spalte, fenster))] = numpy.concatenate(
+                    [x[:, :, m] for x in inz]).astype(numpy.float32)
+        self.metriken = sorted({m for _, m in self.reihen})
+
+    @classmethod
+    def aus_datei(cls, pfad, hierarchie=None):
+        """Lädt einen gespeicherten Cube; die Version ist der Hash der Datei."""
+        with open(pfad, 'rb') as f:
+            version = hashlib.sha1(f.read()).hexdigest()[:16]
+        return cls(Cube.laden(pfad), version, hierarchie)
+
+    def meta(self):
+        return {
+            'version': self.version,
+            'von': str(self.dates[0].date()),
+            'bis': str(self.dates[-1].date()),
+            'zeitachsen': list(self.zeitachsen),
+            'metriken': self.metriken,
+            'ebenen': self.ebenen,
+        }
+
+    def _tag(self, wert, standard):
+        """Tagesindex von *wert*, auch außerhalb der Daten (negativ oder hinter dem letzten Tag)."""
+        if not wert:
+            return standard
+        return (pd.Timestamp(wert) - self.dates[0]).days
+
+    def reihe(self, ids, metrik, von=None, bis=None, zeitachse=None):
+        """
+        Slice (Einheiten, Tage) einer Kennzahl.
+
+        Wirft KeyError für unbekannte Einheiten, Kennzahlen oder Zeitachsen.
+        """
+        zeitachse = zeitachse or self.zeitachsen[0]
+        if (zeitachse, metrik) not in self.reihen:
+            raise KeyError('Kennzahl %s nach %s' % (metrik, zeitachse))
+        reihen = self.reihen[(zeitachse, metrik)]
+        unbekannt = [i for i in ids if i not in self.zeile]
+        if unbekannt:
+            raise KeyError('Einheit %s' % ', '.join(unbekannt))
+        zeilen = [self.zeile[i] for i in ids]
+        # Mit den Daten schneiden: ein Zeitraum ganz außerhalb liefert keine Tage
+        start = max(self._tag(von, 0), 0)
+        ende = min(self._tag(bis, len(self.dates) - 1), len(self.dates) - 1)
+        tage = slice(start, max(ende + 1, start))
+        if len(zeilen) == 1:
+            werte = reihen[zeilen[0]:zeilen[0] + 1, tage]
+        else:
+            werte = reihen[zeilen, tage]
+        return self.dates[start] if ende >= start else None, werte
+
+
+class Handler(BaseHTTPRequestHandler):
+    """Beantwortet GET-Anfragen aus *server.abfragen*."""
+
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        if self.server.protokoll:
+            super().log_message(format, *args)
+
+    def _senden(self, status, inhalt=b'', typ='application/json', header=None, etag=None):
+        self.send_response(status)
+        if etag:
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'no-cache')
+        if status != HTTPStatus.NOT_MODIFIED:
+            self.send_header('Content-Type', typ)
+        self.send_header('Content-Length', str(len(inhalt)))
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Expose-Headers', 'ETag, X-Start, X-Form')
+        for name, wert in (header or {}).items():
+            self.send_header(name, wert)
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(inhalt)
+            self._spanne.bytes(len(inhalt))
+
+    def _fehler(self, status, text):
+        self._senden(status, json.dumps({'fehler': text}).encode('utf-8'))
+
+    def do_HEAD(self):
+        self.do_GET()
+
+    def do_GET(self):
+        with tracing.spanne(urlsplit(self.path).path, 'http') as self._spanne:
+            self._beantworten()
+
+    def _beantworten(self):
+        abfragen = self.server.abfragen
+        teile = urlsplit(self.path)
+        parameter = {k: v[-1] for k, v in parse_qs(teile.query).items()}
+        binaer = parameter.get('format') == 'bin' or (
+            'format' not in parameter and 'application/octet-stream' in self.headers.get('Accept', ''))
+        etag = '"%s-%s"' % (abfragen.version, 'bin' if binaer else 'json')
+
+        if teile.path not in ('/meta', '/reihe'):
+            return self._fehler(HTTPStatus.NOT_FOUND, 'Unbekannter Pfad %s' % teile.path)
+
+        # Erst die Parameter prüfen (die Abfrage ist nur ein Slice), dann das ETag:
+        # fehlerhafte Anfragen erhalten nie 304
+        if teile.path == '/reihe':
+            if 'id' not in parameter or 'metrik' not in parameter:
+                return self._fehler(HTTPStatus.BAD_REQUEST, 'Parameter id und metrik sind erforderlich')
+            ids = parameter['id'].split(',')
+            try:
+                start, werte = abfragen.reihe(ids, parameter['metrik'], parameter.get('von'), parameter.get('bis'),
+                                              parameter.get('zeitachse'))
+            except KeyError as e:
+                return self._fehler(HTTPStatus.NOT_FOUND, 'Unbekannt: %s' % (e.args[0],))
+            except ValueError as e:
+                return self._fehler(HTTPStatus.BAD_REQUEST, str(e))
+
+        treffer = [t.strip() for t in self.headers.get('If-None-Match', '').split(',')]
+        if etag in treffer or '*' in treffer:
+            return self._senden(HTTPStatus.NOT_MODIFIED, etag=etag)
+
+        if teile.path == '/meta':
+            return self._senden(HTTPStatus.OK, json.dumps(abfragen.meta()).encode('utf-8'), etag=etag)
+
+        start = str(start.date()) if start is not None else None
+        if binaer:
+            header = {'X-Start': start or '', 'X-Form': '%d,%d' % werte.shape}
+            return self._senden(HTTPStatus.OK, werte.astype('<f4').tobytes(), 'application/octet-stream',
+                                header, etag)
+        antwort = {
+            'version': abfragen.version,
+            'metrik': parameter['metrik'],
+            'zeitachse': parameter.get('zeitachse') or abfragen.zeitachsen[0],
+            'von': start,
+            'werte': {i: numpy.round(w.astype(float), 4).tolist() for i, w in zip(ids, werte)},
+        }
+        self._senden(HTTPStatus.OK, json.dumps(antwort).encode('utf-8'), etag=etag)
+
+
+def server(abfragen, host='127.0.0.1', port=8050, protokoll=False):
+    """HTTP-Server mit einem Thread pro Verbindung, noch nicht gestartet."""
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    httpd.daemon_threads = True
+    httpd.abfragen = abfragen
+    httpd.protokoll = protokoll
+    return httpd
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Abfragedienst für den Inzidenz-Cube')
+    parser.add_argument('cube', help='mit Cube.speichern() abgelegte npz-Datei')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8050)
+    parser.add_argument('--protokoll', action='store_true', help='Anfragen auf stderr ausgeben')
+    args = parser.parse_args(argv)
+
+    httpd = server(Abfragen.aus_datei(args.cube), args.host, args.port, args.protokoll)
+    print('Inzidenz-Cube unter http://%s:%d/meta' % httpd.server_address[:2])
+    try:
+        httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        httpd.server_close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,186 @@
+"""
+Kleinere Datentypen für die langen Tabellen *data_ewz* und *data_bl*.
+
+Die Tabellen aus In[28]-In[35] (hier *Cube.als_dataframe()*) halten Fallzahlen
+als int64, Inzidenzen als float64 und Kennungen als Python-Strings in
+object-Spalten, die sich in jeder Zeile wiederholen. Jeder Join und jedes
+groupby bewegt damit ein Vielfaches der nötigen Bytes.
+
+Ein Speicherprofil legt pro Spalte den kleinsten passenden Typ fest:
+
+- Ganzzahlen: int16, int32 oder int64, je nach Wertebereich der Spalte
+- Gleitkommazahlen: float32, wenn der größte relative Fehler gegenüber den
+  float64-Werten der Spalte höchstens *toleranz* beträgt, sonst float64
+- Strings: 'category', wenn sich die Werte oft genug wiederholen
+
+Der Fehler wird an den tatsächlichen Daten gemessen, nicht geschätzt. Wird ein
+gespeichertes Profil mit *anpassen()* auf neue Daten angewendet, z.B. einen
+späteren Datenstand, und passen Werte nicht mehr in den Typ, wird die Spalte
+automatisch auf den nächstgrößeren Typ erweitert.
+
+    data_ewz, bericht = speicherprofil.anwenden(cube.als_dataframe())
+    speicherprofil.ersparnis(bericht)
+"""
+
+import argparse
+from collections import namedtuple
+
+import numpy
+import pandas as pd
+
+
+# Kandidaten in aufsteigender Größe; der letzte Typ nimmt alle Werte auf
+GANZZAHLEN = (numpy.int16, numpy.int32, numpy.int64)
+GLEITKOMMA = (numpy.float32, numpy.float64)
+
+# Größter zulässiger relativer Fehler gegenüber float64
+TOLERANZ = 1e-6
+
+# Strings werden zur Kategorie, wenn höchstens dieser Anteil der Werte verschieden ist
+KATEGORIE_ANTEIL = 0.5
+
+Spaltenprofil = namedtuple('Spaltenprofil', ['spalte', 'vorher', 'nachher', 'bytes_vorher', 'bytes_nachher',
+                                             'max_fehler'])
+
+
+def ganzzahl_typ(werte, mindestens=GANZZAHLEN[0]):
+    """Kleinster Typ aus GANZZAHLEN (nicht kleiner als *mindestens*), der alle *werte* aufnimmt."""
+    werte = numpy.asarray(werte)
+    kandidaten = GANZZAHLEN[GANZZAHLEN.index(numpy.dtype(mindestens).type):]
+    if werte.size == 0:
+        return numpy.dtype(kandidaten[0])
+    kleinster, groesster = werte.min(), werte.max()
+    for typ in kandidaten:
+        info = numpy.iinfo(typ)
+        if info.min <= kleinster and groesster <= info.max:
+            return numpy.dtype(typ)
+    raise ValueError('Werte zwischen %s und %s passen in keinen Ganzzahltyp' % (kleinster, groesster))
+
+
+def relativer_fehler(werte, typ):
+    """Größter relativer Fehler, wenn *werte* als *typ* abgelegt werden; NaN bleibt NaN."""
+    genau = numpy.asarray(werte, dtype=numpy.float64)
+    with numpy.errstate(over='ignore', invalid='ignore'):
+        gerundet = genau.astype(typ).astype(numpy.float64)
+    endlich = numpy.isfinite(genau)
+    # Überlauf nach inf oder verlorene NaN zählen als unendlich großer Fehler
+    if (numpy.isfinite(gerundet) != endlich).any() or (numpy.isnan(gerundet) != numpy.isnan(genau)).any():
+        return numpy.inf
+    if not endlich.any():
+        return 0.0
+    genau, gerundet = genau[endlich], gerundet[endlich]
+    abweichung = numpy.abs(gerundet - genau)
+    with numpy.errstate(divide='ignore', invalid='ignore'):
+        relativ = numpy.where(genau != 0, abweichung / numpy.abs(genau), abweichung)
+    return float(relativ.max())
+
+
+def gleitkomma_typ(werte, toleranz=TOLERANZ, mindestens=GLEITKOMMA[0]):
+    """Kleinster Typ aus GLEITKOMMA mit höchstens *toleranz* relativem Fehler und dessen Fehler."""
+    kandidaten = GLEITKOMMA[GLEITKOMMA.index(numpy.dtype(mindestens).type):]
+    for typ in kandidaten[:-1]:
+        fehler = relativer_fehler(werte, typ)
+        if fehler <= toleranz:
+            return numpy.dtype(typ), fehler
+    return numpy.dtype(kandidaten[-1]), relativer_fehler(werte, kandidaten[-1])
+
+
+def _spalten_typ(spalte, toleranz, kategorien, mindestens=None):
+    """
+    Zieltyp und Fehler einer Spalte; *mindestens* ist der Typ eines vorhandenen
+    Profils. Passt dessen Art nicht mehr zur Spalte (z.B. Gleitkommazahlen oder
+    NaN in einer Ganzzahlspalte), wird auf float64 erweitert bzw. bei
+    Kategorien der Typ der Spalte beibehalten.
+    """
+    dtype = spalte.dtype
+    if mindestens is not None:
+        art = 'category' if mindestens == 'category' else numpy.dtype(mindestens).kind
+        if art != ('category' if dtype.kind == 'O' else dtype.kind):
+            if art in 'iuf' and dtype.kind in 'iuf':
+                return numpy.dtype(numpy.float64), relativer_fehler(spalte.to_numpy(), numpy.float64)
+            if art == 'category' or dtype.kind != 'O':
+                return dtype, 0.0
+            mindestens = None
+    if dtype.kind in 'iu':
+        return ganzzahl_typ(spalte.to_numpy(), mindestens or GANZZAHLEN[0]), 0.0
+    if dtype.kind == 'f':
+        return gleitkomma_typ(spalte.to_numpy(), toleranz, mindestens or GLEITKOMMA[0])
+    if kategorien and dtype == object and len(spalte):
+        if mindestens == 'category' or spalte.nunique(dropna=False) <= KATEGORIE_ANTEIL * len(spalte):
+            return 'category', 0.0
+    return dtype, 0.0
+
+
+def profil(df, toleranz=TOLERANZ, kategorien=True):
+    """Zieltyp pro Spalte von *df* als dict für *anpassen()*."""
+    return {name: _spalten_typ(df[name], toleranz, kategorien)[0] for name in df.columns}
+
+
+def _umwandeln(df, typen, toleranz, kategorien, vorgabe):
+    zeilen, spalten = [], {}
+    for name in df.columns:
+        spalte = df[name]
+        mindestens = vorgabe.get(name) if vorgabe is not None else None
+        typ, fehler = _spalten_typ(spalte, toleranz, kategorien, mindestens)
+        neu = spalte.astype(typ) if typ != spalte.dtype else spalte
+        spalten[name] = neu
+        typen[name] = typ
+        zeilen.append(Spaltenprofil(name, str(spalte.dtype), str(neu.dtype),
+                                    int(spalte.memory_usage(index=False, deep=True)),
+                                    int(neu.memory_usage(index=False, deep=True)), fehler))
+    return pd.DataFrame(spalten, index=df.index), pd.DataFrame(zeilen, columns=Spaltenprofil._fields)
+
+
+def anwenden(df, toleranz=TOLERANZ, kategorien=True):
+    """
+    Wandelt jede Spalte von *df* in den kleinsten passenden Typ um.
+
+    Liefert das umgewandelte Dataframe und einen Bericht mit einer Zeile pro
+    Spalte: Typ und Speicherbedarf vorher und nachher sowie der größte
+    relative Fehler gegenüber den Ausgangswerten.
+    """
+    return _umwandeln(df, {}, toleranz, kategorien, None)
+
+
+def anpassen(df, typen, toleranz=TOLERANZ, kategorien=True):
+    """
+    Wendet ein Profil (*profil()* bzw. das Ergebnis eines früheren Laufs) auf
+    neue Daten an. Spalten, deren Werte nicht mehr in den Typ passen, werden
+    erweitert; *typen* wird dabei aktualisiert, damit spätere Tabellen
+    denselben oder einen größeren Typ erhalten. Neue Spalten werden wie in
+    *anwenden()* behandelt.
+    """
+    return _umwandeln(df, typen, toleranz, kategorien, dict(typen))
+
+
+def ersparnis(bericht):
+    """Bytes vorher, nachher und eingespart laut einem Bericht aus *anwenden()*."""
+    vorher, nachher = int(bericht['bytes_vorher'].sum()), int(bericht['bytes_nachher'].sum())
+    return vorher, nachher, vorher - nachher
+
+
+def zusammenfassung(bericht):
+    """Einzeilige Beschreibung der Ersparnis eines Berichts."""
+    vorher, nachher, gespart = ersparnis(bericht)
+    return '%.1f MB -> %.1f MB (%.1f MB bzw. %.0f%% gespart), größter relativer Fehler %.2g' % (
+        vorher / 2 ** 20, nachher / 2 ** 20, gespart / 2 ** 20, 100.0 * gespart / max(vorher, 1),
+        bericht['max_fehler'].max() if len(bericht) else 0.0)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Speicherprofil einer Tabelle wie data.csv aus der Pipeline')
+    parser.add_argument('csv', help='Tabelle, z.B. <ausgabe>/data.csv')
+    parser.add_argument('--toleranz', type=float, default=TOLERANZ, help='größter relativer Fehler für float32')
+    parser.add_argument('--ohne-kategorien', action='store_true', help='Strings nicht als Kategorien ablegen')
+    args = parser.parse_args(argv)
+
+    df = pd.read_csv(args.csv, dtype={'AGS': str, 'Id': str})
+    _, bericht = anwenden(df, args.toleranz, not args.ohne_kategorien)
+    with pd.option_context('display.width', 160, 'display.max_rows', None):
+        print(bericht.to_string(index=False))
+    print(zusammenfassung(bericht))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,222 @@
+"""
+Reproduzierbare synthetische Eingangsdaten im Format der RKI-Daten.
+
+Zum Messen der Pipeline sollen weder die tagesaktuelle CSV-Datei RKI_COVID19
+noch der Layer mit den Landkreisen (In[5]-In[11]) heruntergeladen werden
+müssen. *kreise()* erzeugt Landkreis-Polygone als verzerrtes Gitter, sodass
+benachbarte Kreise gemeinsame Grenzen haben, mit Einwohnerzahlen und
+Bundesländern. *falldaten()* erzeugt dazu Falldaten mit denselben Spalten wie
+die RKI-Daten; die Zeilenzahl lässt sich über *faktor* als Vielfaches des
+Datenstands vom 20.01.2022 (3.627.499 Zeilen) skalieren.
+
+Die Fälle folgen den vier Wellen aus dem Notebook und sind räumlich
+korreliert, damit Hot Spots und Cluster nicht nur Rauschen sind.
+"""
+
+import numpy
+import pandas as pd
+
+from covid_analyse import nachbarschaft
+
+
+# Zeilen des RKI-Datensatzes mit Datenstand 20.01.2022 (In[12])
+ZEILEN_HEUTE = 3627499
+
+BUNDESLAENDER = {
+    1: 'Schleswig-Holstein', 2: 'Hamburg', 3: 'Niedersachsen', 4: 'Bremen', 5: 'Nordrhein-Westfalen',
+    6: 'Hessen', 7: 'Rheinland-Pfalz', 8: 'Baden-Württemberg', 9: 'Bayern', 10: 'Saarland', 11: 'Berlin',
+    12: 'Brandenburg', 13: 'Mecklenburg-Vorpommern', 14: 'Sachsen', 15: 'Sachsen-Anhalt', 16: 'Thüringen',
+}
+
+# Wellenhochpunkte aus dem Notebook mit Breite (Tage) und relativer Höhe
+WELLEN = (('2020-03-16', 12, 0.04), ('2020-12-16', 35, 0.25), ('2021-04-21', 25, 0.2),
+          ('2021-11-24', 20, 0.45), ('2022-01-20', 8, 0.06))
+
+ALTERSGRUPPEN = ('A00-A04', 'A05-A14', 'A15-A34', 'A35-A59', 'A60-A79', 'A80+', 'unbekannt')
+ALTER_ANTEIL = (0.04, 0.11, 0.30, 0.35, 0.13, 0.065, 0.005)
+ALTER_STERBLICH = (0.00005, 0.00002, 0.0002, 0.002, 0.03, 0.15, 0.001)
+GESCHLECHTER = ('M', 'W', 'unbekannt')
+GESCHLECHT_ANTEIL = (0.49, 0.50, 0.01)
+
+# Ausdehnung Deutschlands in Web Mercator (EPSG:3857)
+AUSDEHNUNG = (650000.0, 5980000.0, 1680000.0, 7370000.0)
+
+SPALTEN = ['FID', 'IdBundesland', 'Bundesland', 'Landkreis', 'Altersgruppe', 'Geschlecht', 'AnzahlFall',
+           'AnzahlTodesfall', 'Meldedatum', 'IdLandkreis', 'Datenstand', 'NeuerFall', 'NeuerTodesfall',
+           'Refdatum', 'NeuGenesen', 'AnzahlGenesen', 'IstErkrankungsbeginn', 'Altersgruppe2']
+
+
+def kreise(anzahl=412, seed=0, einwohner=83200000):
+    """
+    Landkreise als Dataframe mit den Spalten des RKI-Landkreislayers.
+
+    Die Polygone sind Zellen eines Gitters, dessen innere Knoten zufällig
+    verschoben werden. Benachbarte Zellen teilen sich so ihre Kanten exakt.
+    Die Bundesländer sind zusammenhängende Blöcke des Gitters.
+    """
+    rng = numpy.random.default_rng(seed)
+    spalten = int(numpy.ceil(numpy.sqrt(anzahl * 0.75)))
+    zeilen = int(numpy.ceil(anzahl / spalten))
+    xmin, ymin, xmax, ymax = AUSDEHNUNG
+    dx, dy = (xmax - xmin) / spalten, (ymax - ymin) / zeilen
+
+    gx, gy = numpy.meshgrid(numpy.linspace(xmin, xmax, spalten + 1), numpy.linspace(ymin, ymax, zeilen + 1))
+    innen = numpy.zeros_like(gx, dtype=bool)
+    innen[1:-1, 1:-1] = True
+    gx[innen] += rng.uniform(-0.3, 0.3, innen.sum()) * dx
+    gy[innen] += rng.uniform(-0.3, 0.3, innen.sum()) * dy
+
+    zeile, spalte = numpy.divmod(numpy.arange(anzahl), spalten)
+    # Bundesländer als 4 x 4 Blöcke des Gitters
+    bl = (zeile * 4 // zeilen) * 4 + spalte * 4 // spalten + 1
+
+    shapes = []
+    for r, c in zip(zeile, spalte):
+        # Außenring im Uhrzeigersinn wie bei Esri-Polygonen
+        ring = [(gx[r, c], gy[r, c]), (gx[r + 1, c], gy[r + 1, c]), (gx[r + 1, c + 1], gy[r + 1, c + 1]),
+                (gx[r, c + 1], gy[r, c + 1]), (gx[r, c], gy[r, c])]
+        shapes.append({'rings': [[[float(x), float(y)] for x, y in ring]], 'spatialReference': {'wkid': 102100}})
+
+    ewz = rng.lognormal(numpy.log(150000), 0.6, anzahl)
+    ewz = numpy.round(ewz / ewz.sum() * einwohner).astype(numpy.int64)
+
+    nummer = pd.Series(bl).groupby(bl).cumcount().to_numpy() + 1
+    ags = numpy.array(['%02d%03d' % (b, k) for b, k in zip(bl, nummer)])
+    df = pd.DataFrame({
+        'OBJECTID': numpy.arange(1, anzahl + 1),
+        'RS': ags,
+        'AGS': ags,
+        'GEN': ['Synthetisch %s' % a for a in ags],
+        'BEZ': 'Landkreis',
+        'BL_ID': bl.astype(str),
+        'BL': [BUNDESLAENDER[b] for b in bl],
+        'EWZ': ewz,
+        'SHAPE': shapes,
+    })
+    df['EWZ_BL'] = df.groupby('BL_ID')['EWZ'].transform('sum')
+    flaechen = []
+    umfaenge = []
+    for shape in shapes:
+        ring = numpy.asarray(shape['rings'][0])
+        flaechen.append(abs((ring[:-1, 0] * ring[1:, 1] - ring[1:, 0] * ring[:-1, 1]).sum()) / 2)
+        umfaenge.append(numpy.hypot(*numpy.diff(ring, axis=0).T).sum())
+    df['Shape__Area'] = flaechen
+    df['Shape__Length'] = umfaenge
+    return df
+
+
+def _raeumliches_muster(gewichte, rng, glaettung=4):
+    """Räumlich korrelierter Faktor pro Landkreis (geglättetes Rauschen)."""
+    w = nachbarschaft.zeilennormiert(gewichte)
+    feld = rng.normal(size=gewichte.shape[0])
+    for _ in range(glaettung):
+        feld = 0.5 * feld + 0.5 * (w @ feld)
+    return numpy.exp(feld / feld.std() * 0.5)
+
+
+class Generator:
+    """
+    Erzeugt Falldaten für die Landkreise aus *kreise()* in Blöcken.
+
+    Die Wahrscheinlichkeit eines Falls ergibt sich pro Welle aus einem
+    Zeitverlauf (Normalverteilung um den Hochpunkt) und einem eigenen
+    räumlichen Muster pro Welle, gewichtet mit der Einwohnerzahl.
+    """
+
+    def __init__(self, kreise_df, seed=0, start='2020-01-28', datenstand='2022-01-20'):
+        self.kreise_df = kreise_df.reset_index(drop=True)
+        self.seed = seed
+        self.start = pd.Timestamp(start)
+        self.datenstand = pd.Timestamp(datenstand)
+        self.tage = (self.datenstand - self.start).days
+
+        rng = numpy.random.default_rng(seed)
+        gewichte = nachbarschaft.queen(self.kreise_df['SHAPE'])
+        ewz = self.kreise_df['EWZ'].to_numpy(dtype=float)
+        self.wellen = []
+        for peak, breite, anteil in WELLEN:
+            muster = ewz * _raeumliches_muster(gewichte, rng)
+            self.wellen.append(((pd.Timestamp(peak) - self.start).days, breite, anteil, muster / muster.sum()))
+        anteile = numpy.array([w[2] for w in self.wellen])
+        self.wellen_anteil = anteile / anteile.sum()
+
+    def block(self, zeilen, nummer=0, erste_fid=1):
+        """Ein Block mit *zeilen* Falldatensätzen; *nummer* bestimmt den Zufallsstrom."""
+        rng = numpy.random.default_rng([self.seed, nummer])
+        welle = rng.choice(len(self.wellen), size=zeilen, p=self.wellen_anteil)
+        tag = numpy.empty(zeilen, dtype=numpy.int64)
+        kreis = numpy.empty(zeilen, dtype=numpy.int64)
+        for w, (peak, breite, _, muster) in enumerate(self.wellen):
+            auswahl = numpy.flatnonzero(welle == w)
+            tag[auswahl] = numpy.round(rng.normal(peak, breite, len(auswahl)))
+            kreis[auswahl] = rng.choice(len(muster), size=len(auswahl), p=muster)
+        tag = numpy.clip(tag, 0, self.tage - 1)
+
+        alter = rng.choice(len(ALTERSGRUPPEN), size=zeilen, p=ALTER_ANTEIL)
+        geschlecht = rng.choice(len(GESCHLECHTER), size=zeilen, p=GESCHLECHT_ANTEIL)
+        faelle = rng.geometric(0.8, size=zeilen)
+        tote = rng.binomial(faelle, numpy.asarray(ALTER_STERBLICH)[alter])
+        genesen = numpy.where(tag < self.tage - 28, faelle - tote, 0)
+
+        # Erkrankungsbeginn bei ca. 60 % der Fälle bekannt, sonst Refdatum = Meldedatum
+        beginn = rng.random(zeilen) < 0.6
+        verzug = numpy.where(beginn, numpy.minimum(rng.geometric(0.3, size=zeilen) - 1, 21), 0)
+
+        reihenfolge = numpy.lexsort((geschlecht, alter, kreis))
+        kreis, tag, alter, geschlecht = (a[reihenfolge] for a in (kreis, tag, alter, geschlecht))
+        faelle, tote, genesen, beginn, verzug = (a[reihenfolge] for a in (faelle, tote, genesen, beginn, verzug))
+
+        ags = self.kreise_df['AGS'].astype(int).to_numpy()[kreis]
+        bl = self.kreise_df['BL_ID'].astype(int).to_numpy()[kreis]
+        meldedatum = (numpy.datetime64(self.start.date(), 'D') + tag).astype('datetime64[ns]')
+        return pd.DataFrame({
+            'FID': numpy.arange(erste_fid, erste_fid + zeilen),
+            'IdBundesland': bl,
+            'Bundesland': self.kreise_df['BL'].to_numpy()[kreis],
+            'Landkreis': self.kreise_df['GEN'].to_numpy()[kreis],
+            'Altersgruppe': numpy.asarray(ALTERSGRUPPEN, dtype=object)[alter],
+            'Geschlecht': numpy.asarray(GESCHLECHTER, dtype=object)[geschlecht],
+            'AnzahlFall': faelle,
+            'AnzahlTodesfall': tote,
+            'Meldedatum': meldedatum,
+            'IdLandkreis': ags,
+            'Datenstand': self.datenstand.strftime('%d.%m.%Y, 00:00 Uhr'),
+            'NeuerFall': 0,
+            'NeuerTodesfall': numpy.where(tote > 0, 0, -9),
+            'Refdatum': meldedatum - verzug.astype('timedelta64[D]'),
+            'NeuGenesen': numpy.where(genesen > 0, 0, -9),
+            'AnzahlGenesen': genesen,
+            'IstErkrankungsbeginn': beginn.astype(numpy.int64),
+            'Altersgruppe2': 'Nicht übermittelt',
+        }, columns=SPALTEN)
+
+    def bloecke(self, faktor=1.0, blockgroesse=1000000):
+        """Erzeugt faktor * ZEILEN_HEUTE Zeilen in Blöcken von höchstens *blockgroesse*."""
+        gesamt = int(round(faktor * ZEILEN_HEUTE))
+        for nummer, start in enumerate(range(0, gesamt, blockgroesse)):
+            yield self.block(min(blockgroesse, gesamt - start), nummer, start + 1)
+
+
+def falldaten(kreise_df, faktor=1.0, seed=0, **kwargs):
+    """Falldaten wie *data_df* nach In[11], mit faktor * 3.627.499 Zeilen."""
+    return pd.concat(Generator(kreise_df, seed, **kwargs).bloecke(faktor), ignore_index=True)
+
+
+def als_csv(kreise_df, pfad, faktor=1.0, seed=0, blockgroesse=1000000, **kwargs):
+    """
+    Schreibt Falldaten blockweise als CSV im Format der RKI-Datei.
+
+    Auch für ein Vielfaches der heutigen Datenmenge wird nie mehr als ein Block
+    im Speicher gehalten. Liefert die Anzahl geschriebener Zeilen.
+    """
+    generator = Generator(kreise_df, seed, **kwargs)
+    # Nur wenige hundert verschiedene Tage: Strings einmal erzeugen und nachschlagen
+    erster = numpy.datetime64(generator.start.date(), 'D') - 30
+    texte = pd.date_range(erster, generator.datenstand).strftime('%Y/%m/%d 00:00:00').to_numpy(dtype=object)
+    zeilen = 0
+    for nummer, block in enumerate(generator.bloecke(faktor, blockgroesse)):
+        for spalte in ('Meldedatum', 'Refdatum'):
+            block[spalte] = texte[(block[spalte].to_numpy().astype('datetime64[D]') - erster).astype(numpy.int64)]
+        block.to_csv(pfad, mode='w' if nummer == 0 else 'a', header=nummer == 0, index=False)
+        zeilen += len(block)
+    return zeilen
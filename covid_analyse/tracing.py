@@ -0,0 +1,274 @@
+"""
+Messung von Stufen und entfernten Aufrufen als Trace.
+
+Jede Stufe (Aggregation, Inzidenzen, Exporte, ...) und jeder entfernte Aufruf
+(ArcGIS-Abfragen, to_table(), Uploads, HTTP-Anfragen) kann als Spanne
+aufgezeichnet werden. Pro Spanne werden Wand- und CPU-Zeit, die höchste
+Speicherbelegung des Prozesses (RSS), Zeilen ein/aus und übertragene Bytes
+festgehalten. Das Ergebnis lässt sich als Chrome-Trace (chrome://tracing,
+ui.perfetto.dev) und als Übersichtstabelle ausgeben.
+
+Ohne laufende Aufzeichnung liefert *spanne()* ein gemeinsames leeres Objekt,
+sodass instrumentierter Code praktisch nichts kostet:
+
+    with tracing.aufzeichnen() as trace:
+        with tracing.spanne('aggregation') as s:
+            cube = aggregieren(data_df, kreise_ewz)
+            s.zeilen(len(data_df), cube.werte.shape[0])
+    trace.chrome_trace('trace.json')
+    print(trace.zusammenfassung())
+
+Entfernte Aufrufe im Notebook lassen sich nachträglich umhüllen, z.B.
+`layer.query = tracing.verfolgt('query', 'fern')(layer.query)`.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+
+_aktiv = None
+
+
+def _rss_funktion():
+    """Liefert eine Funktion für die aktuelle Speicherbelegung in Bytes."""
+    if psutil is not None:
+        prozess = psutil.Process()
+        return lambda: prozess.memory_info().rss
+    if os.path.exists('/proc/self/statm'):
+        seite = os.sysconf('SC_PAGE_SIZE')
+
+        def statm():
+            with open('/proc/self/statm') as f:
+                return int(f.read().split()[1]) * seite
+        return statm
+    # Ohne psutil und /proc bleibt nur der bisherige Höchstwert des Prozesses
+    import resource
+    faktor = 1 if os.uname().sysname == 'Darwin' else 1024
+    return lambda: resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * faktor
+
+
+class _Leer:
+    """Platzhalter ohne Wirkung, solange nichts aufgezeichnet wird."""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def zeilen(self, ein=None, aus=None):
+        pass
+
+    def bytes(self, anzahl):
+        pass
+
+    def setzen(self, **args):
+        pass
+
+
+_LEER = _Leer()
+
+
+class Spanne:
+    """Eine laufende oder abgeschlossene Messung."""
+
+    def __init__(self, aufzeichnung, name, kategorie, args):
+        self._aufzeichnung = aufzeichnung
+        self.name = name
+        self.kategorie = kategorie
+        self.args = args
+        self.ein = None
+        self.aus = None
+        self.anzahl_bytes = 0
+        self.thread = threading.get_ident()
+
+    def __enter__(self):
+        a = self._aufzeichnung
+        self.rss_start = self.rss_max = a.rss()
+        with a._sperre:
+            a._offen.add(self)
+        self.cpu_start = time.thread_time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, typ, wert, tb):
+        self.wand = time.perf_counter() - self.start
+        self.cpu = time.thread_time() - self.cpu_start
+        a = self._aufzeichnung
+        rss = a.rss()
+        with a._sperre:
+            a._offen.discard(self)
+            self.rss_ende = rss
+            self.rss_max = max(self.rss_max, rss)
+            if typ is not None:
+                self.args['fehler'] = typ.__name__
+            a.spannen.append(self)
+        return False
+
+    def zeilen(self, ein=None, aus=None):
+        """Zeilen (bzw. Einträge) vor und nach der Stufe."""
+        if ein is not None:
+            self.ein = int(ein)
+        if aus is not None:
+            self.aus = int(aus)
+
+    def bytes(self, anzahl):
+        """Übertragene oder geschriebene Bytes; mehrfache Aufrufe werden addiert."""
+        self.anzahl_bytes += int(anzahl)
+
+    def setzen(self, **args):
+        """Weitere Angaben, die im Trace unter 'args' erscheinen."""
+        self.args.update(args)
+
+
+class Aufzeichnung:
+    """
+    Gesammelte Spannen einer Aufzeichnung.
+
+    Ein Hintergrund-Thread fragt alle *intervall* Sekunden die
+    Speicherbelegung ab, damit auch Spitzen innerhalb einer Spanne erfasst
+    werden; die Werte erscheinen im Trace zusätzlich als Zähler 'RSS'.
+    """
+
+    def __init__(self, intervall=0.01):
+        self.rss = _rss_funktion()
+        self.intervall = intervall
+        self.spannen = []
+        self.rss_verlauf = []
+        self.pid = os.getpid()
+        self.nullpunkt = time.perf_counter()
+        self._offen = set()
+        self._sperre = threading.Lock()
+        self._stopp = threading.Event()
+        self._thread = None
+
+    def _abtasten(self):
+        while not self._stopp.wait(self.intervall):
+            rss = self.rss()
+            with self._sperre:
+                self.rss_verlauf.append((time.perf_counter(), rss))
+                for s in self._offen:
+                    if rss > s.rss_max:
+                        s.rss_max = rss
+
+    def starten(self):
+        if self.intervall:
+            self._thread = threading.Thread(target=self._abtasten, name='tracing-rss', daemon=True)
+            self._thread.start()
+        return self
+
+    def beenden(self):
+        if self._thread is not None:
+            self._stopp.set()
+            self._thread.join()
+            self._thread = None
+
+    def _us(self, zeitpunkt):
+        return (zeitpunkt - self.nullpunkt) * 1e6
+
+    def ereignisse(self):
+        """Ereignisse im Chrome Trace Event Format."""
+        ereignisse = [{'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'args': {'name': 'covid_analyse'}}]
+        threads = {}
+        for s in sorted(self.spannen, key=lambda s: s.start):
+            tid = threads.setdefault(s.thread, len(threads) + 1)
+            args = dict(s.args, cpu_s=round(s.cpu, 6), rss_max_mb=round(s.rss_max / 2 ** 20, 3),
+                        rss_delta_mb=round((s.rss_ende - s.rss_start) / 2 ** 20, 3))
+            for name, wert in (('zeilen_ein', s.ein), ('zeilen_aus', s.aus), ('bytes', s.anzahl_bytes or None)):
+                if wert is not None:
+                    args[name] = wert
+            ereignisse.append({'name': s.name, 'cat': s.kategorie, 'ph': 'X', 'pid': self.pid, 'tid': tid,
+                               'ts': self._us(s.start), 'dur': s.wand * 1e6, 'args': args})
+        for zeitpunkt, rss in self.rss_verlauf:
+            ereignisse.append({'name': 'RSS', 'ph': 'C', 'pid': self.pid, 'ts': self._us(zeitpunkt),
+                               'args': {'MB': round(rss / 2 ** 20, 3)}})
+        return ereignisse
+
+    def chrome_trace(self, pfad):
+        """Schreibt eine JSON-Datei für chrome://tracing bzw. Perfetto."""
+        with open(pfad, 'w') as f:
+            json.dump({'traceEvents': self.ereignisse(), 'displayTimeUnit': 'ms'}, f)
+
+    def zusammenfassung(self):
+        """
+        Tabelle pro Spanne (Name, Kategorie): Anzahl, Zeiten, höchster RSS,
+        Zeilen und Bytes, absteigend nach Wandzeit.
+        """
+        spalten = ['name', 'kategorie', 'anzahl', 'wand_s', 'cpu_s', 'rss_max_mb', 'ein', 'aus', 'bytes']
+        if not self.spannen:
+            return pd.DataFrame(columns=spalten)
+        df = pd.DataFrame({
+            'name': [s.name for s in self.spannen],
+            'kategorie': [s.kategorie for s in self.spannen],
+            'wand_s': [s.wand for s in self.spannen],
+            'cpu_s': [s.cpu for s in self.spannen],
+            'rss_max_mb': [s.rss_max / 2 ** 20 for s in self.spannen],
+            'ein': pd.array([s.ein for s in self.spannen], dtype='Int64'),
+            'aus': pd.array([s.aus for s in self.spannen], dtype='Int64'),
+            'bytes': [s.anzahl_bytes for s in self.spannen],
+        })
+        tabelle = df.groupby(['name', 'kategorie'], sort=False).agg(
+            anzahl=('wand_s', 'size'), wand_s=('wand_s', 'sum'), cpu_s=('cpu_s', 'sum'),
+            rss_max_mb=('rss_max_mb', 'max'), ein=('ein', 'sum'), aus=('aus', 'sum'), bytes=('bytes', 'sum'))
+        return tabelle.sort_values('wand_s', ascending=False).reset_index()[spalten]
+
+
+def aktiv():
+    """Die laufende Aufzeichnung oder None."""
+    return _aktiv
+
+
+@contextmanager
+def aufzeichnen(pfad=None, intervall=0.01):
+    """
+    Zeichnet alle Spannen innerhalb des Blocks auf.
+
+    Mit *pfad* wird am Ende der Chrome-Trace geschrieben. Verschachtelte
+    Aufrufe verwenden die bereits laufende Aufzeichnung.
+    """
+    global _aktiv
+    if _aktiv is not None:
+        yield _aktiv
+        return
+    aufzeichnung = Aufzeichnung(intervall).starten()
+    _aktiv = aufzeichnung
+    try:
+        yield aufzeichnung
+    finally:
+        _aktiv = None
+        aufzeichnung.beenden()
+        if pfad:
+            aufzeichnung.chrome_trace(pfad)
+
+
+def spanne(name, kategorie='stufe', **args):
+    """Kontextmanager für eine Messung; ohne Aufzeichnung ohne Wirkung."""
+    if _aktiv is None:
+        return _LEER
+    return Spanne(_aktiv, name, kategorie, args)
+
+
+def verfolgt(name=None, kategorie='stufe'):
+    """Dekorator, der jeden Aufruf einer Funktion als Spanne aufzeichnet."""
+    def dekorator(funktion):
+        bezeichnung = name or funktion.__name__
+
+        @functools.wraps(funktion)
+        def huelle(*args, **kwargs):
+            if _aktiv is None:
+                return funktion(*args, **kwargs)
+            with Spanne(_aktiv, bezeichnung, kategorie, {}):
+                return funktion(*args, **kwargs)
+        return huelle
+    return dekorator
@@ -0,0 +1,346 @@
+"""
+Zuordnung von Punkten (Testzentren, Kliniken, Ausbruchsorte) zu Landkreisen.
+
+Das Notebook kennt nur die Landkreis-Polygone aus *kreise_geom* (In[19]); ein
+räumlicher Abgleich mit Einrichtungen, die als Koordinaten vorliegen, fehlt.
+Hier wird jeder Punkt dem Polygon zugeordnet, in dem er liegt, für Millionen
+Punkte auf einmal und ohne Schleife pro Punkt:
+
+1. Ein R-Baum über die Umgebungen der Polygone, gepackt nach
+   Sort-Tile-Recursive (STR), liefert die Kandidaten. Alle Abfragen laufen
+   gemeinsam Ebene für Ebene durch den Baum; pro Ebene ist das ein
+   einziger Vergleich über alle Paare (Abfrage, Knoten). Abgefragt werden
+   beim Anlegen die Zellen eines Rasters über alle Polygone, sodass ein
+   Punkt nur noch seine Zelle nachschlägt und deren wenige Kandidaten an
+   der Umgebung prüft.
+2. Für die Kandidaten entscheidet ein eigener, vektorisierter Strahltest
+   (*Polygonindex.innen()*): ungerade Anzahl geschnittener Kanten aller
+   Ringe heißt innen, womit Löcher und mehrteilige Landkreise ohne
+   Sonderfall richtig sind. Damit nicht jede Kante geprüft werden muss,
+   sind die Kanten jedes Polygons in waagrechte Bänder einsortiert; alle
+   Paare (Punkt, Kandidat) prüfen gemeinsam nur die Kanten ihres Bandes.
+
+    index = verortung.Polygonindex(kreise_df['SHAPE'])
+    kreis = index.zuordnen(x, y)                  # Zeile in kreise_df oder -1
+    verortung.zaehlen(kreise_df, laenge, breite, wgs84=True)
+
+    python -m covid_analyse.verortung testzentren.csv --x lon --y lat --wgs84
+"""
+
+import argparse
+
+import numpy
+import pandas as pd
+
+from covid_analyse.nachbarschaft import ringe
+
+
+# Einträge pro Knoten des R-Baums
+KAPAZITAET = 16
+
+# Punkte, die gemeinsam durch den Baum laufen
+BLOCK = 250000
+
+# Rasterzellen pro Polygon für die Vorauswahl der Kandidaten
+RASTER = 4
+
+# Mittlere Anzahl Kanten pro Band eines Polygons
+KANTEN_PRO_BAND = 4
+
+ERDRADIUS = 6378137.0
+
+
+def web_mercator(laenge, breite):
+    """WGS84-Koordinaten (Grad) in Web Mercator (wkid 102100/EPSG 3857) wie die Landkreis-Geometrien."""
+    laenge = numpy.asarray(laenge, dtype=float)
+    breite = numpy.clip(numpy.asarray(breite, dtype=float), -85.06, 85.06)
+    return (numpy.radians(laenge) * ERDRADIUS,
+            numpy.log(numpy.tan(numpy.pi / 4 + numpy.radians(breite) / 2)) * ERDRADIUS)
+
+
+def _bereiche(anfang, anzahl):
+    """Indizes anfang[i] .. anfang[i] + anzahl[i] - 1 aller i hintereinander."""
+    versatz = numpy.cumsum(anzahl) - anzahl
+    return numpy.repeat(anfang - versatz, anzahl) + numpy.arange(anzahl.sum())
+
+
+def _str_reihenfolge(umgebung, kapazitaet):
+    """Reihenfolge nach Sort-Tile-Recursive: Scheiben nach x-Mitte, darin nach y-Mitte."""
+    n = len(umgebung)
+    scheiben = int(numpy.ceil(numpy.sqrt(numpy.ceil(n / kapazitaet))))
+    nach_x = numpy.argsort(umgebung[:, 0] + umgebung[:, 1], kind='stable')
+    scheibe = numpy.arange(n) // (scheiben * kapazitaet)
+    mitte_y = (umgebung[:, 2] + umgebung[:, 3])[nach_x]
+    return nach_x[numpy.lexsort((mitte_y, scheibe))]
+
+
+class RBaum:
+    """
+    Statischer R-Baum über Rechtecke (n, 4) als minx, maxx, miny, maxy (wie
+    *geopackage.Geometrien.umgebung*), gepackt nach Sort-Tile-Recursive.
+
+    Jede Ebene besteht aus Arrays: Umgebung, erstes Kind und Anzahl der
+    Kinder in der Ebene darunter; die unterste Ebene sind die Einträge.
+    Rechtecke mit NaN werden nie gefunden.
+    """
+
+    def __init__(self, umgebung, kapazitaet=KAPAZITAET):
+        umgebung = numpy.asarray(umgebung, dtype=float).reshape(-1, 4)
+        self.kapazitaet = kapazitaet
+        self.reihenfolge = _str_reihenfolge(umgebung, kapazitaet)
+        self.eintraege = umgebung[self.reihenfolge]
+        # (umgebung, anfang, anzahl) pro Ebene, von den Blättern zur Wurzel
+        self.ebenen = []
+        unten = self.eintraege
+        while True:
+            anfang = numpy.arange(0, max(len(unten), 1), kapazitaet)
+            anzahl = numpy.minimum(kapazitaet, len(unten) - anfang)
+            if len(unten):
+                knoten = numpy.column_stack([numpy.fmin.reduceat(unten[:, 0], anfang),
+                                             numpy.fmax.reduceat(unten[:, 1], anfang),
+                                             numpy.fmin.reduceat(unten[:, 2], anfang),
+                                             numpy.fmax.reduceat(unten[:, 3], anfang)])
+            else:
+                knoten = numpy.full((1, 4), numpy.nan)
+            if len(knoten) > 1:
+                neu = _str_reihenfolge(knoten, kapazitaet)
+                knoten, anfang, anzahl = knoten[neu], anfang[neu], anzahl[neu]
+            self.ebenen.append((knoten, anfang, anzahl))
+            if len(knoten) == 1:
+                break
+            unten = knoten
+        # Umgebungen spaltenweise je Ebene, die Einträge zuletzt
+        self._spalten = [tuple(numpy.ascontiguousarray(k[:, i]) for i in range(4)) for k, _, _ in self.ebenen] + [
+            tuple(numpy.ascontiguousarray(self.eintraege[:, i]) for i in range(4))]
+
+    def __repr__(self):
+        return '<RBaum: %d Einträge, %d Ebenen>' % (len(self.eintraege), len(self.ebenen))
+
+    def suchen(self, abfrage):
+        """
+        Paare (Abfrage, Eintrag) aller Einträge, deren Rechteck das Rechteck
+        der Abfrage (m, 4 wie die Einträge) schneidet. Einträge sind Indizes
+        in die Rechtecke beim Anlegen.
+        """
+        abfrage = numpy.asarray(abfrage, dtype=float).reshape(-1, 4)
+        return self._suchen(*abfrage.T)
+
+    def punkte(self, x, y):
+        """Paare (Punkt, Eintrag) aller Einträge, deren Rechteck den Punkt enthält."""
+        x, y = numpy.asarray(x, dtype=float).ravel(), numpy.asarray(y, dtype=float).ravel()
+        return self._suchen(x, x, y, y)
+
+    def _suchen(self, minx, maxx, miny, maxy):
+        nummer = numpy.arange(len(minx))
+        knoten = numpy.zeros(len(minx), dtype=numpy.intp)
+        wurzel = self.ebenen[-1][0]
+        treffer = _schneiden(wurzel[:, 0].repeat(len(minx)), wurzel[:, 1].repeat(len(minx)),
+                             wurzel[:, 2].repeat(len(minx)), wurzel[:, 3].repeat(len(minx)), minx, maxx, miny, maxy)
+        nummer, knoten = nummer[treffer], knoten[treffer]
+        for e in range(len(self.ebenen) - 1, -1, -1):
+            _, anfang, anzahl = self.ebenen[e]
+            darunter = self._spalten[e - 1] if e else self._spalten[-1]
+            nummer = numpy.repeat(nummer, anzahl[knoten])
+            knoten = _bereiche(anfang[knoten], anzahl[knoten])
+            # Erst nur x prüfen, dann y für die verbliebenen Paare
+            treffer = (darunter[0][knoten] <= maxx[nummer]) & (darunter[1][knoten] >= minx[nummer])
+            nummer, knoten = nummer[treffer], knoten[treffer]
+            treffer = (darunter[2][knoten] <= maxy[nummer]) & (darunter[3][knoten] >= miny[nummer])
+            nummer, knoten = nummer[treffer], knoten[treffer]
+        return nummer, self.reihenfolge[knoten]
+
+
+def _schneiden(a_minx, a_maxx, a_miny, a_maxy, b_minx, b_maxx, b_miny, b_maxy):
+    return (a_minx <= b_maxx) & (a_maxx >= b_minx) & (a_miny <= b_maxy) & (a_maxy >= b_miny)
+
+
+class Polygonindex:
+    """
+    Punkt-in-Polygon-Abfragen für Polygone im Esri-JSON-Format (Spalte 'SHAPE').
+
+    Die Kanten aller Ringe eines Polygons werden in *KANTEN_PRO_BAND* im
+    Mittel waagrechte Bänder gleicher Höhe einsortiert; alle Bänder aller
+    Polygone liegen hintereinander in einem Array (wie eine CSR-Matrix).
+    Waagrechte Kanten kreuzt der Strahl nie, sie entfallen.
+    """
+
+    def __init__(self, shapes, kapazitaet=KAPAZITAET, kanten_pro_band=KANTEN_PRO_BAND, raster=RASTER):
+        shapes = list(shapes)
+        self.anzahl = len(shapes)
+        kanten, polygon = [], []
+        for i, shape in enumerate(shapes):
+            for ring in ringe(shape):
+                if len(ring) < 3:
+                    continue
+                if (ring[0] != ring[-1]).any():
+                    ring = numpy.vstack([ring, ring[:1]])
+                k = numpy.column_stack([ring[:-1], ring[1:]])
+                kanten.append(k[k[:, 1] != k[:, 3]])
+                polygon.append(numpy.full(len(kanten[-1]), i))
+        kanten = numpy.concatenate(kanten) if kanten else numpy.empty((0, 4))
+        polygon = numpy.concatenate(polygon) if polygon else numpy.empty(0, dtype=numpy.intp)
+
+        # Umgebung jedes Polygons aus seinen Kanten
+        umgebung = numpy.full((self.anzahl, 4), numpy.nan)
+        if len(kanten):
+            x, y = kanten[:, [0, 2]], kanten[:, [1, 3]]
+            for spalte, werte, funktion in ((0, x.min(axis=1), numpy.fmin), (1, x.max(axis=1), numpy.fmax),
+                                            (2, y.min(axis=1), numpy.fmin), (3, y.max(axis=1), numpy.fmax)):
+                start = numpy.full(self.anzahl, numpy.nan)
+                funktion.at(start, polygon, werte)
+                umgebung[:, spalte] = start
+        self.umgebung = umgebung
+        self.baum = RBaum(umgebung, kapazitaet)
+        self._raster_anlegen(raster)
+
+        # Bänder: Anzahl, Höhe und erste Bandnummer pro Polygon
+        pro_polygon = numpy.bincount(polygon, minlength=self.anzahl)
+        self.baender = numpy.maximum(numpy.ceil(pro_polygon / kanten_pro_band), 1).astype(numpy.intp)
+        self.unten = numpy.nan_to_num(umgebung[:, 2])
+        hoehe = numpy.nan_to_num(umgebung[:, 3]) - self.unten
+        self.hoehe = numpy.where(hoehe > 0, hoehe, 1.0) / self.baender
+        self.erstes_band = numpy.cumsum(self.baender) - self.baender
+
+        von = self._band(polygon, numpy.minimum(kanten[:, 1], kanten[:, 3]))
+        bis = self._band(polygon, numpy.maximum(kanten[:, 1], kanten[:, 3]))
+        kante = numpy.repeat(numpy.arange(len(kanten)), bis - von + 1)
+        band = _bereiche(von, bis - von + 1)
+        reihenfolge = numpy.argsort(band, kind='stable')
+        self.kanten = kanten[kante[reihenfolge]]
+        self.bandanfang = numpy.concatenate(
+            [[0], numpy.cumsum(numpy.bincount(band, minlength=int(self.baender.sum())))])
+
+    def __repr__(self):
+        return '<Polygonindex: %d Polygone, %d Kanten in %d Bändern>' % (
+            self.anzahl, len(self.kanten), len(self.bandanfang) - 1)
+
+    def _raster_anlegen(self, zellen_pro_polygon):
+        """Kandidaten pro Rasterzelle aus einer Abfrage des R-Baums für jede Zelle (wie eine CSR-Matrix)."""
+        gueltig = numpy.isfinite(self.umgebung).all(axis=1)
+        if gueltig.any():
+            minx, maxx = self.umgebung[gueltig, 0].min(), self.umgebung[gueltig, 1].max()
+            miny, maxy = self.umgebung[gueltig, 2].min(), self.umgebung[gueltig, 3].max()
+        else:
+            minx = maxx = miny = maxy = 0.0
+        breite, hoehe = max(maxx - minx, 1e-9), max(maxy - miny, 1e-9)
+        zellen = max(zellen_pro_polygon * gueltig.sum(), 1)
+        nx = max(int(round(numpy.sqrt(zellen * breite / hoehe))), 1)
+        ny = max(int(numpy.ceil(zellen / nx)), 1)
+
+        ix, iy = numpy.arange(nx * ny) % nx, numpy.arange(nx * ny) // nx
+        zx, zy = breite / nx, hoehe / ny
+        self._raster = (minx, maxx, miny, maxy, zx, zy, nx, ny)
+        zelle, polygon = self.baum.suchen(numpy.column_stack([
+            minx + ix * zx, minx + (ix + 1) * zx, miny + iy * zy, miny + (iy + 1) * zy]))
+        self._zellanfang = numpy.concatenate([[0], numpy.cumsum(numpy.bincount(zelle, minlength=nx * ny))])
+        self._kandidaten = polygon[numpy.argsort(zelle, kind='stable')]
+
+    def kandidaten(self, x, y):
+        """Paare (Punkt, Polygon) aller Polygone, deren Umgebung den Punkt enthält."""
+        minx, maxx, miny, maxy, breite, hoehe, nx, ny = self._raster
+        punkt = numpy.flatnonzero((x >= minx) & (x <= maxx) & (y >= miny) & (y <= maxy))
+        ix = numpy.minimum(((x[punkt] - minx) // breite).astype(numpy.intp), nx - 1)
+        iy = numpy.minimum(((y[punkt] - miny) // hoehe).astype(numpy.intp), ny - 1)
+        zelle = iy * nx + ix
+        anfang, anzahl = self._zellanfang[zelle], self._zellanfang[zelle + 1] - self._zellanfang[zelle]
+        punkt = numpy.repeat(punkt, anzahl)
+        polygon = self._kandidaten[_bereiche(anfang, anzahl)]
+        u = self.umgebung[polygon]
+        px, py = x[punkt], y[punkt]
+        treffer = (u[:, 0] <= px) & (px <= u[:, 1]) & (u[:, 2] <= py) & (py <= u[:, 3])
+        return punkt[treffer], polygon[treffer]
+
+    def _band(self, polygon, y):
+        """Globale Bandnummer der Höhe *y* im jeweiligen Polygon."""
+        innen = numpy.floor((y - self.unten[polygon]) / self.hoehe[polygon])
+        return self.erstes_band[polygon] + numpy.clip(innen, 0, self.baender[polygon] - 1).astype(numpy.intp)
+
+    def innen(self, x, y, polygon):
+        """Ob jeder Punkt (x[i], y[i]) im Polygon polygon[i] liegt."""
+        band = self._band(polygon, y)
+        anfang, anzahl = self.bandanfang[band], self.bandanfang[band + 1] - self.bandanfang[band]
+        paar = numpy.repeat(numpy.arange(len(band)), anzahl)
+        x1, y1, x2, y2 = self.kanten[_bereiche(anfang, anzahl)].T
+        px, py = x[paar], y[paar]
+        kreuzt = (y1 > py) != (y2 > py)
+        with numpy.errstate(divide='ignore', invalid='ignore'):
+            kreuzt &= px < x1 + (py - y1) * (x2 - x1) / (y2 - y1)
+        return numpy.bincount(paar, weights=kreuzt, minlength=len(band)) % 2 == 1
+
+    def zuordnen(self, x, y, block=BLOCK):
+        """
+        Index des Polygons, in dem jeder Punkt liegt, sonst -1. Liegt ein
+        Punkt in mehreren Polygonen (z.B. auf einer gemeinsamen Grenze), gilt
+        das erste.
+        """
+        x, y = numpy.asarray(x, dtype=float).ravel(), numpy.asarray(y, dtype=float).ravel()
+        ergebnis = numpy.full(len(x), -1, dtype=numpy.intp)
+        for start in range(0, len(x), block):
+            bx, by = x[start:start + block], y[start:start + block]
+            punkt, polygon = self.kandidaten(bx, by)
+            treffer = self.innen(bx[punkt], by[punkt], polygon)
+            punkt, polygon = punkt[treffer], polygon[treffer]
+            # Absteigend nach Polygon zuweisen, damit bei mehreren Treffern das erste bleibt
+            reihenfolge = numpy.argsort(-polygon, kind='stable')
+            ergebnis[start + punkt[reihenfolge]] = polygon[reihenfolge]
+        return ergebnis
+
+
+def zuordnen(kreise_df, x, y, wgs84=False, index=None):
+    """
+    AGS des Landkreises für jeden Punkt (None außerhalb aller Landkreise).
+
+    Mit *wgs84* sind x, y Länge und Breite in Grad und werden in Web Mercator
+    umgerechnet, das Koordinatensystem der Landkreise aus dem Hub. *index*
+    erlaubt, einen vorhandenen Polygonindex wiederzuverwenden.
+    """
+    if wgs84:
+        x, y = web_mercator(x, y)
+    kreis = (index or Polygonindex(kreise_df['SHAPE'])).zuordnen(x, y)
+    ags = numpy.append(kreise_df['AGS'].to_numpy(dtype=object), None)
+    return ags[kreis]
+
+
+def zaehlen(kreise_df, x, y, gewichte=None, wgs84=False, index=None):
+    """
+    Anzahl (bzw. Summe der *gewichte*, z.B. Betten) der Punkte pro Landkreis
+    als Series nach AGS in der Reihenfolge von *kreise_df*, etwa als
+    zusätzliche Variable neben 'EWZ'.
+    """
+    if wgs84:
+        x, y = web_mercator(x, y)
+    kreis = (index or Polygonindex(kreise_df['SHAPE'])).zuordnen(x, y)
+    innen = kreis >= 0
+    gewichte = None if gewichte is None else numpy.asarray(gewichte, dtype=float)[innen]
+    summe = numpy.bincount(kreis[innen], weights=gewichte, minlength=len(kreise_df))
+    return pd.Series(summe, index=kreise_df['AGS'].to_numpy(), name='anzahl' if gewichte is None else 'summe')
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Punkte aus einer CSV-Datei den Landkreisen zuordnen')
+    parser.add_argument('csv', help='Punkte mit Koordinatenspalten')
+    parser.add_argument('--x', default='x', help='Spalte mit x bzw. Länge')
+    parser.add_argument('--y', default='y', help='Spalte mit y bzw. Breite')
+    parser.add_argument('--wgs84', action='store_true', help='Koordinaten in Grad (WGS84) statt Web Mercator')
+    parser.add_argument('--kreise', help='Landkreise als CSV mit AGS und SHAPE (Esri-JSON), sonst synthetisch')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--ausgabe', help='Punkte mit Spalte AGS als CSV (Standard: nur Anzahl pro Landkreis)')
+    args = parser.parse_args(argv)
+
+    from covid_analyse import pipeline
+    cfg = {'seed': args.seed}
+    if args.kreise:
+        cfg['kreise'] = args.kreise
+    kreise_df = pipeline.kreise(cfg)
+    punkte = pd.read_csv(args.csv)
+    punkte['AGS'] = zuordnen(kreise_df, punkte[args.x], punkte[args.y], args.wgs84)
+    if args.ausgabe:
+        punkte.to_csv(args.ausgabe, index=False)
+    anzahl = punkte['AGS'].value_counts()
+    print('%d Punkte, %d in %d Landkreisen, %d außerhalb' % (
+        len(punkte), anzahl.sum(), len(anzahl), punkte['AGS'].isna().sum()))
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,209 @@
+"""
+Zeiträume und Hochpunkte der Pandemiewellen.
+
+Die Werte in WELLEN_NOTEBOOK stammen aus den Markdown-Zellen des Notebooks
+(Kartendarstellung, Hot-Spot-Analyse und Space-Time Cubes). *intervall* ist
+die Länge der Zeitschritte in Tagen, mit der die Space-Time Cubes der Welle
+erstellt werden (In[83]: '3 Days', In[86]-In[91]: '1 Weeks').
+
+*Wellenerkennung* bestimmt Beginn, Hochpunkt und Ende neuer Wellen aus den
+Tageswerten selbst, Tag für Tag und für beliebig viele Reihen (Deutschland,
+Bundesländer oder Landkreise) zugleich. Geglättet wird wie in In[28] mit
+einem Ringpuffer über die letzten 7 Tage; ein zweiter Ringpuffer hält die
+7-Tage-Summen der Vorwoche. Jeder neue Tag kostet so unabhängig von der
+Länge der Reihe einen festen Aufwand pro Reihe:
+
+- Beginn: Die 7-Tage-Summe liegt *tage* Tage in Folge um mindestens den
+  Faktor *anstieg* über der Vorwoche, über *mindestwert* und über
+  *mindestanteil* des bisher höchsten Werts der Reihe; die Welle beginnt am
+  ersten dieser Tage.
+- Hochpunkt: höchste 7-Tage-Summe; bestätigt, sobald die Summe *tage* Tage
+  in Folge um *rueckgang* darunter liegt.
+- Ende: Die Summe fällt auf *ende_anteil* des Hochpunkts, oder vorher
+  beginnt ein neuer Anstieg; dann endet die Welle im Tiefpunkt dazwischen
+  und die nächste beginnt dort.
+"""
+
+from collections import namedtuple
+
+import numpy
+import pandas as pd
+
+from covid_analyse import zeitbins
+
+
+Welle = namedtuple('Welle', ['name', 'start', 'peak', 'ende', 'intervall'])
+
+WELLEN_NOTEBOOK = (
+    Welle('1W', pd.Timestamp('2020-03-02'), pd.Timestamp('2020-03-16'), pd.Timestamp('2020-04-19'), 3),
+    Welle('2W', pd.Timestamp('2020-10-05'), pd.Timestamp('2020-12-16'), pd.Timestamp('2021-01-31'), 7),
+    Welle('3W', pd.Timestamp('2021-03-01'), pd.Timestamp('2021-04-21'), pd.Timestamp('2021-05-16'), 7),
+    Welle('4W', pd.Timestamp('2021-10-04'), pd.Timestamp('2021-11-24'), pd.Timestamp('2022-01-02'), 7),
+)
+
+
+def zeitbins_mittel(werte, breite):
+    """
+    Mittel über Zeitschritte der Länge *breite* (Landkreise, Tage) -> (Landkreise, Schritte).
+
+    Wie 'END_TIME' in CreateSpaceTimeCubeDefinedLocations am Ende ausgerichtet;
+    ein unvollständiger Schritt am Anfang entfällt. Andere Ausrichtungen und
+    wiederholte Abfragen siehe *zeitbins*.
+    """
+    return zeitbins.mittel(werte, breite)
+
+
+def peak_tag(welle, dates):
+    """Position des Hochpunkts von *welle* in der Tagesliste *dates*; Fehler, wenn er außerhalb der Daten liegt."""
+    tag = (welle.peak - dates[0]).days
+    if not 0 <= tag < len(dates):
+        raise ValueError('Hochpunkt %s der Welle %s liegt außerhalb der Daten (%s bis %s)' % (
+            welle.peak.date(), welle.name, dates[0].date(), dates[-1].date()))
+    return tag
+
+
+# Phasen der Wellenerkennung
+RUHE, ANSTIEG, ABKLINGEN = 0, 1, 2
+
+
+def intervall(start, ende):
+    """Zeitschritt des Space-Time Cubes: 3 Tage für Wellen unter 8 Wochen (wie 1W), sonst eine Woche."""
+    return 3 if (pd.Timestamp(ende) - pd.Timestamp(start)).days < 56 else 7
+
+
+class Wellenerkennung:
+    """
+    Wellen in den Tageswerten von *anzahl* Reihen ab dem Tag *erster*.
+
+    Die Schwellen beziehen sich auf 7-Tage-Summen der übergebenen Werte,
+    *mindestwert* also z.B. auf die 7-Tage-Inzidenz, wenn Tagesinzidenzen
+    übergeben werden. *wellen* enthält pro Reihe die abgeschlossenen Wellen
+    als Welle-Tupel, nummeriert als '1W', '2W', ...
+    """
+
+    def __init__(self, erster, anzahl=1, anstieg=1.15, tage=5, mindestwert=1.0, mindestanteil=0.1, rueckgang=0.2,
+                 ende_anteil=0.5, fenster=7, abstand=7):
+        self.erster = pd.Timestamp(erster)
+        self.anstieg, self.tage = anstieg, tage
+        self.mindestwert, self.mindestanteil = mindestwert, mindestanteil
+        self.rueckgang, self.ende_anteil = rueckgang, ende_anteil
+        self.tag = 0
+        self.wellen = [[] for _ in range(anzahl)]
+        # Ringpuffer der Tageswerte und der Fenstersummen
+        self._werte = numpy.zeros((fenster, anzahl))
+        self._summen = numpy.zeros((abstand, anzahl))
+        self.summe = numpy.zeros(anzahl)
+        self.maximum = numpy.zeros(anzahl)
+        self.phase = numpy.full(anzahl, RUHE, dtype=numpy.int8)
+        self._serie = numpy.zeros(anzahl, dtype=numpy.int64)
+        self._serie_start = numpy.zeros(anzahl, dtype=numpy.int64)
+        self._unter = numpy.zeros(anzahl, dtype=numpy.int64)
+        self._start = numpy.zeros(anzahl, dtype=numpy.int64)
+        self._peak = numpy.zeros(anzahl, dtype=numpy.int64)
+        self._peak_wert = numpy.zeros(anzahl)
+        self._tief = numpy.zeros(anzahl, dtype=numpy.int64)
+        self._tief_wert = numpy.zeros(anzahl)
+
+    def __repr__(self):
+        return '<Wellenerkennung: %d Reihen, %d Tage ab %s, %d Wellen>' % (
+            len(self.summe), self.tag, self.erster.date(), sum(len(w) for w in self.wellen))
+
+    def _datum(self, tag):
+        return self.erster + pd.Timedelta(days=int(tag))
+
+    def _welle(self, reihe, start, peak, ende):
+        start, ende = self._datum(start), self._datum(ende)
+        return Welle('%dW' % (len(self.wellen[reihe]) + 1), start, self._datum(peak), ende, intervall(start, ende))
+
+    def aktualisieren(self, werte):
+        """
+        Nimmt die Werte des nächsten Tages (ein Wert pro Reihe) auf.
+
+        Liefert eine Liste (Reihe, Welle) der an diesem Tag abgeschlossenen Wellen.
+        """
+        werte = numpy.nan_to_num(numpy.asarray(werte, dtype=float).reshape(-1))
+        tag = self.tag
+        platz = tag % len(self._werte)
+        self.summe += werte - self._werte[platz]
+        self._werte[platz] = werte
+        platz = tag % len(self._summen)
+        vorher = self._summen[platz].copy()
+        self._summen[platz] = self.summe
+        numpy.maximum(self.maximum, self.summe, out=self.maximum)
+        self.tag += 1
+
+        bereit = tag >= len(self._werte) + len(self._summen) - 1
+        steigt = bereit & (self.summe >= self.anstieg * vorher) & (self.summe > 0) & \
+            (self.summe >= numpy.maximum(self.mindestwert, self.mindestanteil * self.maximum))
+        self._serie = numpy.where(steigt, self._serie + 1, 0)
+        self._serie_start[self._serie == 1] = tag
+        neu = self._serie >= self.tage
+        summe = self.summe
+
+        # Abklingen: neuer Höchststand, Tiefpunkt, Ende oder neuer Anstieg
+        abklingen = self.phase == ABKLINGEN
+        hoeher = abklingen & (summe > self._peak_wert)
+        self.phase[hoeher] = ANSTIEG
+        tiefer = abklingen & ~hoeher & (summe < self._tief_wert)
+        self._tief[tiefer] = tag
+        self._tief_wert[tiefer] = summe[tiefer]
+        ende = abklingen & ~hoeher & (summe <= self.ende_anteil * self._peak_wert)
+        wieder = abklingen & ~hoeher & ~ende & neu
+        fertig = []
+        for r in numpy.flatnonzero(ende | wieder):
+            welle = self._welle(r, self._start[r], self._peak[r], tag if ende[r] else self._tief[r])
+            self.wellen[r].append(welle)
+            fertig.append((int(r), welle))
+        self.phase[ende] = RUHE
+        self._serie[ende] = 0
+
+        # Beginn einer Welle; nach einem Tiefpunkt beginnt sie dort
+        beginn = ((self.phase == RUHE) & neu) | wieder
+        self._start[beginn] = numpy.where(wieder, self._tief, self._serie_start)[beginn]
+        self.phase[beginn] = ANSTIEG
+        self._peak_wert[beginn] = 0.0
+
+        # Anstieg: Hochpunkt verfolgen, bestätigen sobald die Summe anhaltend deutlich darunter liegt
+        anstieg = self.phase == ANSTIEG
+        hoch = anstieg & (summe > self._peak_wert)
+        self._peak[hoch] = tag
+        self._peak_wert[hoch] = summe[hoch]
+        unter = anstieg & (summe <= (1 - self.rueckgang) * self._peak_wert)
+        self._unter = numpy.where(unter, self._unter + 1, 0)
+        self._tief[unter & (self._unter == 1)] = tag
+        self._tief_wert[unter & (self._unter == 1)] = summe[unter & (self._unter == 1)]
+        tiefer = unter & (summe < self._tief_wert)
+        self._tief[tiefer] = tag
+        self._tief_wert[tiefer] = summe[tiefer]
+        bestaetigt = self._unter >= self.tage
+        self.phase[bestaetigt] = ABKLINGEN
+        self._unter[bestaetigt] = 0
+        return fertig
+
+    def offene(self):
+        """Laufende Wellen als Liste (Reihe, Welle) mit dem letzten Tag als Ende."""
+        return [(int(r), self._welle(r, self._start[r], self._peak[r], self.tag - 1))
+                for r in numpy.flatnonzero(self.phase != RUHE)]
+
+    def alle(self, offen=True):
+        """Abgeschlossene und mit *offen* auch laufende Wellen pro Reihe."""
+        ergebnis = [list(w) for w in self.wellen]
+        for r, welle in self.offene() if offen else ():
+            ergebnis[r].append(welle)
+        return ergebnis
+
+
+def erkennen(werte, dates, offen=True, **parameter):
+    """
+    Wellen in *werte* (Reihen, Tage) bzw. einer einzelnen Reihe, Tag für Tag
+    mit *Wellenerkennung*. Liefert eine Liste von Wellen pro Reihe bzw. für
+    eine einzelne Reihe eine Liste von Wellen.
+    """
+    werte = numpy.asarray(werte, dtype=float)
+    eindim = werte.ndim == 1
+    werte = werte.reshape(-1, werte.shape[-1])
+    erkennung = Wellenerkennung(pd.DatetimeIndex(dates)[0], len(werte), **parameter)
+    for tag in range(werte.shape[1]):
+        erkennung.aktualisieren(werte[:, tag])
+    ergebnis = erkennung.alle(offen)
+    return ergebnis[0] if eindim else ergebnis
@@ -0,0 +1,140 @@
+"""
+Zeitschritte beliebiger Länge aus einer kumulierten Summe über die Tage.
+
+Die Space-Time Cubes des Notebooks verwenden Zeitschritte von '1 Days',
+'3 Days' und '1 Weeks' (In[80], In[83], In[86]); jede Wahl bedeutet einen
+neuen Export und eine neue Aggregation. Hier wird die kumulierte Summe über
+die Tagesachse einmal gebildet. Summe und Mittel eines Zeitschritts sind
+dann die Differenz zweier Einträge, für jede Länge und jede Ausrichtung:
+
+- 'END_TIME': der letzte Schritt endet am letzten Tag, ein unvollständiger
+  Schritt am Anfang entfällt (wie *wellen.zeitbins_mittel()*)
+- 'START_TIME': der erste Schritt beginnt am ersten Tag, ein unvollständiger
+  Schritt am Ende entfällt
+
+*Zeitpyramide* hält die kumulierte Summe eines Arrays und speichert die
+Zeitschritte der üblichen Längen (STUFEN) über den ganzen Zeitraum bei der
+ersten Abfrage; alle anderen Längen und Zeiträume werden bei jeder Abfrage
+aus der Summe gelesen. *pyramide()* erzeugt die üblichen Längen auf einmal.
+*Cube.zeitschritte()* verwendet eine Zeitpyramide pro Zeitachse.
+"""
+
+from collections import OrderedDict, namedtuple
+
+import numpy
+import pandas as pd
+
+from covid_analyse.fenster import kumuliert
+
+
+AUSRICHTUNGEN = ('END_TIME', 'START_TIME')
+
+# Übliche Längen in Tagen: Tag, 3 Tage, Woche, 2 und 4 Wochen
+STUFEN = (1, 3, 7, 14, 28)
+
+# start, ende: erster und letzter Tag jedes Schritts; werte: (Einheiten, Schritte, ...)
+Zeitschritte = namedtuple('Zeitschritte', ['start', 'ende', 'werte'])
+
+
+def grenzen(tage, breite, ausrichtung='END_TIME', von=0, bis=None):
+    """
+    Tagesindizes (Anfang, Ende ausschließlich) der Schritte der Länge *breite*
+    zwischen den Indizes *von* und *bis* (ausschließlich, Standard: *tage*).
+    """
+    if breite < 1:
+        raise ValueError('Zeitschritte müssen mindestens einen Tag lang sein, nicht %r' % breite)
+    if ausrichtung not in AUSRICHTUNGEN:
+        raise ValueError('Unbekannte Ausrichtung %r (verfügbar: %s)' % (ausrichtung, ', '.join(AUSRICHTUNGEN)))
+    bis = tage if bis is None else bis
+    anzahl = max(bis - von, 0) // breite
+    if ausrichtung == 'END_TIME':
+        anfang = bis - breite * numpy.arange(anzahl, 0, -1)
+    else:
+        anfang = von + breite * numpy.arange(anzahl)
+    return anfang, anfang + breite
+
+
+def aus_kumuliert(summe, anfang, ende, achse=1):
+    """Summe jedes Schritts aus einer kumulierten Summe wie von *fenster.kumuliert()*."""
+    return numpy.take(summe, ende, axis=achse) - numpy.take(summe, anfang, axis=achse)
+
+
+def summen(werte, breite, ausrichtung='END_TIME', achse=1):
+    """Summe über Schritte der Länge *breite* entlang *achse*."""
+    anfang, ende = grenzen(numpy.shape(werte)[achse], breite, ausrichtung)
+    return aus_kumuliert(kumuliert(werte, achse), anfang, ende, achse)
+
+
+def mittel(werte, breite, ausrichtung='END_TIME', achse=1):
+    """Mittel über Schritte der Länge *breite* entlang *achse*."""
+    return summen(werte, breite, ausrichtung, achse) / breite
+
+
+class Zeitpyramide:
+    """
+    Zeitschritte beliebiger Länge eines Arrays (Einheiten, Tage, ...).
+
+    Die kumulierte Summe wird beim Anlegen gebildet (Ganzzahlen exakt als
+    int64); jede Abfrage liest pro Schritt zwei Einträge. Nur Abfragen über
+    den ganzen Zeitraum mit einer Länge aus *stufen* werden
+    zwischengespeichert, sodass der Speicher nicht mit jeder ausprobierten
+    Länge oder jedem Zeitraum wächst.
+    """
+
+    def __init__(self, werte, dates, stufen=STUFEN):
+        self.dates = pd.DatetimeIndex(dates)
+        if numpy.shape(werte)[1] != len(self.dates):
+            raise ValueError('%d Tage in werte, aber %d in dates' % (numpy.shape(werte)[1], len(self.dates)))
+        self.summe = kumuliert(werte, achse=1)
+        self.stufen = frozenset(stufen)
+        self._schritte = {}
+
+    def __repr__(self):
+        return '<Zeitpyramide: %d Tage, %d Zeitschritte zwischengespeichert>' % (len(self.dates), len(self._schritte))
+
+    def _bereich(self, von, bis):
+        """Tagesindizes (Anfang, Ende ausschließlich) für *von* bis einschließlich *bis*."""
+        if von is None:
+            anfang = 0
+        elif isinstance(von, (int, numpy.integer)):
+            anfang = int(von)
+        else:
+            anfang = int(self.dates.searchsorted(pd.Timestamp(von)))
+        if bis is None:
+            ende = len(self.dates)
+        elif isinstance(bis, (int, numpy.integer)):
+            ende = int(bis) + 1
+        else:
+            ende = int(self.dates.searchsorted(pd.Timestamp(bis), side='right'))
+        return max(anfang, 0), min(ende, len(self.dates))
+
+    def schritte(self, breite, art='summe', ausrichtung='END_TIME', von=None, bis=None):
+        """
+        Zeitschritte der Länge *breite* in Tagen als Zeitschritte(start, ende, werte).
+
+        *art* ist 'summe' oder 'mittel'. *von* und *bis* (Tage einschließlich,
+        als Datum oder Index) begrenzen den Zeitraum, z.B. auf eine Welle.
+        """
+        if art not in ('summe', 'mittel'):
+            raise ValueError('Unbekannte Art %r (summe oder mittel)' % art)
+        schluessel = (breite, art, ausrichtung) + self._bereich(von, bis)
+        if schluessel in self._schritte:
+            return self._schritte[schluessel]
+        anfang, ende = grenzen(len(self.dates), breite, ausrichtung, *schluessel[3:])
+        werte = aus_kumuliert(self.summe, anfang, ende)
+        if art == 'mittel':
+            werte = werte / breite
+        ergebnis = Zeitschritte(self.dates[anfang], self.dates[ende - 1], werte)
+        if breite in self.stufen and schluessel[3:] == (0, len(self.dates)):
+            self._schritte[schluessel] = ergebnis
+        return ergebnis
+
+    def pyramide(self, breiten=STUFEN, art='summe', ausrichtung='END_TIME'):
+        """Zeitschritte aller *breiten* über den ganzen Zeitraum als geordnetes Dict Länge -> Zeitschritte."""
+        return OrderedDict((b, self.schritte(b, art, ausrichtung)) for b in breiten)
+
+    def fenster(self, laenge):
+        """Gleitende Summe über *laenge* Tage wie *fenster.gleitende_summe()*, aus derselben Summe."""
+        tage = len(self.dates)
+        ende = numpy.arange(1, tage + 1)
+        return aus_kumuliert(self.summe, numpy.clip(ende - laenge, 0, tage), ende)